@@ -1,14 +1,69 @@
 from fastapi import FastAPI, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
-from typing import Any, Dict
+from tools.knowledge.store import knowledge_store
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import ast
+import asyncio
+import hashlib
+import httpx
+import json
 import os
 import importlib
+import importlib.util
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+load_dotenv()
+
+MODEL_NAME = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# per-worker upstream limits, all completions share one pooled set of connections
+MAX_CONCURRENT_COMPLETIONS = int(os.getenv("MAX_CONCURRENT_COMPLETIONS", "32"))
+MAX_UPSTREAM_CONNECTIONS = int(os.getenv("MAX_UPSTREAM_CONNECTIONS", "64"))
+
+# items of a single batch request that may be running at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# response cache, the sqlite tier is only enabled when a database path is configured
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+
+client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_UPSTREAM_CONNECTIONS,
+            max_keepalive_connections=MAX_UPSTREAM_CONNECTIONS,
+        )
+    )
+)
+
+# created inside the running event loop, see lifespan
+completion_slots: Optional[asyncio.Semaphore] = None
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global completion_slots
+    completion_slots = asyncio.Semaphore(MAX_CONCURRENT_COMPLETIONS)
+    knowledge_watcher = asyncio.create_task(knowledge_store.watch())
+    yield
+    knowledge_watcher.cancel()
+    await client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,9 +73,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-load_dotenv()
 
-client = OpenAI()
+def tool_sources(module_name: str) -> List[str]:
+    """
+    Files of a tool module and of every tools.* module it imports, directly or through the others.
+    """
+    sources = {}
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        module = sys.modules.get(name)
+        if name in sources or getattr(module, "__file__", None) is None:
+            continue
+        sources[name] = module.__file__
+        with open(module.__file__, "rb") as source_file:
+            tree = ast.parse(source_file.read())
+        package = module.__package__ or ""
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imported = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module
+                if node.level:
+                    base = importlib.util.resolve_name("." * node.level + (node.module or ""), package)
+                # "from . import x" and "from .engines import x" can name modules as well as attributes
+                imported = [base] + [f"{base}.{alias.name}" for alias in node.names]
+            else:
+                continue
+            pending.extend(imported_name for imported_name in imported if imported_name.split(".")[0] == tools_dir)
+    return [sources[name] for name in sorted(sources)]
 
 
 # dynamically loading of tools configurations
@@ -32,6 +113,221 @@ for file_name in os.listdir(tools_dir):
         module = importlib.import_module(module_name)
         tool_mapping.update(module.tool_config)
 
+        # version of the prompt and of the engines and indexes it is computed with, and the knowledge files
+        # the prompt embeds, see tool_version
+        with open(module.__file__, "rb") as source_file:
+            source = source_file.read()
+        knowledge_files = sorted(set(re.findall(r"[\"']([\w.-]+\.json)[\"']", source.decode())))
+        version = hashlib.sha256()
+        for path in tool_sources(module_name):
+            with open(path, "rb") as source_file:
+                version.update(source_file.read())
+        for config in module.tool_config.values():
+            config["version"] = version.hexdigest()
+            config["knowledge_files"] = knowledge_files
+
+
+class ResponseCache:
+    """
+    Two-tier cache for parsed tool responses.
+    An in-process LRU with TTL answers repeated requests without leaving the worker,
+    and an optional sqlite file lets every worker on the host share results.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.db = None
+        self.db_lock = threading.Lock()
+
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    def get_local(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def put_local(self, key: str, value, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def read_db(self, key: str):
+        with self.db_lock:
+            row = self.db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def write_db(self, key: str, value: str):
+        with self.db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+            self.db.commit()
+
+    async def get(self, key: str, response_format):
+        value = self.get_local(key)
+        if value is not None or self.db is None:
+            return value
+
+        try:
+            row = await asyncio.to_thread(self.read_db, key)
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+
+        value = response_format.model_validate_json(row[0])
+        self.put_local(key, value, row[1] - time.time())
+        return value
+
+    async def put(self, key: str, value):
+        self.put_local(key, value, self.ttl)
+        if self.db is None:
+            return
+
+        try:
+            await asyncio.to_thread(self.write_db, key, value.model_dump_json())
+        except sqlite3.Error:
+            pass
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB)
+
+# completions currently running, keyed like the response cache
+in_flight: Dict[str, asyncio.Future] = {}
+
+
+def tool_version(tool: str) -> str:
+    """
+    Version of a tool's prompt, of the engines and indexes it imports, and of the knowledge it is currently
+    built from. Changes whenever any of their code changes or a watched data file is reloaded.
+    """
+    config = tool_mapping[tool]
+    return "".join(
+        [config["version"]] + [knowledge_store.version(name) for name in config["knowledge_files"]]
+    )
+
+
+def request_key(tool: str, validated_input) -> str:
+    """
+    Identify a tool request by its normalized input, the model and the tool's prompt/knowledge version.
+    """
+    canonical_input = json.dumps(
+        validated_input.model_dump(mode="json"), sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(
+        "\x1f".join([tool, canonical_input, MODEL_NAME, tool_version(tool)]).encode()
+    ).hexdigest()
+
+
+async def run_completion(messages, response_format):
+    """
+    Run a structured completion without blocking the event loop.
+    Waits for a free slot when the worker already has the maximum number of calls in flight.
+    """
+    async with completion_slots:
+        completion = await client.beta.chat.completions.parse(
+            model=MODEL_NAME, messages=messages, response_format=response_format, temperature=0
+        )
+
+    return completion.choices[0].message.parsed
+
+
+async def compute_fields(config, validated_input) -> Optional[Dict[str, Any]]:
+    """
+    Response fields a tool computes locally (its "compute_func"), off the event loop.
+    None for tools that leave the whole response to the model.
+    """
+    if "compute_func" not in config:
+        return None
+    return await asyncio.to_thread(config["compute_func"], validated_input)
+
+
+def build_messages(config, validated_input, computed: Optional[Dict[str, Any]]):
+    if computed is None:
+        return config["prompt_func"](inputParameters=validated_input)
+    return config["prompt_func"](inputParameters=validated_input, computed=computed)
+
+
+def completion_format(config):
+    # tools with locally computed fields only ask the model for the remaining ones
+    return config.get("llm_response_format", config["response_format"])
+
+
+def merge_response(config, completed, computed: Optional[Dict[str, Any]]):
+    if computed is None:
+        return completed
+    return config["response_format"].model_validate({**completed.model_dump(), **computed})
+
+
+async def generate_response(tool: str, validated_input, key: str):
+    config = tool_mapping[tool]
+
+    computed = await compute_fields(config, validated_input)
+    if "prompt_func" in config:
+        messages = build_messages(config, validated_input, computed)
+        completed = await run_completion(messages, completion_format(config))
+        response = merge_response(config, completed, computed)
+    else:
+        # tools without a prompt are computed entirely locally
+        response = config["response_format"].model_validate(computed)
+
+    if config.get("cache", True):
+        await response_cache.put(key, response)
+
+    return response
+
+
+def forget_in_flight(key: str, task: asyncio.Future):
+    if in_flight.get(key) is task:
+        del in_flight[key]
+
+    # nobody may be left waiting on the result, mark the error as seen
+    if not task.cancelled():
+        task.exception()
+
+
+async def resolve_response(tool: str, validated_input):
+    """
+    Answer a validated tool request from the cache, or from a completion shared by every
+    concurrent request with the same key. A waiter that gets cancelled leaves the shared call running.
+    """
+    key = request_key(tool, validated_input)
+
+    if tool_mapping[tool].get("cache", True):
+        response = await response_cache.get(key, tool_mapping[tool]["response_format"])
+        if response is not None:
+            return response
+
+    task = in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(generate_response(tool, validated_input, key))
+        in_flight[key] = task
+        task.add_done_callback(lambda done: forget_in_flight(key, done))
+
+    return await asyncio.shield(task)
+
 
 @app.post("/api/v1/chat-tools")
 async def process_tool(
@@ -43,18 +339,11 @@ async def process_tool(
         raise HTTPException(status_code=400, detail="Invalid tool name")
 
     try:
-        prompt_func = tool_mapping[tool]["prompt_func"]
-        response_format = tool_mapping[tool]["response_format"]
         input_format = tool_mapping[tool]["input_format"]
 
         validated_input = input_format(**inputParameters)
 
-        messages = prompt_func(inputParameters=validated_input)
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini", messages=messages, response_format=response_format, temperature=0
-        )
-
-        response = completion.choices[0].message.parsed
+        response = await resolve_response(tool, validated_input)
 
         return {
             "tool": tool,
@@ -70,6 +359,221 @@ async def process_tool(
     except Exception as e:
         raise HTTPException(status_code=422, detail=str(e))
 
+
+async def stream_completion(config, validated_input, computed: Optional[Dict[str, Any]]):
+    """
+    Yield (field name, value) pairs of the model's part of a response as each field completes,
+    then (None, merged response).
+    """
+    messages = build_messages(config, validated_input, computed)
+    emitted = 0
+    async with completion_slots:
+        async with client.beta.chat.completions.stream(
+            model=MODEL_NAME, messages=messages, response_format=completion_format(config), temperature=0
+        ) as stream:
+            async for event in stream:
+                if event.type != "content.delta" or not isinstance(event.parsed, dict):
+                    continue
+
+                # fields arrive in schema order, one is complete once the model moves on to the next
+                names = list(event.parsed)
+                while emitted < len(names) - 1:
+                    yield names[emitted], event.parsed[names[emitted]]
+                    emitted += 1
+
+            completion = await stream.get_final_completion()
+
+    completed = completion.choices[0].message.parsed
+    for name, value in list(completed)[emitted:]:
+        yield name, value
+
+    yield None, merge_response(config, completed, computed)
+
+
+async def generate_streamed(tool: str, validated_input, key: str, fields: asyncio.Queue):
+    """
+    generate_response that also puts (field name, value) pairs on `fields` as each top-level field
+    completes, then None once it is done.
+    """
+    config = tool_mapping[tool]
+    try:
+        # locally computed fields are ready before the model starts
+        computed = await compute_fields(config, validated_input)
+        for name, value in (computed or {}).items():
+            fields.put_nowait((name, value))
+
+        if "prompt_func" in config:
+            response = None
+            async for name, value in stream_completion(config, validated_input, computed):
+                if name is None:
+                    response = value
+                else:
+                    fields.put_nowait((name, value))
+        else:
+            response = config["response_format"].model_validate(computed)
+    finally:
+        fields.put_nowait(None)
+
+    if config.get("cache", True):
+        await response_cache.put(key, response)
+
+    return response
+
+
+async def stream_fields(tool: str, validated_input):
+    """
+    Yield (field name, value) pairs of a tool response as soon as the model has finished each
+    top-level field, then (None, validated response) once the whole object has been parsed.
+    The completion is shared like resolve_response's and keeps running if the client goes away.
+    """
+    config = tool_mapping[tool]
+    key = request_key(tool, validated_input)
+
+    response = None
+    if config.get("cache", True):
+        response = await response_cache.get(key, config["response_format"])
+    if response is None and key in in_flight:
+        response = await asyncio.shield(in_flight[key])
+
+    if response is not None:
+        for name, value in response:
+            yield name, value
+        yield None, response
+        return
+
+    fields = asyncio.Queue()
+    task = asyncio.ensure_future(generate_streamed(tool, validated_input, key, fields))
+    in_flight[key] = task
+    task.add_done_callback(lambda done: forget_in_flight(key, done))
+
+    while True:
+        field = await fields.get()
+        if field is None:
+            break
+        yield field
+
+    yield None, await asyncio.shield(task)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@app.post("/api/v1/chat-tools/stream")
+async def process_tool_stream(
+    tool: str,
+    inputParameters: Any = Body(...),
+) -> StreamingResponse:
+    """
+    Streaming variant of /api/v1/chat-tools using Server-Sent Events.
+    Emits a `field` event for every top-level field as it completes, then a `result` event with the validated response,
+    or an `error` event if the completion fails midway.
+    """
+    if tool not in tool_mapping:
+        raise HTTPException(status_code=400, detail="Invalid tool name")
+
+    try:
+        input_format = tool_mapping[tool]["input_format"]
+        validated_input = input_format(**inputParameters)
+
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=e.errors(),
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    async def stream_events():
+        try:
+            async for name, value in stream_fields(tool, validated_input):
+                if name is None:
+                    yield sse_event("result", {"tool": tool, "response": value})
+                else:
+                    yield sse_event("field", {"name": name, "value": value})
+
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def run_batch_item(tool: str, validated_input, slots: asyncio.Semaphore):
+    async with slots:
+        if tool_mapping[tool].get("cache", True):
+            return await resolve_response(tool, validated_input)
+        # tools that opted out of reuse run every input on its own
+        return await generate_response(tool, validated_input, request_key(tool, validated_input))
+
+
+@app.post("/api/v1/chat-tools/batch")
+async def process_tool_batch(
+    tool: str,
+    inputParameters: List[Any] = Body(...),
+) -> StreamingResponse:
+    """
+    Run one tool over many inputs and stream the results back as NDJSON, one line per input as soon as
+    its result is ready, each line carrying the input's index.
+    Every input is validated before any work starts, identical inputs run once unless the tool opted out
+    of caching, and failures are reported on the line of the input that caused them.
+    """
+    if tool not in tool_mapping:
+        raise HTTPException(status_code=400, detail="Invalid tool name")
+
+    input_format = tool_mapping[tool]["input_format"]
+    shared = tool_mapping[tool].get("cache", True)
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    tasks = {}  # request key -> task shared by every duplicate of that input
+    indexes = {}  # task -> indexes of the inputs it answers
+    errors = []  # (index, validation error) of the inputs that did not validate
+    for index, params in enumerate(inputParameters):
+        try:
+            validated_input = input_format(**params)
+        except ValidationError as e:
+            errors.append((index, jsonable_encoder(e.errors())))
+            continue
+        except Exception as e:
+            errors.append((index, str(e)))
+            continue
+
+        key = request_key(tool, validated_input)
+        task = tasks.get(key) if shared else None
+        if task is None:
+            task = asyncio.ensure_future(run_batch_item(tool, validated_input, slots))
+            tasks[key] = task
+            indexes[task] = []
+        indexes[task].append(index)
+
+    async def finished(task: asyncio.Future):
+        # (input indexes, outcome) of a task once it is done
+        try:
+            return indexes[task], {"response": jsonable_encoder(await task)}
+        except Exception as e:
+            return indexes[task], {"error": str(e)}
+
+    async def stream_results():
+        try:
+            for index, error in errors:
+                yield json.dumps({"index": index, "tool": tool, "error": error}) + "\n"
+
+            for outcome in asyncio.as_completed([finished(task) for task in indexes]):
+                answered, result = await outcome
+                for index in answered:
+                    yield json.dumps({"index": index, "tool": tool, **result}) + "\n"
+        finally:
+            # the client went away, stop whatever is still queued
+            for task in indexes:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @app.get("/api/v1/tools-options")
 async def get_tool_options(tool_name: str) -> Dict[str, Any]:
     """
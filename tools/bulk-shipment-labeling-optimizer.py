@@ -1,7 +1,26 @@
 import json
+import os
+import re
+import time
+import uuid
+import numpy as np
 from pydantic import BaseModel
-from typing import List
-from .custom_types.base_types import Plot
+from typing import List, Optional
+from .custom_types.base_types import Plot, PlotData
+from .engines.label_cost import label_costs
+from .engines.label_renderer import label_layout, render_labels
+from .knowledge.label_cost_index import build_label_cost_index, find_label_size, find_material
+from .knowledge.store import knowledge_store
+
+# manifests are read from, and rendered labels written to, these directories on the server
+LABEL_MANIFEST_DIR = os.getenv("LABEL_MANIFEST_DIR", "manifests")
+LABEL_OUTPUT_DIR = os.getenv("LABEL_OUTPUT_DIR", "labels")
+LABEL_RENDER_WORKERS = int(os.getenv("LABEL_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+# rejected manifest rows listed in a response, the rest are only counted
+MAX_REPORTED_REJECTIONS = 100
+
+LABEL_FORMATS = ["ZPL", "PDF"]
 
 class BulkShipmentLabelingInputParams(BaseModel):
     # Type of product based on product dimensions and weight (small, medium, large)
@@ -44,11 +63,155 @@ class BulkShipmentLabelingAnalysisResults(BaseModel):
     seasonalAdjustmentRecommendations: str  # Recommendations for labeling adjustments based on seasonality
     operationalEfficiencyScore: float  # A score indicating overall labeling process efficiency
 
-def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelingInputParams):
+class BulkShipmentLabelingAdvice(BaseModel):
+    # the fields of BulkShipmentLabelingAnalysisResults that are left to the model
+    carrierLabelRequirements: CarrierLabelRequirements
+    packagingRecommendations: List[PackagingRecommendation]
+    complianceWarnings: ComplianceWarnings
+    durabilityImpactAnalysis: Plot
+    labelingEfficiencyTips: List[str]
+    seasonalAdjustmentRecommendations: str
+    operationalEfficiencyScore: float
+
+
+class LabelGenerationInputParams(BaseModel):
+    # CSV or NDJSON shipment manifest in the manifest directory, one shipment per row
+    manifestFile: str
+    # Carrier whose label requirements apply (e.g., FedEx, UPS, DHL)
+    carrier: str
+    # "ZPL" for thermal printers or "PDF"
+    outputFormat: str = "ZPL"
+    # Shipping type whose mandatory fields apply as well (e.g., domesticShipping, internationalShipping)
+    shippingType: Optional[str] = None
+
+
+class LabelRejection(BaseModel):
+    row: int  # Row number in the manifest
+    reason: str
+
+
+class LabelGenerationResults(BaseModel):
+    outputFile: str  # Rendered labels, in the label output directory
+    outputFormat: str
+    labelSize: str  # Label size required by the carrier
+    mandatoryFields: List[str]  # Fields printed on every label
+    placementNote: str  # Where the carrier wants the labels placed
+    rowsRead: int
+    labelsRendered: int  # One per piece of every accepted row
+    rowsRejected: int  # Rows missing a mandatory field or that cannot be read
+    rejections: List[LabelRejection]  # The first rejected rows
+    elapsedSeconds: float
+    labelsPerSecond: float  # Rendering throughput, for sizing print runs
+
+
+def carrier_requirements(knowledge: dict, carrier: str) -> dict:
+    requirements = knowledge["label_requirements"]["carrierSpecificRequirements"]
+    for name, requirement in requirements.items():
+        if name.lower() == carrier.strip().lower():
+            return requirement
+    raise ValueError(f'Unknown carrier "{carrier}", expected one of: {", ".join(requirements)}')
+
+
+def shipping_fields(knowledge: dict, shipping_type: Optional[str]) -> List[str]:
+    if not shipping_type:
+        return []
+    wanted = re.sub(r"[^a-z]", "", shipping_type.lower())
+    for name, guideline in knowledge["compliance_guidelines"].items():
+        if re.sub(r"[^a-z]", "", name.lower()) == wanted:
+            return guideline["mandatoryFields"]
+    raise ValueError(f'Unknown shippingType "{shipping_type}", expected one of: {", ".join(knowledge["compliance_guidelines"])}')
+
+
+def generate_labels(inputParameters: LabelGenerationInputParams):
+    """
+    Render a label for every piece of every shipment of a manifest, streamed to a file in the label output directory.
+    """
+    output_format = inputParameters.outputFormat.strip().upper()
+    if output_format not in LABEL_FORMATS:
+        raise ValueError(f'Unknown outputFormat "{inputParameters.outputFormat}", expected one of: {", ".join(LABEL_FORMATS)}')
+    # only files directly in the manifest directory can be read
+    if os.path.basename(inputParameters.manifestFile) != inputParameters.manifestFile:
+        raise ValueError("manifestFile must be a file name in the manifest directory")
+    manifest_path = os.path.join(LABEL_MANIFEST_DIR, inputParameters.manifestFile)
+    if not os.path.isfile(manifest_path):
+        raise ValueError(f'Manifest "{inputParameters.manifestFile}" not found')
+
+    knowledge = knowledge_store.get("labeling.json")
+    requirements = carrier_requirements(knowledge, inputParameters.carrier)
+    layout = label_layout(requirements, output_format, shipping_fields(knowledge, inputParameters.shippingType))
+
+    stem = os.path.splitext(inputParameters.manifestFile)[0]
+    # the random suffix keeps requests for the same manifest and carrier within a second apart
+    output_file = (
+        f"{stem}-{inputParameters.carrier.strip().lower()}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        f".{output_format.lower()}"
+    )
+    os.makedirs(LABEL_OUTPUT_DIR, exist_ok=True)
+    stats = render_labels(
+        manifest_path, os.path.join(LABEL_OUTPUT_DIR, output_file), layout, LABEL_RENDER_WORKERS, MAX_REPORTED_REJECTIONS
+    )
+
+    return {
+        "outputFile": output_file,
+        "outputFormat": output_format,
+        "labelSize": requirements["labelSize"],
+        "mandatoryFields": layout["mandatoryFields"],
+        "placementNote": requirements.get("placementNote", ""),
+        "rowsRead": stats["rowsRead"],
+        "labelsRendered": stats["labelsRendered"],
+        "rowsRejected": stats["rowsRejected"],
+        "rejections": [LabelRejection(row=row, reason=reason) for row, reason in stats["rejections"]],
+        "elapsedSeconds": round(stats["elapsedSeconds"], 3),
+        "labelsPerSecond": round(stats["labelsPerSecond"], 1),
+    }
+
+
+def bulk_label_costs(inputParameters: BulkShipmentLabelingInputParams):
+    """
+    Label cost with the bulk discount and the cost of every material at every discount tier,
+    computed from the price tables instead of by the model.
+    """
+    index = knowledge_store.index("labeling.json", build_label_cost_index)
+    size = find_label_size(index, inputParameters.packageSize, inputParameters.carrier)
+    selected = find_material(index, inputParameters.shippingType)
+    materials = index["materials"]
+
+    # the first quantity of every tier, and the requested one
+    quantities = np.unique(np.append(index["tierStarts"], inputParameters.numberOfLabels))
+    costs = label_costs(index, size, quantities)
+    requested = int(np.searchsorted(quantities, inputParameters.numberOfLabels))
+
+    comparison = [
+        PlotData(label=f'{material["name"]}, {int(quantity):,} labels', value=round(float(costs["perLabel"][row, position]), 4))
+        for row, quantity in enumerate(quantities)
+        for position, material in enumerate(materials)
+    ]
+    totals = ", ".join(
+        f'{material["name"]} ${float(costs["total"][requested, position]):,.2f}'
+        for position, material in enumerate(materials)
+    )
+
+    return {
+        "labelCostEstimate": LabelCostEstimate(
+            materialType=materials[selected]["name"],
+            costPerLabel=round(float(costs["listPrice"][selected]), 4),
+            discountApplied=round(float(costs["discount"][requested]) * 100, 2),
+            totalCost=round(float(costs["total"][requested, selected]), 2),
+        ),
+        "bulkLabelCostComparison": Plot(
+            xLabel="Label material and quantity",
+            yLabel="Cost per label ($)",
+            chartType="barChart",
+            data=comparison,
+            explanation=(
+                f'Cost per {index["sizes"][size]["dimensions"]} label at the first quantity of every discount tier '
+                f"and at {inputParameters.numberOfLabels:,} labels, where the whole order costs: {totals}."
+            ),
+        ),
+    }
+
 
-    knowledge_file = open("data/labeling.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelingInputParams, computed: dict):
 
     system_prompt = (
         """
@@ -57,9 +220,12 @@ def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelin
 
     Strictly use the following data as the basis for your analysis:
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge_store.serialized("labeling.json") +
         """
 
+    The label cost with its bulk discount has already been computed from this data and is given below.
+    Use it where your advice concerns cost and do not recompute it.
+
     **Output Format:**
 
     - `Carrier Label Requirements`: 
@@ -76,22 +242,11 @@ def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelin
             - `Adhesion Level`: String in human-readable form, using natural language capitalization.
             - `Recommended Label Type`: String in human-readable form, using natural language capitalization.
 
-    - `Label Cost Estimate`: 
-        - **Format**: `LabelCostEstimate` object.
-        - **Description**: Cost per label, discount applied, and total cost based on bulk quantity.
-        - **Goal**: Provide users with a clear estimate of labeling costs, including any bulk discounts.
-            - `Material Type`: String in human-readable form, using natural language capitalization.
-
     - `Compliance Warnings`: 
         - **Format**: `ComplianceWarnings` object.
         - **Description**: Compliance warnings for the selected shipping type (domestic or international).
         - **Goal**: Ensure that all mandatory fields and guidelines are met for compliance.
 
-    - `Bulk Label Cost Comparison`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Compare costs based on label material and quantity, illustrating the impact of bulk discounts.
-        - **Goal**: Aid users in selecting cost-effective labeling options.
-
     - `Durability Impact Analysis`: 
         - **Chart Type**: "barChart"
         - **Description**: Display durability comparison across different label materials.
@@ -125,6 +280,11 @@ def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelin
         Analyze the labeling optimization requirements based on the following input:
         """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        Label cost:
+        """
+        + json.dumps(computed["labelCostEstimate"].model_dump(), indent=4)
     )
 
     messages = [
@@ -138,11 +298,25 @@ def bulk_shipment_labeling_optimizer_prompt(inputParameters: BulkShipmentLabelin
 tool_config = {
     "bulk-shipment-labeling-optimizer": {
         "prompt_func": bulk_shipment_labeling_optimizer_prompt,
+        "compute_func": bulk_label_costs,
         "response_format": BulkShipmentLabelingAnalysisResults,
+        "llm_response_format": BulkShipmentLabelingAdvice,
         "input_format": BulkShipmentLabelingInputParams,
         "options": {
             "packageSize": ["Small", "Medium", "Large"],
             "shippingType": ["Domestic Shipping", "International Shipping"]
         }
+    },
+    # renders the labels of a manifest locally, every call writes a new file
+    "bulk-shipment-label-generator": {
+        "compute_func": generate_labels,
+        "response_format": LabelGenerationResults,
+        "input_format": LabelGenerationInputParams,
+        "cache": False,
+        "options": {
+            "carrier": ["FedEx", "UPS", "DHL"],
+            "outputFormat": LABEL_FORMATS,
+            "shippingType": ["Domestic Shipping", "International Shipping"]
+        }
     }
 }
@@ -1,7 +1,22 @@
 import json
+import re
+import numpy as np
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from .custom_types.base_types import Plot
+from .custom_types.base_types import Plot, PlotData
+from .engines.cold_chain_cost import cold_chain_costs
+from .knowledge.store import knowledge_store
+from .knowledge.climate_index import build_climate_index, climate_records, carrier_records, shipment_profile
+
+# shipments costed by a single manifest request
+MAX_MANIFEST_SHIPMENTS = 100_000
+
+COST_PARTS = {
+    "transport": "Transport",
+    "carrierPremium": "Carrier Premium",
+    "temperatureControl": "Temperature Control",
+    "packaging": "Packaging",
+}
 
 class ColdChainDeliveryInputParams(BaseModel):
     # Type of product being shipped (e.g., Electronics, Pharmaceuticals, Wine, etc.)
@@ -43,11 +58,169 @@ class ColdChainDeliveryCostEstimateResults(BaseModel):
     packagingCostEfficiencyChart: Plot  # Plot showing cost efficiency of packaging options relative to temperature protection
     seasonalAdjustmentRecommendations: str  # Recommendations for any seasonal adjustments to packaging or handling
 
-def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDeliveryInputParams):
+class ColdChainDeliveryNarrative(BaseModel):
+    # the fields of ColdChainDeliveryCostEstimateResults that are left to the model
+    weatherImpactAssessment: str
+    environmentalRiskLevel: str
+    handlingRecommendations: List[str]
+    estimatedDeliveryTime: str
+    temperatureDeviationRisk: str
+    seasonalAdjustmentRecommendations: str
+
+
+class ColdChainShipment(ColdChainDeliveryInputParams):
+    shipmentId: Optional[str] = None  # Identifier of the shipment in the manifest
+
+
+class ColdChainManifestInputParams(BaseModel):
+    shipments: List[ColdChainShipment]  # Shipments of the manifest
+
+
+class ShipmentCostEstimate(BaseModel):
+    shipmentId: Optional[str]
+    carrier: str  # Carrier the shipment was costed with
+    transportCost: float
+    carrierPremiumCost: float  # Transport cost above an ordinary vehicle
+    temperatureControlCost: float
+    packagingCost: float
+    totalDeliveryCost: float
+
+
+class ColdChainManifestResults(BaseModel):
+    shipmentCount: int
+    totalDeliveryCost: float
+    averageDeliveryCost: float
+    costBreakdown: Dict[str, float]  # Cost part -> total over all shipments
+    shipments: List[ShipmentCostEstimate]
+
+
+def specification(name: str, value) -> SpecificationItem:
+    # "moistureBarrier": true -> "Moisture Barrier": "Yes"
+    if isinstance(value, bool):
+        value = "Yes" if value else "No"
+    words = re.findall(r"[a-z0-9]+|[A-Z][a-z0-9]*", name)
+    return SpecificationItem(name=" ".join(words).capitalize(), value=str(value))
+
+
+def shipment_costs(shipments: List[ColdChainDeliveryInputParams]):
+    """
+    Profiles and cost parts of shipments, resolving every distinct product, weather and carrier only once.
+    """
+    index = knowledge_store.index("climate.json", build_climate_index)
+    profiles = [
+        shipment_profile(index, shipment.productType, shipment.weatherCondition, shipment.carrier)
+        for shipment in shipments
+    ]
+    costs = cold_chain_costs(
+        np.array([shipment.routeDistance for shipment in shipments], dtype=float),
+        np.array([shipment.temperatureRequirement for shipment in shipments], dtype=float),
+        np.array([profile["ambient"][0] for profile in profiles]),
+        np.array([profile["ambient"][1] for profile in profiles]),
+        np.array([profile["carrier"]["costPremium"] for profile in profiles]),
+        np.array([sum(packaging["cost"] for packaging in profile["packaging"]) for profile in profiles]),
+    )
+    return profiles, costs
+
+
+def cold_chain_delivery_costs(inputParameters: ColdChainDeliveryInputParams):
+    """
+    Packaging, carrier and delivery cost computed from climate.json instead of by the model.
+    """
+    (profile,), costs = shipment_costs([inputParameters])
+    carrier = profile["carrier"]
+    total = float(costs["total"][0])
+
+    return {
+        "packagingRecommendations": [
+            PackagingRecommendation(
+                name=packaging["name"],
+                cost=packaging["cost"],
+                specifications=[
+                    specification(name, value) for name, value in packaging.get("specifications", {}).items()
+                ],
+            )
+            for packaging in profile["packaging"]
+        ],
+        "carrierCostEstimate": CarrierCostEstimate(
+            name=carrier["name"],
+            rating=carrier["rating"],
+            capabilities=carrier["capabilities"],
+            costPremium=carrier["costPremium"],
+        ),
+        "totalDeliveryCost": round(total, 2),
+        "costBreakdownChart": Plot(
+            xLabel="Cost component",
+            yLabel="Cost ($)",
+            chartType="barChart",
+            data=[PlotData(label=label, value=round(float(costs[part][0]), 2)) for part, label in COST_PARTS.items()],
+            explanation=(
+                f"Costs of the {inputParameters.routeDistance} mile route with {carrier['name']} "
+                f"(cost premium x{carrier['costPremium']}), holding {inputParameters.temperatureRequirement}°F "
+                f"in {profile['condition'] or inputParameters.weatherCondition}."
+            ),
+        ),
+        "packagingCostEfficiencyChart": Plot(
+            xLabel="Packaging option",
+            yLabel="Share of delivery cost (%)",
+            chartType="lineChart",
+            data=[
+                PlotData(label=packaging["name"], value=round(100 * packaging["cost"] / total, 2) if total else 0.0)
+                for packaging in profile["packaging"]
+            ],
+            explanation="Share of the total delivery cost spent on each recommended packaging option.",
+        ),
+    }
+
+
+def cold_chain_manifest_costs(inputParameters: ColdChainManifestInputParams):
+    """
+    Delivery costs of every shipment of a manifest, in one vectorized pass.
+    """
+    shipments = inputParameters.shipments
+    if len(shipments) > MAX_MANIFEST_SHIPMENTS:
+        raise ValueError(f"A manifest can have at most {MAX_MANIFEST_SHIPMENTS} shipments, got {len(shipments)}")
+    if not shipments:
+        return {"shipmentCount": 0, "totalDeliveryCost": 0.0, "averageDeliveryCost": 0.0,
+                "costBreakdown": {label: 0.0 for label in COST_PARTS.values()}, "shipments": []}
+
+    profiles, costs = shipment_costs(shipments)
+    parts = [costs[part].tolist() for part in COST_PARTS] + [costs["total"].tolist()]
+    total = float(costs["total"].sum())
+
+    return {
+        "shipmentCount": len(shipments),
+        "totalDeliveryCost": round(total, 2),
+        "averageDeliveryCost": round(total / len(shipments), 2),
+        "costBreakdown": {label: round(float(costs[part].sum()), 2) for part, label in COST_PARTS.items()},
+        "shipments": [
+            ShipmentCostEstimate(
+                shipmentId=shipment.shipmentId,
+                carrier=profile["carrier"]["name"],
+                transportCost=round(transport, 2),
+                carrierPremiumCost=round(premium, 2),
+                temperatureControlCost=round(temperature, 2),
+                packagingCost=round(packaging, 2),
+                totalDeliveryCost=round(shipment_total, 2),
+            )
+            for shipment, profile, transport, premium, temperature, packaging, shipment_total
+            in zip(shipments, profiles, *parts)
+        ],
+    }
+
 
-    knowledge_file = open("data/climate.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDeliveryInputParams, computed: dict):
+
+    index = knowledge_store.index("climate.json", build_climate_index)
+
+    # packaging and carrier records for the matching product types and conditions only,
+    # the complete data when the product type matches nothing in the knowledge file
+    records = climate_records(index, inputParameters.productType, inputParameters.weatherCondition)
+    if records:
+        knowledge = json.dumps(
+            {"products": records, "carriers": carrier_records(index, [inputParameters.carrier])}, indent=4
+        )
+    else:
+        knowledge = knowledge_store.serialized("climate.json")
 
     system_prompt = (
         """
@@ -56,37 +229,19 @@ def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDelivery
 
     Strictly use the following data as the foundation for your analysis:
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge +
         """
 
-    **Output Format:**
+    The packaging, the carrier and the delivery cost have already been computed from this data and are
+    given below. Base your assessment on them and do not recompute them.
 
-    - `Packaging Recommendations`: 
-        - **Format**: List of `PackagingRecommendation` objects.
-        - **Description**: Provide recommended packaging options tailored to the weather conditions, including names, costs, and specifications.
-        - **Goal**: Ensure optimal packaging is selected for maintaining required temperature and protecting the product.
-            - Specifications.name: String in human-readable form, using natural language capitalization.
-            
-    - `Carrier Cost Estimate`: 
-        - **Format**: `CarrierCostEstimate` object.
-        - **Description**: List the selected carrier's name, rating, and capabilities. Include any additional cost factor as `costPremium`.
-        - **Goal**: Ensure carrier selection matches temperature control and handling needs.
-
-    - `Total Delivery Cost`: 
-        - **Format**: Float.
-        - **Description**: Calculate the total estimated delivery cost, factoring in carrier premium, packaging, and route distance.
-        - **Goal**: Provide a clear estimate of the total delivery cost for the cold-chain shipment.
+    **Output Format:**
 
     - `Weather Impact Assessment`: 
         - **Format**: Text-based.
         - **Description**: Summarize the expected impact of the specified weather condition on delivery, such as increased handling requirements in extreme temperatures.
         - **Goal**: Provide a realistic outlook of how weather may affect delivery.
 
-    - `Cost Breakdown Chart`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Show a breakdown of the costs for packaging, carrier premium, and other relevant factors.
-        - **Goal**: Visualize the cost structure to help users understand expense distribution.
-
     - `Environmental Risk Level`: 
         - **Format**: Text-based.
         - **Description**: Determine the environmental risk level (e.g., "Low", "Moderate", "High") based on route distance, temperature requirements, and weather conditions.
@@ -107,17 +262,12 @@ def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDelivery
         - **Description**: Assess the risk level for potential temperature fluctuations during transit.
         - **Goal**: Warn users of any possible risks to temperature maintenance.
 
-    - `Packaging Cost Efficiency Chart`: 
-        - **Chart Type**: "lineChart"
-        - **Description**: Illustrate cost-efficiency of packaging options relative to their protective capabilities.
-        - **Goal**: Aid users in selecting the most cost-effective packaging for temperature-sensitive protection.
-
     - `Seasonal Adjustment Recommendations`: 
         - **Format**: Text-based.
         - **Description**: Recommendations for adjusting packaging or handling based on seasonal changes, such as using extra insulation in winter.
         - **Goal**: Guide users in making seasonal adjustments for optimal cold-chain performance.
 
-    **Note:** Ensure all fields in the output are in human-readable format. For example, use "Total Delivery Cost" instead of "totalDeliveryCost." Only use "barChart" for the cost breakdown visualization.
+    **Note:** Ensure all fields in the output are in human-readable format. For example, use "Total Delivery Cost" instead of "totalDeliveryCost."
     """
     )
 
@@ -126,6 +276,19 @@ def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDelivery
         Please analyze the cold-chain delivery cost requirements based on the following input:
         """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        Packaging, carrier and costs:
+        """
+        + json.dumps(
+            {
+                "packaging": [packaging.name for packaging in computed["packagingRecommendations"]],
+                "carrier": computed["carrierCostEstimate"].model_dump(),
+                "totalDeliveryCost": computed["totalDeliveryCost"],
+                "costBreakdown": {point.label: point.value for point in computed["costBreakdownChart"].data},
+            },
+            indent=4,
+        )
     )
 
     messages = [
@@ -139,10 +302,22 @@ def cold_chain_delivery_cost_estimator_prompt(inputParameters: ColdChainDelivery
 tool_config = {
     "cold-chain-delivery-cost-estimator": {
         "prompt_func": cold_chain_delivery_cost_estimator_prompt,
+        "compute_func": cold_chain_delivery_costs,
         "response_format": ColdChainDeliveryCostEstimateResults,
+        "llm_response_format": ColdChainDeliveryNarrative,
         "input_format": ColdChainDeliveryInputParams,
         "options": {
             "weatherCondition": ["Extreme Heat", "Extreme Cold", "High Humidity", "Extreme Temperature Fluctuation"]
         }
+    },
+    # manifests are costed entirely locally, without the language model
+    "cold-chain-manifest-cost-estimator": {
+        "compute_func": cold_chain_manifest_costs,
+        "response_format": ColdChainManifestResults,
+        "input_format": ColdChainManifestInputParams,
+        "cache": False,
+        "options": {
+            "weatherCondition": ["Extreme Heat", "Extreme Cold", "High Humidity", "Extreme Temperature Fluctuation"]
+        }
     }
 }
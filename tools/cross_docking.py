@@ -1,8 +1,23 @@
 import json
+from collections import Counter
 from pydantic import BaseModel
-from .custom_types.base_types import Plot, ComparisonPlot
+from .custom_types.base_types import Plot, ComparisonPlot, PlotData
+from .engines.dock_scheduler import schedule_dock, hours
+from .knowledge.store import knowledge_store
+from .knowledge.cross_docking_index import (
+    build_cross_docking_index, nearest_scenarios, level, TRAFFIC_LEVELS, WEATHER_LEVELS
+)
 from pydantic import BaseModel
 
+# worked scenarios from the knowledge file included in each prompt
+NEAREST_SCENARIOS = 3
+
+# hours trucks are held up per step of the traffic and weather scales
+DELAY_HOURS_PER_LEVEL = 0.25
+
+# outbound trucks shown to the model one by one, the charts of larger docks are cut short
+PROMPT_TRUCKS = 20
+
 
 class Truck(BaseModel):
     arrivalTime: str
@@ -52,10 +67,147 @@ class CrossDockingAnalysisResults(BaseModel):
     costEfficiency: CostEfficiency  # Cost analysis
 
 
-def cross_docking_prompt(inputParameters: CrossDockingInputParams):
-    knowledge_file = open("data/cross_docking.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+class CrossDockingCommentary(BaseModel):
+    # the fields of CrossDockingAnalysisResults that are left to the model
+    dockScheduling: str
+    riskAssessment: RiskAnalysis
+    deliveryStatus: DeliveryStatus
+    costEfficiency: CostEfficiency
+
+
+def clock(time, day) -> float:
+    """
+    Hours since midnight of the first day of the schedule, e.g. 18.5 for 6:30 PM.
+    """
+    return round(hours(time - day), 2)
+
+
+def by_load_type(quantities: dict) -> str:
+    """
+    Quantities by load type, largest first, e.g. "120 Perishable, 40 General".
+    """
+    return ", ".join(f"{round(quantity, 2)} {load_type}" for load_type, quantity in Counter(quantities).most_common())
+
+
+def cross_docking_schedule(inputParameters: CrossDockingInputParams):
+    """
+    Truck allocation, labor use and timeline, computed by the dock scheduler instead of the model.
+    """
+    parameters = inputParameters.model_dump()
+    delay = DELAY_HOURS_PER_LEVEL * (
+        level(TRAFFIC_LEVELS, inputParameters.trafficConditions)
+        + level(WEATHER_LEVELS, inputParameters.weatherConditions)
+    )
+    schedule = schedule_dock(
+        parameters["incomingTrucks"],
+        parameters["outboundTrucks"],
+        inputParameters.docksAvailable,
+        inputParameters.laborAvailable,
+        delay,
+    )
+
+    outbound = schedule["outbound"]
+    labels = [f'Truck {truck["index"] + 1} ({truck["departure"].strftime("%I:%M %p").lstrip("0")})' for truck in outbound]
+    loaded = sum(truck["load"] for truck in outbound)
+    capacity = sum(truck["capacity"] for truck in outbound)
+    no_capacity = sum(schedule["noCapacity"].values())
+    too_late = sum(schedule["tooLate"].values())
+    late = sum(1 for truck in outbound if truck["adjustedDeparture"] > truck["departure"])
+    labor = schedule["laborHours"]
+    worked = labor["Unloading"] + labor["Loading"]
+    window = schedule["windowHours"] or 1.0
+    # only the docks that have a crew are ever used, the others would drag the average down
+    dock_use = [busy / window for busy in schedule["dockBusyHours"][:schedule["docksUsed"]]]
+    unstaffed = inputParameters.docksAvailable - schedule["docksUsed"]
+
+    return {
+        "carrierOptimization": Plot(
+            xLabel="Outbound truck",
+            yLabel="Allocated load",
+            chartType="barChart",
+            data=[PlotData(label=label, value=round(truck["load"], 2)) for label, truck in zip(labels, outbound)],
+            explanation=(
+                f"{round(loaded, 2)} of {round(capacity, 2)} units of outbound capacity are used, "
+                "perishable and fragile loads going on the earliest trucks they can be loaded onto."
+                + (f" {round(no_capacity, 2)} units ({by_load_type(schedule['noCapacity'])}) stay on the dock "
+                   "because the trucks they were ready for are full." if no_capacity else "")
+                + (f" {round(too_late, 2)} units ({by_load_type(schedule['tooLate'])}) "
+                   "are not unloaded in time for any truck and stay on the dock." if too_late else "")
+            ),
+        ),
+        "laborAllocation": Plot(
+            xLabel="Activity",
+            yLabel="Worker hours",
+            chartType="pieChart",
+            data=[PlotData(label=activity, value=round(value, 2)) for activity, value in labor.items()],
+            explanation=(
+                f'{inputParameters.laborAvailable} workers in crews of {schedule["crew"]} on '
+                f'{schedule["docksUsed"]} docks spend {round(100 * worked / (worked + labor["Idle"] or 1))}% '
+                f'of the {round(schedule["windowHours"], 2)} hour operation unloading and loading. '
+                f"Docks are busy unloading {round(100 * sum(dock_use) / len(dock_use))}% of the time on average "
+                f"and {round(100 * max(dock_use))}% for the busiest dock."
+                + (f" {unstaffed} more dock{'s stay' if unstaffed != 1 else ' stays'} closed for lack of workers."
+                   if unstaffed else "")
+            ),
+        ),
+        "deliveryTimelineComparison": ComparisonPlot(
+            xLabel="Outbound truck",
+            yLabel="Departure (hours from midnight)",
+            yActualLabel="Planned departure",
+            yComparedLabel="Adjusted departure",
+            chartType="lineChart",
+            actualData=[
+                PlotData(label=label, value=clock(truck["departure"], schedule["day"]))
+                for label, truck in zip(labels, outbound)
+            ],
+            comparedData=[
+                PlotData(label=label, value=clock(truck["adjustedDeparture"], schedule["day"]))
+                for label, truck in zip(labels, outbound)
+            ],
+            explanation=(
+                f"{late} of {len(outbound)} trucks leave later than planned."
+                + (f" {inputParameters.trafficConditions} traffic and {inputParameters.weatherConditions.lower()} "
+                   f"weather are expected to add about {round(delay, 2)} hours." if delay else "")
+            ),
+        ),
+    }
+
+
+def chart_summary(chart: dict):
+    """
+    A chart with its data series cut to the first PROMPT_TRUCKS points.
+    """
+    for series in ("data", "actualData", "comparedData"):
+        if series in chart and len(chart[series]) > PROMPT_TRUCKS:
+            chart[series] = chart[series][:PROMPT_TRUCKS] + [f"... {len(chart[series]) - PROMPT_TRUCKS} more"]
+    return chart
+
+
+def schedule_summary(inputParameters: CrossDockingInputParams, computed: dict):
+    """
+    The situation and the schedule in aggregate, so the prompt stays small for large docks.
+    """
+    incoming = inputParameters.incomingTrucks
+    quantities = Counter()
+    for truck in incoming:
+        quantities[truck.loadType] += truck.quantity
+    return {
+        "incomingTrucks": len(incoming),
+        "incomingQuantityByLoadType": dict(quantities),
+        "outboundTrucks": len(inputParameters.outboundTrucks),
+        "outboundCapacity": sum(truck.capacity for truck in inputParameters.outboundTrucks),
+        "docksAvailable": inputParameters.docksAvailable,
+        "laborAvailable": inputParameters.laborAvailable,
+        "priorityLevel": inputParameters.priorityLevel,
+        "trafficConditions": inputParameters.trafficConditions,
+        "weatherConditions": inputParameters.weatherConditions,
+        "schedule": {name: chart_summary(chart.model_dump()) for name, chart in computed.items()},
+    }
+
+
+def cross_docking_prompt(inputParameters: CrossDockingInputParams, computed: dict):
+    index = knowledge_store.index("cross_docking.json", build_cross_docking_index)
+    knowledge = nearest_scenarios(index, inputParameters.model_dump(), NEAREST_SCENARIOS)
 
     system_prompt = (
         """
@@ -66,57 +218,41 @@ def cross_docking_prompt(inputParameters: CrossDockingInputParams):
          - Efficiently allocate labor and dock resources.
          - Optimize the transfer of goods between inbound and outbound trucks based on priority level, traffic, and weather conditions.
 
-         Strictly use the following data as the foundation for your analysis:
+         Strictly use the following data as the foundation for your analysis.
+         These are the worked scenarios closest to the user's situation, most similar first:
         """
         + json.dumps(knowledge, indent=4) +
         """
         
          ## **Instructions**:
 
-         ### Step 1: Analyze Incoming and Outbound Trucks
-         - Prioritize load allocation by type (e.g., **Perishable** and **Fragile** items should minimize waiting time).
-         - Allocate load quantities to outbound trucks, ensuring efficient use of capacity.
-
-         ### Step 2: Generate Visual Outputs
-         - **Carrier Optimization Analysis**:
-           - Create a `barChart` to display the load allocated to each outbound truck.
-           - Provide an explanation on load distribution and recommendations for balancing.
+         The trucks have already been scheduled by a dock scheduler: the load allocated to each outbound truck,
+         the labor split and the planned vs. adjusted departures are given below. Base your commentary on them
+         and do not recompute them.
 
-         - **Dock Scheduling and Labor Allocation**:
-           - Assess dock and labor availability for efficient loading/unloading.
-           - Display **dock utilization** using a `barChart` and **labor distribution** with a `pieChart`.
-           - Offer recommendations for optimal dock scheduling and labor allocation.
+         ### Step 1: Dock Scheduling
+         - Assess dock and labor availability for efficient loading/unloading.
+         - Offer recommendations for optimal dock scheduling and labor allocation.
 
-         - **Delivery Timeline Comparison**:
-           - Compare planned vs. adjusted timelines for each outbound truck based on traffic and weather.
-           - Use a `lineChart` for visual comparison, explaining any potential delays or on-time departures.
-           - Time values should be in decimal format (e.g., 12.5 for 12:30 PM).
-
-         ### Step 3: Conduct Risk Assessment
+         ### Step 2: Conduct Risk Assessment
          - Analyze risk level (Low, Medium, High) based on traffic, weather, and scheduling factors.
          - Provide an explanation of the risk level and recommendations to mitigate risks.
 
-         ### Step 4: Provide Detailed Explanations
-         - **Carrier Optimization Suggestions**: Text explanation for load allocation efficiency.
-         - **Dock Scheduling & Labor Utilization**: Text recommendation for dock and labor efficiency.
+         ### Step 3: Provide Detailed Explanations
          - **Delivery Status**: Summarize the expected timeline, including any delays and mitigation strategies.
-         - **Risk Mitigation**: Text outlining actions to reduce delays or bottlenecks.
-
-         ### Final Recommendations
-         - Summarize key actions to minimize storage, optimize dock/labor use, and ensure timely deliveries.
+         - **Cost Efficiency**: Explain labor efficiency, dock utilization and truck capacity utilization.
 
         
         ### **Notes**:
         - Use Time in the format HH:MM AM/PM
-        - Use only **pieChart**, **barChart**, or **lineChart** for visuals.
         """
     )
 
     user_prompt = (
         """
-        I need you to analyze the cross-docking process based on my following input data:
+        I need you to analyze the cross-docking process based on my following input data and schedule:
         """
-        + json.dumps(inputParameters.model_dump(), indent=4)
+        + json.dumps(schedule_summary(inputParameters, computed), indent=4)
     )
 
     messages = [
@@ -130,7 +266,9 @@ def cross_docking_prompt(inputParameters: CrossDockingInputParams):
 tool_config = {
     "cross-docking": {
         "prompt_func": cross_docking_prompt,
+        "compute_func": cross_docking_schedule,
         "response_format": CrossDockingAnalysisResults,
+        "llm_response_format": CrossDockingCommentary,
         "input_format": CrossDockingInputParams,
         "options": {
             "loadType": ["Perishable", "Fragile", "Standard", "Special", "Other"],
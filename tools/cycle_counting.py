@@ -1,8 +1,18 @@
 import json
+import os
 from pydantic import BaseModel
-from .custom_types.base_types import Plot, ComparisonPlot
+from .custom_types.base_types import Plot, PlotData, ComparisonPlot
+from .engines.cycle_count import (
+    ABC_CLASSES, abc_classes, class_totals, count_schedule, frequency_days, period, priority_factor, summarize_snapshot
+)
 from pydantic import BaseModel
 
+# SKU-level snapshots of expected and counted quantities are read from this directory on the server
+INVENTORY_SNAPSHOT_DIR = os.getenv("INVENTORY_SNAPSHOT_DIR", "snapshots")
+
+# rejected snapshot rows quoted in the discrepancy analysis, the rest are only counted
+MAX_QUOTED_REJECTIONS = 3
+
 
 class CycleCountingInputParams(BaseModel):
     cycleCountFrequency: str  # Frequency of cycle counts (e.g., daily, weekly)
@@ -58,6 +68,160 @@ class CycleCountingAnalysisResults(BaseModel):
     processStreamliningSuggestions: str
 
 
+class CycleCountingNarrative(BaseModel):
+    # the fields of CycleCountingAnalysisResults that are left to the model in the SKU-level mode
+    cycleCountFrequencySuggestion: ProgressData
+    inventoryRiskAssessment: RiskAnalysis
+    priorityRecommendations: Plot
+    cycleCountEfficiency: ProgressData
+    replenishmentSuggestion: str
+    accuracyImprovementSuggestions: str
+    processStreamliningSuggestions: str
+
+
+class SkuCycleCountingInputParams(BaseModel):
+    # CSV or NDJSON file in the snapshot directory with a row per SKU: its expected and counted quantity,
+    # and optionally its unit cost and annual usage (units sold)
+    snapshotFile: str
+    cycleCountFrequency: str  # Frequency of cycle counts (e.g., daily, weekly)
+    # Priority level of the cycle count process (e.g., High, Medium, Low)
+    priorityLevel: str
+
+
+def sku_cycle_counting(inputParameters: SkuCycleCountingInputParams):
+    """
+    Discrepancies, stock levels and the next count of every ABC class of a SKU-level snapshot,
+    streamed from the snapshot file instead of estimated by the model.
+    """
+    cycle_days = frequency_days(inputParameters.cycleCountFrequency)
+    factor = priority_factor(inputParameters.priorityLevel)
+    # only files directly in the snapshot directory can be read
+    if os.path.basename(inputParameters.snapshotFile) != inputParameters.snapshotFile:
+        raise ValueError("snapshotFile must be a file name in the snapshot directory")
+    snapshot_path = os.path.join(INVENTORY_SNAPSHOT_DIR, inputParameters.snapshotFile)
+    if not os.path.isfile(snapshot_path):
+        raise ValueError(f'Snapshot "{inputParameters.snapshotFile}" not found')
+
+    summary = summarize_snapshot(snapshot_path, MAX_QUOTED_REJECTIONS)
+    classes = class_totals(summary["totals"], abc_classes(summary["totals"]))
+    skus = int(classes["skus"].sum())
+    if skus == 0:
+        raise ValueError(f'Snapshot "{inputParameters.snapshotFile}" has no SKU with an expected and a counted quantity')
+    schedule = count_schedule(classes, cycle_days, factor)
+
+    discrepant = int(classes["discrepant"].sum())
+    net = float(classes["counted"].sum() - classes["expected"].sum())
+    explanation = (
+        f"{discrepant:,} of {skus:,} SKUs ({100 * discrepant / skus:.1f}%) were counted differently than expected, "
+        f"{classes['overUnits'].sum():,.0f} units over and {classes['underUnits'].sum():,.0f} under "
+        f"(net {net:+,.0f} units, ${classes['discrepancyValue'].sum():,.2f} at unit cost)."
+    )
+    if summary["largestDiscrepancies"]:
+        explanation += " Largest discrepancies: " + ", ".join(
+            f"{sku} (expected {expected:,.0f}, counted {counted:,.0f})"
+            for _, sku, expected, counted in summary["largestDiscrepancies"][:3]
+        ) + "."
+    if summary["rowsRejected"]:
+        explanation += f" {summary['rowsRejected']:,} rows were skipped: " + "; ".join(
+            f"row {row} {reason}" for row, reason in summary["rejections"]
+        ) + "."
+
+    labels = [f"Class {name}" for name in ABC_CLASSES]
+    intervals = ", ".join(
+        f"class {name} every {period(int(days))}" for name, days in zip(ABC_CLASSES, schedule["intervalDays"])
+    )
+    if schedule["recountSkus"]:
+        next_count = (
+            f"{period(cycle_days)}: recount the {schedule['recountSkus']:,} SKUs with discrepancies, then count "
+            f"{intervals} (about {schedule['skusPerCycle']:,.0f} SKUs per count)"
+        )
+    else:
+        next_count = (
+            f"{period(cycle_days)}: count {intervals} (about {schedule['skusPerCycle']:,.0f} SKUs per count)"
+        )
+
+    return {
+        "discrepancyAnalysis": Plot(
+            xLabel="ABC class",
+            yLabel="SKUs with a discrepancy (%)",
+            chartType="barChart",
+            data=[
+                PlotData(label=label, value=round(100 * float(count) / float(total), 2) if total else 0.0)
+                for label, count, total in zip(labels, classes["discrepant"], classes["skus"])
+            ],
+            explanation=explanation,
+        ),
+        "stockLevelAnalysis": ComparisonPlot(
+            xLabel="ABC class",
+            yLabel="Units",
+            yActualLabel="Counted units",
+            yComparedLabel="Expected units",
+            chartType="barChart",
+            actualData=[PlotData(label=label, value=float(value)) for label, value in zip(labels, classes["counted"])],
+            comparedData=[PlotData(label=label, value=float(value)) for label, value in zip(labels, classes["expected"])],
+            explanation=(
+                "SKUs are classed by annual usage value (unit cost times annual usage, the value on hand without "
+                "a usage figure): " + ", ".join(
+                    f"class {name} {int(count):,} SKUs, {float(over):,.0f} units over and {float(under):,.0f} under"
+                    for name, count, over, under in zip(ABC_CLASSES, classes["skus"], classes["overUnits"], classes["underUnits"])
+                ) + "."
+            ),
+        ),
+        "nextCycleCountPeriod": next_count,
+    }
+
+
+def sku_cycle_counting_prompt(inputParameters: SkuCycleCountingInputParams, computed: dict):
+
+    system_prompt = (
+        """
+        You are an assistant for a shipping community tool called the Cycle Counting Tool. Your task is to analyze
+        the SKU-level cycle count of a warehouse and generate actionable recommendations for optimizing its cycle counting process.
+
+        The discrepancy analysis, the stock levels of every ABC class and the next cycle count period have already
+        been computed from the warehouse's snapshot of expected and counted quantities and are given below.
+        Base your recommendations on them and do not recompute them.
+
+        **Output Format:**
+          - `cycleCountFrequencySuggestion`: A `ProgressData` object on whether the frequency should be increased or maintained (0-100).
+          - `inventoryRiskAssessment`: The risk level (Low, Medium, High) of inventory discrepancies and stockouts, with a 0-100 progress value.
+          - `priorityRecommendations`: A pieChart of the share of counting attention each ABC class needs, in percentages.
+          - `cycleCountEfficiency`: A `ProgressData` efficiency score (0-100) of the current cycle counting process.
+          - `replenishmentSuggestion`: A text recommending when and how to replenish the undercounted stock.
+          - `accuracyImprovementSuggestions`: A text with tips for improving cycle count accuracy.
+          - `processStreamliningSuggestions`: A text suggesting ways to streamline or automate the cycle count process.
+
+        Use only **pieChart**, **barChart**, or **lineChart** for visuals.
+        """
+    )
+
+    user_prompt = (
+        """
+        I need you to analyze the cycle counting process based on the following input:
+        """
+        + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        Cycle count of the snapshot:
+        """
+        + json.dumps(
+            {
+                "discrepancyAnalysis": computed["discrepancyAnalysis"].model_dump(),
+                "stockLevelAnalysis": computed["stockLevelAnalysis"].model_dump(),
+                "nextCycleCountPeriod": computed["nextCycleCountPeriod"],
+            },
+            indent=4,
+        )
+    )
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    return messages
+
+
 def cycle_counting_prompt(inputParameters: CycleCountingInputParams):
 
     system_prompt = (
@@ -162,5 +326,18 @@ tool_config = {
             "cycleCountFrequency": ["Daily", "Weekly", "Bi-Weekly", "Monthly", "Quarterly", "Annually"],
             "priorityLevel": ["High", "Medium", "Low"],
         }
+    },
+    # the snapshot file can change under the same name, so responses are not cached
+    "cycle-counting-sku": {
+        "prompt_func": sku_cycle_counting_prompt,
+        "compute_func": sku_cycle_counting,
+        "response_format": CycleCountingAnalysisResults,
+        "llm_response_format": CycleCountingNarrative,
+        "input_format": SkuCycleCountingInputParams,
+        "cache": False,
+        "options": {
+            "cycleCountFrequency": ["Daily", "Weekly", "Bi-Weekly", "Monthly", "Quarterly", "Annually"],
+            "priorityLevel": ["High", "Medium", "Low"],
+        }
     }
 }
@@ -1,7 +1,14 @@
 import json
+import numpy as np
 from pydantic import BaseModel
 from typing import List
-from .custom_types.base_types import Plot, ComparisonPlot
+from .custom_types.base_types import Plot, ComparisonPlot, PlotData
+from .engines.frequency_cost import (
+    optimal_frequencies, delay_cost_share, DELAY_COST_SHARES, MAX_FREQUENCY, WEEKS_PER_MONTH, WEEKS_PER_YEAR
+)
+
+# combinations evaluated by a single sweep request
+MAX_SWEEP_COMBINATIONS = 100_000
 
 
 class FrequencyCostInputParams(BaseModel):
@@ -47,56 +54,202 @@ class DeliveryFrequencyCostImpactOutput(BaseModel):
     urgencyImpactAssessment: List[UrgencyImpactAssessment]  # Suggested frequency recommendations based on urgency level
 
 
-def delivery_frequency_cost_impact_analyzer_prompt(inputParameters: FrequencyCostInputParams):
+class DeliveryFrequencyNarrative(BaseModel):
+    # the fields of DeliveryFrequencyCostImpactOutput that are left to the model
+    recommendations: List[str]
+    keyInsights: List[str]
 
-    system_prompt = (
-        """
-    You are an assistant for a shipping community tool called the Delivery Frequency Cost Impact Analyzer.
-    Your role is to assess the cost implications of adjusting delivery frequency, allowing users to see the financial impact of different intervals.
 
-    **Output Format:**
+class FrequencySweepInputParams(BaseModel):
+    # every combination of the values below is evaluated
+    deliveryFrequencies: List[int]  # Current deliveries per week
+    averageParcelCosts: List[float]  # Average cost per parcel
+    routeDistances: List[float]  # Distance covered per delivery route in kilometers
+    urgencyLevels: List[str]  # e.g., "Standard", "Express", "Critical"
 
-    Your output should include the following fields, each with specific details:
 
-    - `frequencyCostBreakdown`: 
-        - **Format**: List of `CostImpactAnalysis` objects.
-        - **Description**: Break down delivery costs across frequency levels, showing cost differences and potential savings.
-        - **Goal**: Compare costs at different frequencies to find savings opportunities.
+class FrequencySweepResult(BaseModel):
+    deliveryFrequency: int
+    averageParcelCost: float
+    routeDistance: float
+    urgencyLevel: str
+    optimalFrequency: int  # Cheapest deliveries per week for this combination
+    currentWeeklyCost: float  # Weekly cost at the current frequency
+    optimalWeeklyCost: float  # Weekly cost at the optimal frequency
+    weeklySavings: float
+    annualSavings: float
 
-    - `optimalFrequency`: 
-        - **Format**: Integer.
-        - **Description**: Suggested delivery frequency for optimal cost savings.
-        - **Goal**: Helps users identify a cost-effective delivery frequency.
 
-    - `totalCostEstimation`: 
-        - **Format**: Float.
-        - **Description**: Total delivery cost estimate at the optimal frequency.
-        - **Goal**: Provides an overview of costs at the recommended frequency.
+class FrequencySweepOutput(BaseModel):
+    combinations: int  # Number of combinations evaluated
+    totalAnnualSavings: float  # Sum of the annual savings over all combinations
+    results: List[FrequencySweepResult]
+
+
+def check_frequency(frequency: int):
+    if not 1 <= frequency <= MAX_FREQUENCY:
+        raise ValueError(f"deliveryFrequency must be between 1 and {MAX_FREQUENCY} deliveries per week")
 
-    - `savingsEstimation`: 
-        - **Format**: Float.
-        - **Description**: Estimated savings achieved by adjusting to the optimal frequency.
-        - **Goal**: Shows potential cost reductions.
 
-    - `frequencyCostAnalysis`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Displays total cost across delivery frequencies.
-        - **Goal**: Visualize costs per frequency for better decision-making.
+def delivery_frequency_costs(inputParameters: FrequencyCostInputParams):
+    """
+    Cost curve, optimal frequency and savings, computed by the cost model instead of the model.
+    """
+    current = inputParameters.deliveryFrequency
+    check_frequency(current)
+    frequencies = np.arange(1, max(7, current) + 1)
+
+    # the requested urgency level first, then every level for the urgency assessment
+    levels = [inputParameters.urgencyLevel] + [level.capitalize() for level in DELAY_COST_SHARES]
+    result = optimal_frequencies(
+        np.full(len(levels), current),
+        np.full(len(levels), inputParameters.averageParcelCost),
+        np.full(len(levels), inputParameters.routeDistance),
+        np.array([delay_cost_share(level) for level in levels]),
+        frequencies,
+    )
+
+    breakdown = [
+        CostImpactAnalysis(
+            frequency=int(frequency),
+            totalCost=round(float(result["totalCost"][0, column]), 2),
+            costDifference=round(float(result["costDifference"][0, column]), 2),
+            savingsPotential=round(float(result["savingsPotential"][0, column]), 2),
+            averageCostPerParcel=round(float(result["averageCostPerParcel"][0, column]), 2),
+            totalDistanceCovered=round(float(result["totalDistanceCovered"][0, column]), 2),
+        )
+        for column, frequency in enumerate(frequencies)
+    ]
+    optimal = int(result["optimalFrequency"][0])
+    weekly_savings = float(result["weeklySavings"][0])
+
+    def chart(xLabel, yLabel, chartType, field, explanation):
+        return Plot(
+            xLabel=xLabel,
+            yLabel=yLabel,
+            chartType=chartType,
+            data=[PlotData(label=f"{row.frequency}x/week", value=getattr(row, field)) for row in breakdown],
+            explanation=explanation,
+        )
+
+    return {
+        "frequencyCostBreakdown": breakdown,
+        "optimalFrequency": optimal,
+        "totalCostEstimation": round(float(result["optimalCost"][0]), 2),
+        "savingsEstimation": round(weekly_savings, 2),
+        "frequencyCostAnalysis": chart(
+            "Deliveries per week", "Weekly cost", "barChart", "totalCost",
+            f"Weekly cost is lowest when delivering {optimal}x per week, where route costs and the cost of "
+            "parcels waiting for the next delivery balance out.",
+        ),
+        "savingsPotentialAnalysis": chart(
+            "Deliveries per week", "Weekly savings", "lineChart", "savingsPotential",
+            f"Savings against delivering {current}x per week today; negative values cost more.",
+        ),
+        "averageCostPerParcelTrend": chart(
+            "Deliveries per week", "Cost per parcel", "lineChart", "averageCostPerParcel",
+            "Cost per parcel for the same weekly volume at each frequency.",
+        ),
+        "distanceCoverageAnalysis": chart(
+            "Deliveries per week", "Kilometers per week", "barChart", "totalDistanceCovered",
+            f"Every delivery covers the {inputParameters.routeDistance} km route once.",
+        ),
+        "financialSummary": FinancialSummary(
+            weeklySavings=round(weekly_savings, 2),
+            monthlySavings=round(weekly_savings * WEEKS_PER_MONTH, 2),
+            annualSavings=round(weekly_savings * WEEKS_PER_YEAR, 2),
+        ),
+        "urgencyImpactAssessment": [
+            UrgencyImpactAssessment(
+                urgencyLevel=level,
+                suggestedFrequency=int(result["optimalFrequency"][row]),
+                description=(
+                    f"A parcel waiting one more day costs {round(100 * delay_cost_share(level))}% of its "
+                    f"delivery cost, so delivering {int(result['optimalFrequency'][row])}x per week keeps the "
+                    f"weekly cost lowest at {round(float(result['optimalCost'][row]), 2)}."
+                ),
+            )
+            for row, level in enumerate(levels)
+            if row > 0
+        ],
+    }
 
-    - `savingsPotentialAnalysis`: 
-        - **Chart Type**: "lineChart"
-        - **Description**: Shows potential savings as delivery frequency is adjusted.
-        - **Goal**: Illustrates where savings peak and diminish.
 
-    - `averageCostPerParcelTrend`: 
-        - **Chart Type**: "lineChart"
-        - **Description**: Shows average parcel cost trends at each frequency.
-        - **Goal**: Provides insights into cost efficiency per parcel.
+def delivery_frequency_sweep(inputParameters: FrequencySweepInputParams):
+    """
+    Optimal frequency and savings for every combination of the given values, in one vectorized pass.
+    """
+    axes = [
+        inputParameters.deliveryFrequencies,
+        inputParameters.averageParcelCosts,
+        inputParameters.routeDistances,
+        inputParameters.urgencyLevels,
+    ]
+    combinations = int(np.prod([len(axis) for axis in axes]))
+    if combinations > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(f"A sweep can evaluate at most {MAX_SWEEP_COMBINATIONS} combinations, got {combinations}")
+    for frequency in inputParameters.deliveryFrequencies:
+        check_frequency(frequency)
 
-    - `distanceCoverageAnalysis`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Total distance covered for each delivery frequency.
-        - **Goal**: Shows logistics impact by frequency.
+    if not combinations:
+        return {"combinations": 0, "totalAnnualSavings": 0.0, "results": []}
+
+    grids = np.meshgrid(*[np.arange(len(axis)) for axis in axes], indexing="ij")
+    frequency, cost, distance, urgency = [grid.ravel() for grid in grids]
+    shares = np.array([delay_cost_share(level) for level in inputParameters.urgencyLevels])
+
+    result = optimal_frequencies(
+        np.array(axes[0])[frequency], np.array(axes[1])[cost], np.array(axes[2])[distance], shares[urgency]
+    )
+
+    results = [
+        FrequencySweepResult(
+            deliveryFrequency=axes[0][frequency[row]],
+            averageParcelCost=axes[1][cost[row]],
+            routeDistance=axes[2][distance[row]],
+            urgencyLevel=axes[3][urgency[row]],
+            optimalFrequency=optimal,
+            currentWeeklyCost=round(current, 2),
+            optimalWeeklyCost=round(best, 2),
+            weeklySavings=round(savings, 2),
+            annualSavings=round(savings * WEEKS_PER_YEAR, 2),
+        )
+        for row, (optimal, current, best, savings) in enumerate(zip(
+            result["optimalFrequency"].tolist(),
+            result["currentCost"].tolist(),
+            result["optimalCost"].tolist(),
+            result["weeklySavings"].tolist(),
+        ))
+    ]
+
+    return {
+        "combinations": combinations,
+        "totalAnnualSavings": round(float(result["weeklySavings"].sum()) * WEEKS_PER_YEAR, 2),
+        "results": results,
+    }
+
+
+def delivery_frequency_cost_impact_analyzer_prompt(inputParameters: FrequencyCostInputParams, computed: dict):
+    # the charts only repeat the breakdown
+    results = {
+        name: [row.model_dump() for row in value] if isinstance(value, list)
+        else value.model_dump() if isinstance(value, BaseModel) else value
+        for name, value in computed.items()
+        if not isinstance(value, Plot)
+    }
+
+    system_prompt = (
+        """
+    You are an assistant for a shipping community tool called the Delivery Frequency Cost Impact Analyzer.
+    Your role is to assess the cost implications of adjusting delivery frequency, allowing users to see the financial impact of different intervals.
+
+    The cost curve has already been computed by a cost model: the cost at every frequency, the optimal
+    frequency, the savings and the frequency suited to each urgency level are given below.
+    Base your recommendations and insights on them and do not recompute them.
+
+    **Output Format:**
+
+    Your output should include the following fields, each with specific details:
 
     - `recommendations`: 
         - **Format**: List of strings.
@@ -108,18 +261,8 @@ def delivery_frequency_cost_impact_analyzer_prompt(inputParameters: FrequencyCos
         - **Description**: Key observations from the analysis.
         - **Goal**: Summarizes high-level insights for quick review.
 
-    - `financialSummary`: 
-        - **Format**: `FinancialSummary` object.
-        - **Description**: Weekly, monthly, and annual savings estimates.
-        - **Goal**: Overview of long-term financial benefits.
-
-    - `urgencyImpactAssessment`: 
-        - **Format**: List of `UrgencyImpactAssessment` objects.
-        - **Description**: Recommended frequency by urgency level.
-        - **Goal**: Aligns delivery frequency with urgency requirements.
-
     **Note:**
-    Only use ["barChart", "lineChart"] for visualizations. Each chart should offer clear insights into cost impact by frequency.
+    Refer to the figures of the cost model where they support a recommendation or an insight.
     """
     )
     
@@ -147,6 +290,11 @@ def delivery_frequency_cost_impact_analyzer_prompt(inputParameters: FrequencyCos
     Provide a detailed analysis on cost impact across frequencies, and recommend an optimal frequency for cost and urgency.
     """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+    Cost model results:
+    """
+        + json.dumps(results, indent=4)
     )
 
     messages = [
@@ -160,10 +308,23 @@ def delivery_frequency_cost_impact_analyzer_prompt(inputParameters: FrequencyCos
 tool_config = {
     "delivery-frequency-cost-impact-analyzer": {
         "prompt_func": delivery_frequency_cost_impact_analyzer_prompt,
+        "compute_func": delivery_frequency_costs,
         "response_format": DeliveryFrequencyCostImpactOutput,
+        "llm_response_format": DeliveryFrequencyNarrative,
         "input_format": FrequencyCostInputParams,
         "options": {
             "urgencyLevel": ["Standard", "Express", "Critical"]
         }
+    },
+    # network-wide planning, computed entirely by the cost model without the language model
+    "delivery-frequency-sweep": {
+        "compute_func": delivery_frequency_sweep,
+        "response_format": FrequencySweepOutput,
+        "input_format": FrequencySweepInputParams,
+        # sweeps are cheap to recompute and their responses too large to keep around
+        "cache": False,
+        "options": {
+            "urgencyLevels": ["Standard", "Express", "Critical"]
+        }
     }
 }
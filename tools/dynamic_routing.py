@@ -1,5 +1,7 @@
 from pydantic import BaseModel
 from .custom_types.base_types import Plot
+from .knowledge.geocoding import build_gazetteer, geocode, distance
+from .knowledge.store import knowledge_store
 from pydantic import BaseModel
 
 
@@ -53,6 +55,25 @@ class DynamicRoutingAnalysisResults(BaseModel):
     priorityAdjustmentSuggestions: str
 
 
+def route_distance(inputParameters: DynamicRoutingInputParamsType) -> str:
+    """
+    Straight-line distance between the two addresses from the offline gazetteer, for the model to build on.
+    """
+    gazetteer = knowledge_store.index("gazetteer.json", build_gazetteer)
+    miles = distance(gazetteer, inputParameters.currentLocation, inputParameters.destinationAddress)
+    if miles is None:
+        return "unknown, estimate it from the addresses"
+
+    origin = geocode(gazetteer, inputParameters.currentLocation)
+    destination = geocode(gazetteer, inputParameters.destinationAddress)
+    return "about {miles} miles in a straight line ({origin} to {destination}, located by {precision})".format(
+        miles=round(miles),
+        origin=origin.place,
+        destination=destination.place,
+        precision=" and ".join(sorted({origin.precision, destination.precision})),
+    )
+
+
 def dynamic_routing_prompt(inputParameters: DynamicRoutingInputParamsType):
     system_prompt = (
         """
@@ -87,12 +108,14 @@ def dynamic_routing_prompt(inputParameters: DynamicRoutingInputParamsType):
         I need you to analyze a parcel's delivery based on the following input:
         1. My Destination Address is: {destinationAddress}
         2. My Current Location is: {currentLocation}
+        3. Distance: {distance}
         5. Priority Level: {priorityLevel}
         6. Traffic Conditions: {trafficConditions}
         7. Weather Conditions: {weatherConditions}
         """.format(
             destinationAddress=inputParameters.destinationAddress,
             currentLocation=inputParameters.currentLocation,
+            distance=route_distance(inputParameters),
             priorityLevel=inputParameters.priorityLevel,
             trafficConditions=inputParameters.trafficConditions,
             weatherConditions=inputParameters.weatherConditions,
@@ -0,0 +1,47 @@
+from typing import Dict
+import numpy as np
+
+# running cost of an ordinary vehicle per mile, before the carrier's cold-chain premium
+TRANSPORT_COST_PER_MILE = 1.5
+
+# cost of holding the cargo one °F away from the outside temperature for one mile
+TEMPERATURE_CONTROL_COST_PER_DEGREE_MILE = 0.002
+
+
+def cold_chain_costs(
+    distance: np.ndarray,
+    requirement: np.ndarray,
+    ambient_low: np.ndarray,
+    ambient_high: np.ndarray,
+    premium: np.ndarray,
+    packaging: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Delivery cost of n shipments and its parts, all arrays of shape (n,).
+
+    The carrier's costPremium multiplies the transport cost, and the premium is the part above it.
+    Temperature control pays for the largest gap between the required temperature and the ambient
+    range over the whole route; packaging is the cost of the recommended packaging.
+    """
+    distance = np.asarray(distance, dtype=float)
+    if np.any(distance < 0) or not np.all(np.isfinite(distance)):
+        raise ValueError("routeDistance must be a non-negative number of miles")
+    requirement = np.asarray(requirement, dtype=float)
+
+    transport = distance * TRANSPORT_COST_PER_MILE
+    carrier_premium = transport * np.maximum(np.asarray(premium, dtype=float) - 1, 0.0)
+    gap = np.maximum.reduce([
+        requirement - np.asarray(ambient_low, dtype=float),
+        np.asarray(ambient_high, dtype=float) - requirement,
+        np.zeros_like(requirement),
+    ])
+    temperature_control = distance * gap * TEMPERATURE_CONTROL_COST_PER_DEGREE_MILE
+    packaging = np.asarray(packaging, dtype=float)
+
+    return {
+        "transport": transport,
+        "carrierPremium": carrier_premium,
+        "temperatureControl": temperature_control,
+        "packaging": packaging,
+        "total": transport + carrier_premium + temperature_control + packaging,
+    }
@@ -0,0 +1,141 @@
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+# what the rules of one state say about one item, in the order rulings are stored
+RULING_FIELDS = (
+    "prohibited",  # names of the prohibited items
+    "restricted",  # names of the restricted items
+    "ageVerification",
+    "shippingRestrictions",
+    "documents",
+    "packaging",
+    "fees",  # tax and fee categories
+    "carriers",  # (carrier, restricted item) pairs
+)
+
+ROLES = ("origin", "destination")
+
+
+def ordered_union(*groups: Sequence) -> Tuple:
+    return tuple(dict.fromkeys(value for group in groups for value in group))
+
+
+def evaluate_rules(state_rules: List[Dict], tokens: frozenset) -> Tuple:
+    """
+    The ruling of one state's rules on an item, given by the words of its name: a tuple of RULING_FIELDS.
+    """
+    ruling = {field: [] for field in RULING_FIELDS}
+    ruling["ageVerification"] = False
+    for rule in state_rules:
+        if not rule["tokens"] <= tokens:
+            continue
+        entry = rule["entry"]
+        section = rule["section"]
+        if section == "prohibitedItems":
+            ruling["prohibited"].append(rule["item"])
+        elif section == "restrictedItems":
+            ruling["restricted"].append(rule["item"])
+            ruling["ageVerification"] = ruling["ageVerification"] or bool(entry.get("ageVerificationRequired"))
+            if entry.get("shippingRestrictions"):
+                ruling["shippingRestrictions"].append(entry["shippingRestrictions"])
+            ruling["documents"].extend(entry.get("documentationRequired") or [])
+            if entry.get("labelingRequirements"):
+                ruling["packaging"].append(entry["labelingRequirements"])
+            ruling["carriers"].extend((carrier, rule["item"]) for carrier in entry.get("carrierRestrictions") or [])
+        elif section == "documentationRequirements":
+            ruling["documents"].extend(entry.get("requiredDocuments", []))
+        elif section == "packagingLabeling":
+            ruling["packaging"].append(entry["requirement"])
+        elif section == "taxesAndFees":
+            ruling["fees"].append(entry["category"])
+    return tuple(
+        ruling[field] if field == "ageVerification" else ordered_union(ruling[field]) for field in RULING_FIELDS
+    )
+
+
+def merge_rulings(rulings: Sequence[Tuple]) -> Tuple:
+    # one state's ruling on an item that is an instance of several canonical items
+    return tuple(
+        any(values) if field == "ageVerification" else ordered_union(*values)
+        for field, values in zip(RULING_FIELDS, zip(*rulings))
+    )
+
+
+def combine_rulings(origin: Tuple, destination: Tuple, same_state: bool) -> Dict:
+    """
+    The compliance result of a shipment from the rulings of its origin and destination states,
+    each fee and carrier restriction with the roles of the states it comes from.
+    """
+    rulings = {"origin": dict(zip(RULING_FIELDS, origin)), "destination": dict(zip(RULING_FIELDS, destination))}
+    roles = ROLES if same_state else None
+
+    def attributed(field: str) -> List[Tuple]:
+        values = ordered_union(rulings["origin"][field], rulings["destination"][field])
+        return [
+            (value, roles or tuple(role for role in ROLES if value in rulings[role][field]))
+            for value in values
+        ]
+
+    return {
+        **rulings,
+        "sameState": same_state,
+        "prohibited": bool(origin[0] or destination[0]),
+        "restricted": bool(origin[1] or destination[1]),
+        "requiredDocuments": list(ordered_union(rulings["origin"]["documents"], rulings["destination"]["documents"])),
+        "packagingRequirements": list(ordered_union(rulings["origin"]["packaging"], rulings["destination"]["packaging"])),
+        "fees": attributed("fees"),
+        "carriers": attributed("carriers"),
+    }
+
+
+def compliance_matrix(rules: Dict) -> Dict:
+    """
+    The compliance result of every origin, destination and canonical item, materialized once.
+    Rulings are evaluated per state and item, results per distinct pair of rulings; the (origin, destination,
+    item) table holds the position of the result, with one extra item for items no rule names.
+    """
+    items = list(rules["itemTokens"]) + [frozenset()]
+    rulings: List[Tuple] = []
+    ruling_ids: Dict[Tuple, int] = {}
+    state_rulings = np.zeros((len(rules["states"]), len(items)), dtype=np.int64)
+    for state, state_rules in enumerate(rules["rules"]):
+        for item, tokens in enumerate(items):
+            ruling = evaluate_rules(state_rules, tokens)
+            if ruling not in ruling_ids:
+                ruling_ids[ruling] = len(rulings)
+                rulings.append(ruling)
+            state_rulings[state, item] = ruling_ids[ruling]
+
+    # a pair of rulings, and whether both are the same state's, identifies a result
+    count = len(rulings)
+    same_state = np.eye(len(rules["states"]), dtype=np.int64)[:, :, None]
+    keys = (state_rulings[:, None, :] * count + state_rulings[None, :, :]) * 2 + same_state
+    distinct, inverse = np.unique(keys, return_inverse=True)
+    results = [
+        combine_rulings(rulings[key // 2 // count], rulings[key // 2 % count], bool(key % 2))
+        for key in distinct.tolist()
+    ]
+
+    return {
+        **rules,
+        "rulings": rulings,
+        "stateRulings": state_rulings,
+        "results": results,
+        "matrix": inverse.reshape(keys.shape).astype(np.int32),
+        "otherItem": len(items) - 1,
+    }
+
+
+def compliance_result(matrix: Dict, origin: int, destination: int, items: Sequence[int]) -> Dict:
+    """
+    The compliance result of a shipment of an item that is an instance of the given canonical items,
+    a table lookup unless it is an instance of several.
+    """
+    if len(items) <= 1:
+        item = items[0] if items else matrix["otherItem"]
+        return matrix["results"][matrix["matrix"][origin, destination, item]]
+    return combine_rulings(
+        merge_rulings([matrix["rulings"][ruling] for ruling in matrix["stateRulings"][origin, list(items)]]),
+        merge_rulings([matrix["rulings"][ruling] for ruling in matrix["stateRulings"][destination, list(items)]]),
+        origin == destination,
+    )
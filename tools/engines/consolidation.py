@@ -0,0 +1,130 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
+
+# open loads are kept in sorted chunks that are split in half beyond twice this many loads
+OPEN_LOAD_CHUNK = 256
+
+
+def normalize_address(address: str) -> str:
+    return " ".join(address.lower().replace(",", " ").split())
+
+
+def pack_orders(weights: List[float], order_ids: List[int], capacity: float) -> Tuple[List[float], List[List[int]], List[int]]:
+    """
+    Best-fit decreasing: place each order, heaviest first, into the open load with the least room
+    left that still fits it, opening a new load of `capacity` when none does.
+    Open loads are kept sorted by remaining capacity in short chunks with the largest remaining capacity
+    of each chunk alongside, so finding, taking and putting back a load only shifts one chunk.
+    Returns the weight and the orders of every load, and the orders too heavy for any load.
+    """
+    load_weights: List[float] = []
+    load_orders: List[List[int]] = []
+    oversized = []
+    rooms: List[List[float]] = []  # remaining capacities of the open loads, sorted across the chunks
+    open_loads: List[List[int]] = []  # the load positions alongside
+    largest: List[float] = []  # the largest remaining capacity of every chunk
+
+    for order_id in sorted(order_ids, key=weights.__getitem__, reverse=True):
+        weight = weights[order_id]
+        if weight > capacity:
+            oversized.append(order_id)
+            continue
+
+        chunk = bisect_left(largest, weight)
+        if chunk == len(largest):
+            remaining, load_position = capacity, len(load_weights)
+            load_weights.append(0.0)
+            load_orders.append([])
+        else:
+            chunk_rooms = rooms[chunk]
+            # of the loads with the same room left the last one, so the pop shifts the least
+            position = bisect_left(chunk_rooms, weight)
+            position = bisect_right(chunk_rooms, chunk_rooms[position], position) - 1
+            remaining, load_position = chunk_rooms.pop(position), open_loads[chunk].pop(position)
+            if chunk_rooms:
+                largest[chunk] = chunk_rooms[-1]
+            else:
+                del rooms[chunk], open_loads[chunk], largest[chunk]
+
+        load_weights[load_position] += weight
+        load_orders[load_position].append(order_id)
+        remaining -= weight
+        if remaining > 1e-9:
+            if not largest:
+                rooms.append([remaining])
+                open_loads.append([load_position])
+                largest.append(remaining)
+                continue
+            chunk = min(bisect_left(largest, remaining), len(largest) - 1)
+            chunk_rooms = rooms[chunk]
+            position = bisect_right(chunk_rooms, remaining)
+            chunk_rooms.insert(position, remaining)
+            open_loads[chunk].insert(position, load_position)
+            largest[chunk] = chunk_rooms[-1]
+            if len(chunk_rooms) > 2 * OPEN_LOAD_CHUNK:
+                rooms[chunk:chunk + 1] = [chunk_rooms[:OPEN_LOAD_CHUNK], chunk_rooms[OPEN_LOAD_CHUNK:]]
+                chunk_loads = open_loads[chunk]
+                open_loads[chunk:chunk + 1] = [chunk_loads[:OPEN_LOAD_CHUNK], chunk_loads[OPEN_LOAD_CHUNK:]]
+                largest[chunk:chunk + 1] = [chunk_rooms[OPEN_LOAD_CHUNK - 1], chunk_rooms[-1]]
+
+    return load_weights, load_orders, oversized
+
+
+def consolidate(orders: List[Dict], carriers: List[Dict], cost_per_unit: float, discount_rate: float) -> Dict:
+    """
+    Consolidate orders into carrier loads.
+
+    Orders are grouped by origin/destination lane and service type, each group is packed into loads of the
+    largest carrier capacity, and every load is then assigned the smallest carrier it fits in.
+    Loads holding two or more orders get the bulk discount, single-order loads and orders heavier than
+    every carrier ship at the full rate.
+    """
+    capacities = sorted((carrier["carrierCapacity"], carrier["carrierName"]) for carrier in carriers)
+    capacity_values = [capacity for capacity, _ in capacities]
+    largest = capacity_values[-1] if capacity_values else 0.0
+
+    weights = [order["orderWeight"] for order in orders]
+    # orders are grouped by their lane as written first, so every distinct spelling is normalized once
+    spellings: Dict[Tuple[str, str, str], List[int]] = {}
+    for order_id, order in enumerate(orders):
+        spellings.setdefault((order["originAddress"], order["destinationAddress"], order["serviceType"]), []).append(order_id)
+    groups: Dict[Tuple[str, str, str], List[int]] = {}
+    for (origin, destination, service_type), order_ids in spellings.items():
+        lane = (normalize_address(origin), normalize_address(destination), service_type.strip().lower())
+        groups.setdefault(lane, []).extend(order_ids)
+
+    loads = []
+    oversized = []
+    for lane, order_ids in groups.items():
+        load_weights, load_orders, lane_oversized = pack_orders(weights, order_ids, largest)
+        oversized.extend(lane_oversized)
+        first_order = orders[order_ids[0]]
+        lane_name = f'{first_order["originAddress"]} → {first_order["destinationAddress"]}'
+        for weight, load_order_ids in zip(load_weights, load_orders):
+            capacity, carrier = capacities[bisect_left(capacity_values, weight - 1e-9)]
+            loads.append({
+                "weight": weight,
+                "orders": load_order_ids,
+                "carrier": carrier,
+                "capacity": capacity,
+                "lane": lane_name,
+                "serviceType": first_order["serviceType"],
+            })
+
+    total_weight = sum(weights)
+    consolidated_weight = sum(load["weight"] for load in loads if len(load["orders"]) > 1)
+    consolidated_orders = sum(len(load["orders"]) for load in loads if len(load["orders"]) > 1)
+
+    cost_before = total_weight * cost_per_unit
+    cost_after = cost_before - consolidated_weight * cost_per_unit * discount_rate / 100
+
+    return {
+        "loads": loads,
+        "oversizedOrders": oversized,
+        "consolidatedOrders": consolidated_orders,
+        "consolidationRate": 100.0 * consolidated_orders / len(orders) if orders else 0.0,
+        "totalShippingCostBefore": round(cost_before, 2),
+        "totalShippingCostAfter": round(cost_after, 2),
+        "costSavings": round(cost_before - cost_after, 2),
+        "discountApplied": discount_rate if consolidated_orders else 0,
+    }
@@ -0,0 +1,296 @@
+import csv
+import math
+import os
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from .manifest_rows import MANIFEST_FORMATS, field_key, ndjson_rows
+
+# snapshot rows read and summarized at a time, the only part of a snapshot held in memory
+SNAPSHOT_CHUNK_SIZE = 10_000
+
+# column keys (as field_key normalizes them) accepted for each value of a snapshot row
+SNAPSHOT_COLUMNS = {
+    "sku": ["sku", "skuid", "itemid", "item", "productid", "partnumber"],
+    "expected": ["expected", "expectedcount", "expectedquantity", "systemquantity", "systemcount", "bookquantity"],
+    "counted": ["counted", "countedquantity", "count", "physicalcount", "actual", "actualcount"],
+    "unitCost": ["unitcost", "cost", "unitvalue", "price", "unitprice"],
+    "velocity": ["velocity", "annualusage", "annualdemand", "annualsales", "unitssold", "demand"],
+}
+
+ABC_CLASSES = ["A", "B", "C"]
+
+# share of the total annual usage value covered by the A items, and by the A and B items together
+ABC_VALUE_SHARES = (0.8, 0.95)
+
+# SKUs with the largest discrepancy value reported by name, the rest only count towards the totals
+TOP_DISCREPANCIES = 10
+
+# log-spaced bins of annual usage value the classes are cut at, 2.3% apart from one cent to ten billion
+VALUE_BIN_EDGES = np.logspace(-2, 10, 1201)
+
+# per-bin sums kept while streaming, in this order
+BIN_STATS = ("skus", "value", "expected", "counted", "overUnits", "underUnits", "discrepancyValue", "discrepant")
+
+# days between counts of each class at medium priority, and how priority shortens or stretches them
+CLASS_COUNT_INTERVAL_DAYS = np.array([30, 90, 180])
+PRIORITY_INTERVAL_FACTORS = {"high": 0.5, "medium": 1.0, "low": 1.5}
+
+FREQUENCY_DAYS = {
+    "daily": 1, "weekly": 7, "bi-weekly": 14, "biweekly": 14, "fortnightly": 14, "monthly": 30,
+    "quarterly": 91, "semi-annually": 182, "annually": 365, "yearly": 365,
+}
+
+
+def frequency_days(frequency: str) -> int:
+    normalized = frequency.strip().lower()
+    if normalized not in FREQUENCY_DAYS:
+        raise ValueError(f'Unknown cycleCountFrequency "{frequency}", expected one of: {", ".join(FREQUENCY_DAYS)}')
+    return FREQUENCY_DAYS[normalized]
+
+
+def priority_factor(priority: str) -> float:
+    normalized = priority.strip().lower()
+    if normalized not in PRIORITY_INTERVAL_FACTORS:
+        raise ValueError(f'Unknown priorityLevel "{priority}", expected one of: High, Medium, Low')
+    return PRIORITY_INTERVAL_FACTORS[normalized]
+
+
+def snapshot_columns(keys: List[str]) -> Dict[str, int]:
+    # position of the column of each snapshot value among a row's column keys, None for the ones it lacks
+    return {
+        name: next((keys.index(alias) for alias in aliases if alias in keys), None)
+        for name, aliases in SNAPSHOT_COLUMNS.items()
+    }
+
+
+def chunk_columns(chunk: List[Tuple[int, List[str]]], positions: Dict[str, int]) -> Tuple[List[int], Dict[str, List[str]]]:
+    # the rows of a CSV chunk transposed into columns, short rows padded with ""
+    width = max(len(row) for _, row in chunk)
+    rows = [row if len(row) == width else row + [""] * (width - len(row)) for _, row in chunk]
+    columns = list(zip(*rows))
+    return [number for number, _ in chunk], {
+        name: columns[position] if position is not None and position < width else [""] * len(rows)
+        for name, position in positions.items()
+    }
+
+
+def read_snapshot(
+    path: str, chunk_size: int = SNAPSHOT_CHUNK_SIZE
+) -> Iterator[Tuple[List[int], Dict[str, List[str]], List[Tuple[int, str]]]]:
+    """
+    Stream a CSV or NDJSON snapshot as chunks of (row numbers, {snapshot value: texts}, unreadable rows),
+    column by column and never holding more than one chunk of it. Rows without a column have "" for its values,
+    NDJSON lines that are not a JSON object are unreadable rows (line number, reason).
+    """
+    snapshot_format = MANIFEST_FORMATS.get(os.path.splitext(path)[1].lower())
+    if snapshot_format is None:
+        raise ValueError(f'Unsupported snapshot "{os.path.basename(path)}", expected one of: {", ".join(MANIFEST_FORMATS)}')
+
+    with open(path, newline="", encoding="utf-8-sig") as snapshot:
+        if snapshot_format == "csv":
+            reader = csv.reader(snapshot)
+            positions = snapshot_columns([field_key(name) for name in next(reader, [])])
+            chunk = []
+            for number, row in enumerate(reader, start=2):
+                if not row:
+                    continue
+                chunk.append((number, row))
+                if len(chunk) == chunk_size:
+                    yield (*chunk_columns(chunk, positions), [])
+                    chunk = []
+            if chunk:
+                yield (*chunk_columns(chunk, positions), [])
+            return
+
+        # NDJSON rows may each have their own keys, rows with the same keys share their column positions
+        positions_by_keys = {}
+        numbers = []
+        texts = {name: [] for name in SNAPSHOT_COLUMNS}
+        unreadable = []
+        for number, row in ndjson_rows(snapshot):
+            if isinstance(row, str):
+                unreadable.append((number, row))
+                continue
+            keys = tuple(row)
+            if keys not in positions_by_keys:
+                positions_by_keys[keys] = snapshot_columns([field_key(str(key)) for key in keys])
+            values = list(row.values())
+            numbers.append(number)
+            for name, position in positions_by_keys[keys].items():
+                value = values[position] if position is not None else None
+                texts[name].append("" if value is None else str(value))
+            if len(numbers) == chunk_size:
+                yield numbers, texts, unreadable
+                numbers, texts, unreadable = [], {name: [] for name in SNAPSHOT_COLUMNS}, []
+        if numbers or unreadable:
+            yield numbers, texts, unreadable
+
+
+def parse_quantity(text: str) -> float:
+    value = float(text.strip().replace(",", "").lstrip("$"))
+    # float() takes "nan" and "inf" too
+    if not math.isfinite(value):
+        raise ValueError(f'non-finite quantity "{text}"')
+    return value
+
+
+def snapshot_arrays(numbers: List[int], texts: Dict[str, List[str]]) -> Tuple[Dict[str, np.ndarray], List[Tuple[int, str]]]:
+    """
+    SKUs, expected and counted quantities, unit costs and annual usage of a chunk of snapshot rows, with the rows
+    that have no valid expected or counted quantity. Missing costs and usage are NaN.
+    """
+    skus = np.array([sku.strip() or f"row {number}" for sku, number in zip(texts["sku"], numbers)], dtype=object)
+    try:
+        # plain numbers throughout, converted in one go
+        arrays = {name: np.array([text or "nan" for text in texts[name]], dtype=float)
+                  for name in ("expected", "counted", "unitCost", "velocity")}
+        # every quantity finite, and the only NaN costs and usage the missing ones (not a "nan" or "inf" text)
+        if (
+            np.isfinite(arrays["expected"]).all()
+            and np.isfinite(arrays["counted"]).all()
+            and all(
+                not np.isinf(arrays[name]).any() and np.isnan(arrays[name]).sum() == texts[name].count("")
+                for name in ("unitCost", "velocity")
+            )
+        ):
+            return {**arrays, "sku": skus}, []
+    except ValueError:
+        pass
+
+    values = {name: [] for name in ("expected", "counted", "unitCost", "velocity")}
+    kept = []
+    rejected = []
+    for position, number in enumerate(numbers):
+        row = {}
+        error = None
+        for name in values:
+            text = texts[name][position].strip()
+            if not text:
+                if name in ("expected", "counted"):
+                    error = f"missing {name} quantity"
+                    break
+                row[name] = math.nan
+                continue
+            try:
+                row[name] = parse_quantity(text)
+            except ValueError:
+                error = f'invalid {name} "{text}"'
+                break
+        if error is not None:
+            rejected.append((number, error))
+            continue
+        for name, value in row.items():
+            values[name].append(value)
+        kept.append(position)
+
+    arrays = {name: np.array(column, dtype=float) for name, column in values.items()}
+    return {**arrays, "sku": skus[kept]}, rejected
+
+
+def usage_value(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    What a SKU is ranked by: its annual usage value, falling back to the value on hand without a usage figure
+    and to the units alone without a cost.
+    """
+    cost = np.nan_to_num(arrays["unitCost"], nan=1.0)
+    usage = np.where(np.isnan(arrays["velocity"]), arrays["expected"], arrays["velocity"])
+    return np.clip(usage, 0, None) * np.clip(cost, 0, None)
+
+
+def bin_totals(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    # the BIN_STATS of a chunk summed per value bin, as a (stats, bins) array
+    value = usage_value(arrays)
+    bins = np.searchsorted(VALUE_BIN_EDGES, value, side="right")
+    difference = arrays["counted"] - arrays["expected"]
+    cost = np.nan_to_num(arrays["unitCost"], nan=0.0)
+    weights = (
+        np.ones_like(value),
+        value,
+        arrays["expected"],
+        arrays["counted"],
+        np.clip(difference, 0, None),
+        np.clip(-difference, 0, None),
+        np.abs(difference) * cost,
+        (difference != 0).astype(float),
+    )
+    return np.array([np.bincount(bins, weights=weight, minlength=len(VALUE_BIN_EDGES) + 1) for weight in weights])
+
+
+def largest_discrepancies(arrays: Dict[str, np.ndarray], top: List[Tuple[float, str, float, float]]) -> List:
+    # the TOP_DISCREPANCIES (discrepancy value, sku, expected, counted) of a chunk and the ones found so far,
+    # units without a unit cost are valued at one
+    value = np.abs(arrays["counted"] - arrays["expected"]) * np.nan_to_num(arrays["unitCost"], nan=1.0)
+    largest = np.argsort(-value)[:TOP_DISCREPANCIES]
+    candidates = top + [
+        (float(value[row]), arrays["sku"][row], float(arrays["expected"][row]), float(arrays["counted"][row]))
+        for row in largest if value[row] > 0
+    ]
+    return sorted(candidates, key=lambda candidate: -candidate[0])[:TOP_DISCREPANCIES]
+
+
+def summarize_snapshot(path: str, max_rejections: int = 100) -> Dict:
+    """
+    Stream a CSV or NDJSON snapshot of expected and counted quantities per SKU into per-value-bin totals
+    and the SKUs with the largest discrepancies. Memory stays bounded by the chunk size and the fixed
+    number of bins, whatever the size of the snapshot.
+    """
+    totals = np.zeros((len(BIN_STATS), len(VALUE_BIN_EDGES) + 1))
+    top = []
+    rows = rejected = 0
+    rejections = []
+    for numbers, texts, unreadable in read_snapshot(path):
+        rows += len(numbers) + len(unreadable)
+        arrays, chunk_rejections = snapshot_arrays(numbers, texts)
+        chunk_rejections = sorted(unreadable + chunk_rejections)
+        rejected += len(chunk_rejections)
+        rejections.extend(chunk_rejections[:max_rejections - len(rejections)])
+        if len(arrays["expected"]):
+            totals += bin_totals(arrays)
+            top = largest_discrepancies(arrays, top)
+    return {"totals": totals, "largestDiscrepancies": top, "rowsRead": rows, "rowsRejected": rejected,
+            "rejections": rejections}
+
+
+def abc_classes(totals: np.ndarray) -> np.ndarray:
+    """
+    Class (0 for A, 1 for B, 2 for C) of every value bin: from the most valuable bin down, bins are A until
+    they cover ABC_VALUE_SHARES[0] of the total value, then B until ABC_VALUE_SHARES[1], then C.
+    Class boundaries fall on bin edges.
+    """
+    value = totals[BIN_STATS.index("value")]
+    total = value.sum()
+    if total <= 0:
+        return np.full(len(value), len(ABC_CLASSES) - 1)
+    # share of the total value in bins more valuable than each bin
+    above = (total - np.cumsum(value)) / total
+    return np.searchsorted(ABC_VALUE_SHARES, above, side="right")
+
+
+def class_totals(totals: np.ndarray, classes: np.ndarray) -> Dict[str, np.ndarray]:
+    # the BIN_STATS of every class, as arrays over ABC_CLASSES
+    summed = np.array([totals[:, classes == position].sum(axis=1) for position in range(len(ABC_CLASSES))])
+    return {stat: summed[:, position] for position, stat in enumerate(BIN_STATS)}
+
+
+def count_schedule(classes: Dict[str, np.ndarray], cycle_days: int, factor: float) -> Dict:
+    """
+    Days between counts of each class, a whole number of count cycles and never less than one,
+    SKUs with a discrepancy recounted on the next cycle, and the SKUs counted per cycle on average.
+    """
+    cycles = np.maximum(np.ceil(CLASS_COUNT_INTERVAL_DAYS * factor / cycle_days), 1)
+    intervals = cycles * cycle_days
+    return {
+        "intervalDays": intervals.astype(int),
+        "recountSkus": int(classes["discrepant"].sum()),
+        "skusPerCycle": float((classes["skus"] / cycles).sum()),
+    }
+
+
+def period(days: int) -> str:
+    # "5 days", "2 weeks", "3 months"
+    if days >= 60:
+        months = round(days / 30)
+        return f"{months} months"
+    if days >= 14 and days % 7 == 0:
+        return f"{days // 7} weeks"
+    return f"{days} day" + ("s" if days != 1 else "")
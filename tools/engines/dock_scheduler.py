@@ -0,0 +1,192 @@
+import heapq
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+# units one worker moves from a truck onto the dock, or from the dock into a truck, per hour
+UNITS_PER_WORKER_HOUR = 100.0
+
+# load types handled first, in this order; anything else follows in arrival order
+LOAD_TYPE_RANKS = {"perishable": 0, "fragile": 1, "special": 2}
+
+TIME_FORMATS = ("%Y-%m-%d %I:%M %p", "%Y-%m-%d %H:%M")
+
+
+def parse_time(value: str) -> datetime:
+    """
+    Parse a "YYYY-MM-DD HH:MM AM/PM" time (24-hour "YYYY-MM-DD HH:MM" is accepted as well).
+    """
+    normalized = " ".join(value.upper().replace(".", "").split())
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(normalized, time_format)
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid time "{value}", expected "YYYY-MM-DD HH:MM AM/PM"')
+
+
+def load_rank(load_type: str) -> int:
+    return LOAD_TYPE_RANKS.get(load_type.strip().lower(), len(LOAD_TYPE_RANKS))
+
+
+def hours(delta: timedelta) -> float:
+    return delta.total_seconds() / 3600
+
+
+def unload(incoming: List[Dict], docks: int, crew: int, delay: timedelta) -> List[Dict]:
+    """
+    Discrete-event simulation of the inbound docks. Whenever a dock frees up, the waiting truck
+    with the most urgent load type goes next, earliest arrival first within a type.
+    """
+    trucks = sorted(
+        (
+            {
+                "index": index,
+                "loadType": truck["loadType"],
+                "quantity": truck["quantity"],
+                "arrival": parse_time(truck["arrivalTime"]),
+                "adjustedArrival": parse_time(truck["arrivalTime"]) + delay,
+            }
+            for index, truck in enumerate(incoming)
+        ),
+        key=lambda truck: truck["adjustedArrival"],
+    )
+
+    free_docks = [(datetime.min, dock) for dock in range(docks)]  # (free from, dock), a heap
+    waiting = []  # (load rank, arrival, index, truck), a heap
+    position = 0
+    while position < len(trucks) or waiting:
+        free_from, dock = heapq.heappop(free_docks)
+        # the dock takes the next truck once it is free and a truck is there
+        if not waiting:
+            free_from = max(free_from, trucks[position]["adjustedArrival"])
+        while position < len(trucks) and trucks[position]["adjustedArrival"] <= free_from:
+            truck = trucks[position]
+            heapq.heappush(waiting, (load_rank(truck["loadType"]), truck["adjustedArrival"], truck["index"], truck))
+            position += 1
+
+        truck = heapq.heappop(waiting)[-1]
+        truck["dock"] = dock
+        truck["start"] = max(free_from, truck["adjustedArrival"])
+        truck["finish"] = truck["start"] + timedelta(hours=truck["quantity"] / (crew * UNITS_PER_WORKER_HOUR))
+        heapq.heappush(free_docks, (truck["finish"], dock))
+
+    return sorted(trucks, key=lambda truck: truck["index"])
+
+
+def allocate(
+    unloaded: List[Dict], outbound: List[Dict], crew: int, delay: timedelta
+) -> Tuple[List[Dict], Counter, Counter]:
+    """
+    Fill the outbound trucks in departure order with the goods on the dock by their departure,
+    most urgent load type first, splitting loads across trucks where needed.
+    Goods that are left on the dock are returned by load type in two parts: those that were
+    ready for a truck that filled up without them, and those unloaded too late for every truck.
+    """
+    goods = sorted(unloaded, key=lambda truck: truck["finish"])
+    trucks = sorted(
+        (
+            {
+                "index": index,
+                "departure": parse_time(truck["departureTime"]),
+                "capacity": truck["capacity"],
+                "load": 0.0,
+                "composition": Counter(),
+            }
+            for index, truck in enumerate(outbound)
+        ),
+        key=lambda truck: truck["departure"],
+    )
+
+    rate = crew * UNITS_PER_WORKER_HOUR
+    ready = []  # (load rank, ready at, inbound index, remaining quantity, load type), a heap
+    position = 0
+    crowded = set()  # inbound indexes of the goods a full truck left behind
+    for truck in trucks:
+        while position < len(goods) and goods[position]["finish"] <= truck["departure"]:
+            item = goods[position]
+            heapq.heappush(ready, (load_rank(item["loadType"]), item["finish"], item["index"], item["quantity"], item["loadType"]))
+            position += 1
+
+        loaded = []  # (ready at, quantity) moved into this truck
+        too_late = []
+        while ready and truck["capacity"] - truck["load"] > 1e-9:
+            rank, ready_at, index, quantity, load_type = heapq.heappop(ready)
+            moved = min(quantity, truck["capacity"] - truck["load"])
+            # goods that cannot be loaded before the truck leaves wait for a later one
+            if ready_at + timedelta(hours=moved / rate) > truck["departure"]:
+                too_late.append((rank, ready_at, index, quantity, load_type))
+                continue
+            truck["load"] += moved
+            truck["composition"][load_type] += moved
+            loaded.append((ready_at, moved))
+            if quantity - moved > 1e-9:
+                heapq.heappush(ready, (rank, ready_at, index, quantity - moved, load_type))
+        if truck["capacity"] - truck["load"] <= 1e-9:
+            crowded.update(index for _, _, index, _, _ in ready)
+        for item in too_late:
+            heapq.heappush(ready, item)
+
+        # the crew loads the goods as they come off the inbound trucks
+        finish = None
+        for ready_at, moved in sorted(loaded):
+            finish = max(finish or ready_at, ready_at) + timedelta(hours=moved / rate)
+        truck["loadingHours"] = truck["load"] / rate
+        truck["adjustedDeparture"] = (max(truck["departure"], finish) if finish else truck["departure"]) + delay
+
+    no_capacity, too_late = Counter(), Counter()
+    for _, _, index, quantity, load_type in ready:
+        (no_capacity if index in crowded else too_late)[load_type] += quantity
+    for item in goods[position:]:
+        too_late[item["loadType"]] += item["quantity"]
+
+    return sorted(trucks, key=lambda truck: truck["index"]), no_capacity, too_late
+
+
+def schedule_dock(
+    incoming: List[Dict], outbound: List[Dict], docks: int, labor: int, delay_hours: float = 0.0
+) -> Dict:
+    """
+    Schedule a cross-dock: unload the inbound trucks on the available docks, transfer their goods
+    to the outbound trucks and work out dock utilization, labor use and the adjusted timeline.
+    Traffic and weather are expected to hold up inbound arrivals and outbound trucks by `delay_hours`.
+    """
+    if docks < 1 or labor < 1:
+        raise ValueError("docksAvailable and laborAvailable must be at least 1")
+
+    # every dock in use needs a crew, the workers are split evenly between them
+    docks_used = min(docks, labor)
+    crew = labor // docks_used
+
+    delay = timedelta(hours=delay_hours)
+    unloaded = unload(incoming, docks_used, crew, delay)
+    departures, no_capacity, too_late = allocate(unloaded, outbound, crew, delay)
+
+    times = [truck["adjustedArrival"] for truck in unloaded] + [truck["finish"] for truck in unloaded]
+    times += [truck["departure"] for truck in departures] + [truck["adjustedDeparture"] for truck in departures]
+    window = hours(max(times) - min(times)) if times else 0.0
+
+    busy = [0.0] * docks
+    for truck in unloaded:
+        busy[truck["dock"]] += hours(truck["finish"] - truck["start"])
+
+    unloading = crew * sum(busy)
+    loading = crew * sum(truck["loadingHours"] for truck in departures)
+
+    return {
+        "inbound": unloaded,
+        "outbound": departures,
+        "unallocated": dict(no_capacity + too_late),
+        "noCapacity": dict(no_capacity),
+        "tooLate": dict(too_late),
+        "crew": crew,
+        "docksUsed": docks_used,
+        "windowHours": window,
+        "dockBusyHours": busy,
+        "laborHours": {
+            "Unloading": unloading,
+            "Loading": loading,
+            "Idle": max(0.0, labor * window - unloading - loading),
+        },
+        "day": min(times).replace(hour=0, minute=0) if times else None,
+    }
@@ -0,0 +1,82 @@
+from typing import Dict
+import numpy as np
+
+# deliveries per week the curve is evaluated for, up to twice a day
+MAX_FREQUENCY = 14
+
+# parcels a route carries at the current frequency; the weekly volume stays the same at other frequencies
+PARCELS_PER_ROUTE = 50.0
+
+# running cost of a delivery route per kilometer
+COST_PER_KM = 1.2
+
+# cost of a parcel waiting one more day for its delivery, as a share of the parcel cost
+DELAY_COST_SHARES = {"standard": 0.05, "express": 0.25, "critical": 1.0}
+
+WEEKS_PER_MONTH = 52 / 12
+WEEKS_PER_YEAR = 52
+
+
+def delay_cost_share(urgency_level: str) -> float:
+    return DELAY_COST_SHARES.get(urgency_level.strip().lower(), DELAY_COST_SHARES["standard"])
+
+
+def frequency_costs(
+    frequency: np.ndarray,
+    parcel_cost: np.ndarray,
+    distance: np.ndarray,
+    delay_share: np.ndarray,
+    frequencies: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Weekly cost curves of n delivery lanes, each described by its current deliveries per week,
+    average parcel cost, route distance and delay cost share (arrays of shape (n,)),
+    evaluated at every one of `frequencies` at once. Every curve has shape (n, len(frequencies)).
+
+    A week's cost is the handling of the parcels, which does not depend on the frequency, plus one
+    route run per delivery, plus the cost of parcels waiting half the interval between deliveries
+    on average. The handling cost is what is left of the current cost per parcel after the other two.
+    """
+    frequency = np.asarray(frequency, dtype=float)[:, None]
+    parcel_cost = np.asarray(parcel_cost, dtype=float)[:, None]
+    distance = np.asarray(distance, dtype=float)[:, None]
+    delay_share = np.asarray(delay_share, dtype=float)[:, None]
+    grid = np.asarray(frequencies, dtype=float)[None, :]
+
+    parcels = PARCELS_PER_ROUTE * frequency
+    route_cost = distance * COST_PER_KM
+    daily_delay = parcels * parcel_cost * delay_share
+
+    def transport(runs):
+        return runs * route_cost + daily_delay * 3.5 / runs
+
+    current = parcels * parcel_cost
+    handling = np.maximum(current - transport(frequency), 0.0)
+    total = handling + transport(grid)
+    current_total = handling + transport(frequency)
+
+    return {
+        "totalCost": total,
+        "costDifference": np.diff(total, axis=1, prepend=total[:, :1]),
+        "savingsPotential": current_total - total,
+        "averageCostPerParcel": total / parcels,
+        "totalDistanceCovered": grid * distance,
+        "currentCost": current_total[:, 0],
+    }
+
+
+def optimal_frequencies(frequency, parcel_cost, distance, delay_share, frequencies=None) -> Dict[str, np.ndarray]:
+    """
+    The cheapest frequency of every lane with its weekly cost and savings, alongside the full curves.
+    """
+    frequencies = np.arange(1, MAX_FREQUENCY + 1) if frequencies is None else np.asarray(frequencies)
+    curves = frequency_costs(frequency, parcel_cost, distance, delay_share, frequencies)
+    best = np.argmin(curves["totalCost"], axis=1)
+    rows = np.arange(len(best))
+    return {
+        **curves,
+        "frequencies": frequencies,
+        "optimalFrequency": frequencies[best],
+        "optimalCost": curves["totalCost"][rows, best],
+        "weeklySavings": curves["savingsPotential"][rows, best],
+    }
@@ -0,0 +1,115 @@
+import math
+from typing import Dict
+import numpy as np
+
+DAYS_PER_MONTH = 365 / 12
+
+# lead times drawn for a path are capped at this many days
+MAX_LEAD_TIME_DAYS = 120
+
+# safety stock of the base stock target, in standard deviations of demand over the lead time (95% service)
+SERVICE_LEVEL_Z = 1.645
+
+
+def lead_times(rng: np.random.Generator, paths: int, mean_days: float, cv: float) -> np.ndarray:
+    # lognormal lead time of every path in whole days, with the given mean and coefficient of variation
+    sigma = math.sqrt(math.log(1 + cv ** 2))
+    drawn = rng.lognormal(math.log(mean_days) - sigma ** 2 / 2, sigma, size=paths)
+    return np.clip(np.rint(drawn), 1, MAX_LEAD_TIME_DAYS).astype(np.int64)
+
+
+def daily_demand(rng: np.random.Generator, paths: int, days: int, mean: float, cv: float) -> np.ndarray:
+    # gamma distributed demand of every day and path, with the given mean and coefficient of variation
+    if mean <= 0:
+        return np.zeros((days, paths))
+    shape = 1 / cv ** 2
+    return rng.gamma(shape, mean / shape, size=(days, paths))
+
+
+def simulate_inventory(
+    monthly_demand: float,
+    initial_inventory: float,
+    monthly_capacity: float,
+    warehouse_capacity: float,
+    lead_time_days: float,
+    lead_time_cv: float,
+    demand_cv: float,
+    paths: int = 10_000,
+    days: int = 365,
+    seed: int = 0,
+) -> Dict:
+    """
+    Monte Carlo simulation of a just-in-time pull system, every path at once: each day the stock on hand
+    serves the demand (demand it cannot serve is lost) and production is ordered up to a base stock target
+    on the inventory position, at most the daily production capacity, arriving after the path's lead time.
+    The pipeline starts full with a day of demand per day of lead time. Paths are reproducible for a seed.
+    """
+    if min(monthly_demand, initial_inventory, monthly_capacity, warehouse_capacity) < 0:
+        raise ValueError("Demand, inventory and capacities must not be negative")
+
+    rng = np.random.default_rng(seed)
+    mean = monthly_demand / DAYS_PER_MONTH
+    capacity = monthly_capacity / DAYS_PER_MONTH
+    demand = daily_demand(rng, paths, days, mean, demand_cv)
+    lead = lead_times(rng, paths, lead_time_days, lead_time_cv)
+    cover = lead_time_days + 1
+    target = mean * cover + SERVICE_LEVEL_Z * mean * demand_cv * math.sqrt(cover)
+
+    # arrivals and demand are (day, path) so that every day is one contiguous row
+    columns = np.arange(paths)
+    arrivals = np.zeros((days + MAX_LEAD_TIME_DAYS + 1, paths))
+    arrivals[:MAX_LEAD_TIME_DAYS + 1] = np.where(
+        np.arange(MAX_LEAD_TIME_DAYS + 1)[:, None] < lead[None, :], min(mean, capacity), 0.0
+    )
+    pipeline = arrivals.sum(axis=0)
+    on_hand = np.full(paths, float(initial_inventory))
+
+    month_ends = np.minimum(np.rint(DAYS_PER_MONTH * np.arange(1, 13)).astype(np.int64) - 1, days - 1)
+    month_end_inventory = np.zeros((paths, len(month_ends)))
+    stockout_days = np.zeros(paths)
+    lost = np.zeros(paths)
+    produced = np.zeros(paths)
+    peak = on_hand.copy()
+    over_capacity_days = np.zeros(paths)
+    over_capacity_units = np.zeros(paths)
+
+    month = 0
+    for day in range(days):
+        on_hand += arrivals[day]
+        pipeline -= arrivals[day]
+        np.maximum(peak, on_hand, out=peak)
+        excess = on_hand - warehouse_capacity
+        over_capacity_days += excess > 0
+        np.maximum(over_capacity_units, excess, out=over_capacity_units)
+
+        served = np.minimum(on_hand, demand[day])
+        short = demand[day] - served
+        stockout_days += short > 1e-9
+        lost += short
+        on_hand -= served
+
+        order = np.clip(target - on_hand - pipeline, 0, capacity)
+        arrivals[day + lead, columns] += order
+        pipeline += order
+        produced += order
+
+        if month < len(month_ends) and day == month_ends[month]:
+            month_end_inventory[:, month] = on_hand
+            month += 1
+
+    total_demand = demand.sum(axis=0)
+    return {
+        "paths": paths,
+        "days": days,
+        "target": target,
+        "leadTimes": lead,
+        "monthEndInventory": month_end_inventory[:, :month],
+        "demand": total_demand,
+        "stockoutDays": stockout_days,
+        "lostUnits": lost,
+        "fillRate": np.divide(total_demand - lost, total_demand, out=np.ones(paths), where=total_demand > 0),
+        "capacityUtilization": produced / (capacity * days) if capacity > 0 else np.zeros(paths),
+        "peakInventory": peak,
+        "overCapacityDays": over_capacity_days,
+        "overCapacityUnits": over_capacity_units,
+    }
@@ -0,0 +1,33 @@
+from typing import Dict
+import numpy as np
+
+
+def discount_rates(index: Dict, quantities: np.ndarray) -> np.ndarray:
+    """
+    Bulk discount of each quantity as a fraction, from the tier whose range it falls in.
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    if not len(index["tierStarts"]):
+        return np.zeros_like(quantities)
+    tier = np.searchsorted(index["tierStarts"], quantities, side="right") - 1
+    return np.where(tier >= 0, index["tierDiscounts"][np.clip(tier, 0, None)], 0.0) / 100
+
+
+def label_costs(index: Dict, size: str, quantities: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Cost of printing each quantity of labels of a size on each material, as (quantities, materials) arrays.
+    A label costs its size plus its material, less the bulk discount of the whole quantity.
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    if np.any(quantities < 1):
+        raise ValueError("numberOfLabels must be at least 1")
+
+    list_price = index["sizes"][size]["costPerLabel"] + index["materialCosts"]
+    discount = discount_rates(index, quantities)
+    per_label = list_price[None, :] * (1 - discount[:, None])
+    return {
+        "listPrice": list_price,
+        "discount": discount,
+        "perLabel": per_label,
+        "total": per_label * quantities[:, None],
+    }
@@ -0,0 +1,314 @@
+import csv
+import multiprocessing
+import os
+import re
+import textwrap
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Union
+from .manifest_rows import MANIFEST_FORMATS, field_key, ndjson_rows
+
+# dots per inch of a standard thermal label printer, and PDF points per inch
+PRINTER_DPI = 203
+POINTS_PER_INCH = 72
+
+# labels rendered by one worker task at most (a single row can exceed it only up to MAX_PIECES);
+# chunks in flight are bounded by the pool size
+CHUNK_LABELS = 1000
+CHUNKS_PER_WORKER = 2
+
+# labels printed for a single manifest row at most
+MAX_PIECES = 999
+
+
+def parse_dimensions(text: str) -> Tuple[float, float]:
+    """
+    "4x6 inches" -> (4.0, 6.0), width first.
+    """
+    match = re.search(r"(\d+(?:\.\d+)?)\s*[x×]\s*(\d+(?:\.\d+)?)", text)
+    if match is None:
+        raise ValueError(f'Unrecognized label size "{text}"')
+    return float(match.group(1)), float(match.group(2))
+
+
+def field_title(name: str) -> str:
+    # "destinationBarcode" -> "Destination Barcode"
+    return " ".join(word.capitalize() for word in re.findall(r"[a-z0-9]+|[A-Z][a-z0-9]*", name))
+
+
+def read_manifest(path: str, chunk_labels: int = CHUNK_LABELS) -> Iterator[List[Tuple[int, Union[Dict[str, str], str]]]]:
+    """
+    Stream a CSV or NDJSON manifest as chunks of (row number, {column key: value}), or (row number, reason)
+    for a line that cannot be read, never holding more than one chunk of it. Chunks are cut by the labels
+    their rows print, so no chunk renders more than chunk_labels labels unless a single row does.
+    """
+    manifest_format = MANIFEST_FORMATS.get(os.path.splitext(path)[1].lower())
+    if manifest_format is None:
+        raise ValueError(f'Unsupported manifest "{os.path.basename(path)}", expected one of: {", ".join(MANIFEST_FORMATS)}')
+
+    with open(path, newline="", encoding="utf-8-sig") as manifest:
+        if manifest_format == "csv":
+            rows = enumerate(csv.DictReader(manifest), start=2)
+        else:
+            rows = ndjson_rows(manifest)
+
+        chunk = []
+        chunk_pieces = 0
+        for number, row in rows:
+            if not isinstance(row, str):
+                row = {field_key(str(name)): "" if value is None else str(value).strip()
+                       for name, value in row.items() if name is not None}
+            row_pieces = labels_of(row)
+            if chunk and chunk_pieces + row_pieces > chunk_labels:
+                yield chunk
+                chunk = []
+                chunk_pieces = 0
+            chunk.append((number, row))
+            chunk_pieces += row_pieces
+        if chunk:
+            yield chunk
+
+
+def label_fields(row: Dict[str, str], layout: Dict) -> List[Tuple[str, str, bool]]:
+    """
+    (title, value, is barcode) of every mandatory field of a manifest row, in the carrier's order.
+    Barcodes the manifest leaves out encode the tracking number. Raises ValueError for a missing field.
+    """
+    fields = []
+    missing = []
+    for name in layout["mandatoryFields"]:
+        value = row.get(field_key(name), "")
+        barcode = "barcode" in field_key(name)
+        if not value and barcode:
+            value = row.get("trackingnumber", "")
+        if not value:
+            missing.append(name)
+        fields.append((field_title(name), value, barcode))
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    return fields
+
+
+def pieces(row: Dict[str, str]) -> int:
+    # multi-piece shipments get a label per piece, marked "1 of 3" and so on
+    value = row.get("pieces") or row.get("packagecount") or "1"
+    try:
+        return min(max(int(float(value)), 1), MAX_PIECES)
+    except ValueError:
+        raise ValueError(f'invalid pieces "{value}"')
+
+
+def labels_of(row: Union[Dict[str, str], str]) -> int:
+    # labels a manifest row prints, one for a row that will be rejected
+    if isinstance(row, str):
+        return 1
+    try:
+        return pieces(row)
+    except ValueError:
+        return 1
+
+
+def zpl_text(value: str) -> str:
+    # field data is hex-escaped with ^FH_, so the control characters cannot end it early
+    return value.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def render_zpl(fields: List[Tuple[str, str, bool]], piece: int, total: int, layout: Dict) -> str:
+    width, height = layout["dots"]
+    margin = 40
+    lines = [f"^XA^CI28^PW{width}^LL{height}^CF0,28"]
+    y = margin
+    for title, value, barcode in fields:
+        if barcode:
+            lines.append(f"^FO{margin},{y}^BY3^BCN,{min(160, height // 6)},Y,N,N^FH_^FD{zpl_text(value)}^FS")
+            y += min(160, height // 6) + 60
+        else:
+            lines.append(f"^FO{margin},{y}^FB{width - 2 * margin},3,0,L,0^FH_^FD{zpl_text(title)}: {zpl_text(value)}^FS")
+            y += 100
+    if total > 1:
+        lines.append(f"^FO{margin},{height - margin - 40}^A0N,36,36^FDPackage {piece} of {total}^FS")
+    lines.append("^XZ\n")
+    return "\n".join(lines)
+
+
+def pdf_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf_page(fields: List[Tuple[str, str, bool]], piece: int, total: int, layout: Dict) -> bytes:
+    width, height = layout["points"]
+    margin = 18
+    size = 10
+    columns = max(10, int((width - 2 * margin) / (size * 0.55)))
+    commands = [f"BT /F1 {size} Tf {size + 4} TL {margin} {height - margin - size} Td"]
+    for title, value, barcode in fields:
+        if barcode:
+            # barcodes are only drawn by the printer itself (ZPL); the page shows the encoded value
+            commands.append(f"({pdf_text(title)}:) Tj T* /F1 {size + 6} Tf ({pdf_text(value)}) Tj T* /F1 {size} Tf")
+        else:
+            for line in textwrap.wrap(f"{title}: {value}", columns)[:3]:
+                commands.append(f"({pdf_text(line)}) Tj T*")
+        commands.append("T*")
+    if total > 1:
+        commands.append(f"/F1 {size + 4} Tf (Package {piece} of {total}) Tj")
+    commands.append("ET")
+    return "\n".join(commands).encode("cp1252", "replace")
+
+
+def render_chunk(chunk: List[Tuple[int, Union[Dict[str, str], str]]], layout: Dict) -> Tuple[List, List[Tuple[int, str]], int]:
+    """
+    Render one chunk of manifest rows in a worker process: ZPL text, or one PDF content stream per page,
+    with the rows that could not be labelled and the number of labels.
+    """
+    rendered = []
+    rejected = []
+    labels = 0
+    for number, row in chunk:
+        if isinstance(row, str):
+            rejected.append((number, row))
+            continue
+        try:
+            fields = label_fields(row, layout)
+            total = pieces(row)
+        except ValueError as error:
+            rejected.append((number, str(error)))
+            continue
+        for piece in range(1, total + 1):
+            if layout["format"] == "ZPL":
+                rendered.append(render_zpl(fields, piece, total, layout))
+            else:
+                rendered.append(render_pdf_page(fields, piece, total, layout))
+        labels += total
+    if layout["format"] == "ZPL":
+        rendered = ["".join(rendered).encode("utf-8")]
+    return rendered, rejected, labels
+
+
+class PdfWriter:
+    """
+    Writes a PDF one page at a time, keeping only the object offsets in memory.
+    Objects 1-3 are the catalog, the page tree and the font; pages follow as content and page objects.
+    """
+
+    def __init__(self, output, width: float, height: float):
+        self.output = output
+        self.width = width
+        self.height = height
+        self.offsets = {}
+        self.pages = 0
+        self.output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    def write_object(self, number: int, body: bytes):
+        self.offsets[number] = self.output.tell()
+        self.output.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def add_page(self, content: bytes):
+        contents = 4 + 2 * self.pages
+        self.write_object(contents, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        self.write_object(contents + 1, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.width:g} {self.height:g}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {contents} 0 R >>"
+        ).encode())
+        self.pages += 1
+
+    def close(self):
+        self.offsets[2] = self.output.tell()
+        self.output.write(b"2 0 obj\n<< /Type /Pages /Kids [")
+        for page in range(self.pages):
+            self.output.write(f"{5 + 2 * page} 0 R ".encode())
+        self.output.write(f"] /Count {self.pages} >>\nendobj\n".encode())
+        self.write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref = self.output.tell()
+        size = max(self.offsets) + 1
+        self.output.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for number in range(1, size):
+            self.output.write(f"{self.offsets[number]:010d} 00000 n \n".encode())
+        self.output.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+# worker processes shared by every rendering request, started on first use
+render_pool = None
+render_pool_lock = threading.Lock()
+
+
+def shared_pool(workers: int) -> ProcessPoolExecutor:
+    global render_pool
+    with render_pool_lock:
+        if render_pool is None:
+            # spawned rather than forked, the server process runs threads
+            render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return render_pool
+
+
+def render_labels(manifest_path: str, output_path: str, layout: Dict, workers: int, max_rejections: int = 100) -> Dict:
+    """
+    Render every row of a manifest to a ZPL or PDF file. Chunks of rows are rendered across a process
+    pool and written in manifest order as they complete, with at most CHUNKS_PER_WORKER chunks per worker
+    read or rendered but not yet written. The file only appears under output_path once it is complete.
+    """
+    workers = max(1, workers)
+    started = time.perf_counter()
+    rows = labels = rejected = 0
+    rejections = []
+    partial = output_path + ".part"
+
+    def write(result, output, writer):
+        nonlocal labels, rejected
+        rendered, chunk_rejections, chunk_labels = result
+        if layout["format"] == "ZPL":
+            output.write(rendered[0])
+        else:
+            for page in rendered:
+                writer.add_page(page)
+        labels += chunk_labels
+        rejected += len(chunk_rejections)
+        rejections.extend(chunk_rejections[:max_rejections - len(rejections)])
+
+    try:
+        pool = shared_pool(workers)
+        with open(partial, "wb") as output:
+            writer = PdfWriter(output, *layout["points"]) if layout["format"] == "PDF" else None
+            pending = deque()
+            for chunk in read_manifest(manifest_path):
+                rows += len(chunk)
+                pending.append(pool.submit(render_chunk, chunk, layout))
+                if len(pending) >= workers * CHUNKS_PER_WORKER:
+                    write(pending.popleft().result(), output, writer)
+            while pending:
+                write(pending.popleft().result(), output, writer)
+            if writer is not None:
+                writer.close()
+        os.replace(partial, output_path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rowsRead": rows,
+        "labelsRendered": labels,
+        "rowsRejected": rejected,
+        "rejections": rejections,
+        "elapsedSeconds": elapsed,
+        "labelsPerSecond": labels / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def label_layout(requirements: Dict, output_format: str, extra_fields: List[str] = ()) -> Dict:
+    """
+    What the workers need to render a carrier's labels: its mandatory fields and label size in dots and points.
+    """
+    width, height = parse_dimensions(requirements["labelSize"])
+    fields = list(requirements["mandatoryFields"])
+    fields += [name for name in extra_fields if field_key(name) not in {field_key(field) for field in fields}]
+    return {
+        "format": output_format,
+        "mandatoryFields": fields,
+        "dots": (round(width * PRINTER_DPI), round(height * PRINTER_DPI)),
+        "points": (width * POINTS_PER_INCH, height * POINTS_PER_INCH),
+    }
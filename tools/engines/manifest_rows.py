@@ -0,0 +1,24 @@
+import json
+import re
+from typing import Dict, Iterator, Tuple, Union
+
+# file extensions of the CSV and NDJSON uploads the engines stream row by row
+MANIFEST_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def field_key(name: str) -> str:
+    # "Tracking Number", "tracking_number" and "trackingNumber" name the same column
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def ndjson_rows(manifest) -> Iterator[Tuple[int, Union[Dict, str]]]:
+    # (line number, object) of every line, or the reason the line is not one
+    for number, line in enumerate(manifest, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, "is not valid JSON"
+            continue
+        yield number, row if isinstance(row, dict) else "is not a JSON object"
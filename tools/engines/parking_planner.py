@@ -0,0 +1,58 @@
+from typing import Dict
+import numpy as np
+
+# minutes a delivery stop keeps the vehicle parked
+STOP_MINUTES = 15
+
+# chance of finding a free loading zone at each congestion level (Low, Moderate, High);
+# loading zones have limited availability at peak hours, the vehicle pays the meter when none is free
+LOADING_ZONE_AVAILABILITY = np.array([0.9, 0.6, 0.25])
+
+# minutes lost to traffic and searching for a space per stop at each congestion level, and their cost
+CONGESTION_DELAY_MINUTES = np.array([0.0, 5.0, 12.0])
+DRIVER_COST_PER_HOUR = 30.0
+
+# cost of moving a stop one slot away from its requested time, so equal plans keep the requested times
+SHIFT_COST_PER_SLOT = 0.05
+
+
+def slot_costs(rates: np.ndarray, congestion: np.ndarray, loading_zone_minutes: int) -> Dict[str, np.ndarray]:
+    """
+    Expected parking fee of a stop in each zone (rates, shape (n,)) in every slot of the day
+    (congestion levels, shape (slots,)) as an (n, slots) array, and the congestion cost of every slot.
+    """
+    meter = np.asarray(rates, dtype=float)[:, None] * STOP_MINUTES / 60
+    available = LOADING_ZONE_AVAILABILITY[congestion] if STOP_MINUTES <= loading_zone_minutes else np.zeros(len(congestion))
+    return {
+        "fees": meter * (1 - available)[None, :],
+        "congestion": CONGESTION_DELAY_MINUTES[congestion] * DRIVER_COST_PER_HOUR / 60,
+    }
+
+
+def plan_slots(costs: np.ndarray, requested: np.ndarray, earliest: np.ndarray, latest: np.ndarray) -> np.ndarray:
+    """
+    Dynamic program over the slots of the day: the slot of every stop, in the given stop order and never
+    earlier than the slot of the previous stop, each within [earliest, latest] of its own, that minimizes
+    the total of costs (shape (n, slots)) plus the shift cost. The requested slots must be non-decreasing.
+    """
+    stops, slot_count = costs.shape
+    columns = np.arange(slot_count)
+    allowed = (columns[None, :] >= earliest[:, None]) & (columns[None, :] <= latest[:, None])
+    total = np.where(allowed, costs + SHIFT_COST_PER_SLOT * np.abs(columns[None, :] - requested[:, None]), np.inf)
+
+    best = np.empty((stops, slot_count))
+    # for every stop and slot, the slot of the previous stop the best plan came from
+    came_from = np.zeros((stops, slot_count), dtype=int)
+    best[0] = total[0]
+    for stop in range(1, stops):
+        # cheapest plan for the previous stops ending in any slot up to each slot
+        cheapest = np.minimum.accumulate(best[stop - 1])
+        positions = np.where(best[stop - 1] == cheapest, columns, 0)
+        came_from[stop] = np.maximum.accumulate(positions)
+        best[stop] = total[stop] + cheapest
+
+    plan = np.empty(stops, dtype=int)
+    plan[-1] = int(np.argmin(best[-1]))
+    for stop in range(stops - 1, 0, -1):
+        plan[stop - 1] = came_from[stop, plan[stop]]
+    return plan
@@ -0,0 +1,60 @@
+from typing import Dict
+import numpy as np
+
+
+def route_costs(index: Dict, distances: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Energy cost of driving each route with each vehicle of a renewable cost index, at the low and high
+    end of its price range and in the middle, as (routes, vehicles) arrays, with the recommended vehicle
+    of every route: the cheapest of the vehicles its distance band recommends.
+    """
+    distances = np.asarray(distances, dtype=float)
+    if np.any(distances < 0) or not np.all(np.isfinite(distances)):
+        raise ValueError("routeDistance must be a non-negative number of miles")
+
+    energy = distances[:, None] * index["perMile"][None, :]
+    low = energy * index["priceLow"][None, :]
+    high = energy * index["priceHigh"][None, :]
+    mid = (low + high) / 2
+
+    candidates = np.ones_like(mid, dtype=bool)
+    if len(index["bandStarts"]):
+        band = np.clip(np.searchsorted(index["bandStarts"], distances, side="right") - 1, 0, None)
+        candidates = index["bandVehicles"][band]
+        # a band that names no known vehicle leaves the choice to cost alone
+        candidates[~candidates.any(axis=1)] = True
+    recommended = np.argmin(np.where(candidates, mid, np.inf), axis=1)
+
+    conventional = np.array(
+        [[fuel["perMile"] * (fuel["priceLow"] + fuel["priceHigh"]) / 2 for fuel in index["conventional"]]]
+    ).reshape(1, len(index["conventional"]))
+
+    return {
+        "low": low,
+        "high": high,
+        "mid": mid,
+        "recommended": recommended,
+        "conventional": distances[:, None] * conventional,
+    }
+
+
+def fleet_costs(index: Dict, distances: np.ndarray, assigned: np.ndarray) -> Dict:
+    """
+    Fleet totals of route_costs: every route on each vehicle, every route on its recommended vehicle
+    and every route on its assigned vehicle (-1 for routes without one, which use the recommended vehicle).
+    """
+    costs = route_costs(index, distances)
+    rows = np.arange(len(distances))
+    assigned = np.where(np.asarray(assigned) >= 0, assigned, costs["recommended"])
+    return {
+        **costs,
+        "byVehicle": {
+            "low": costs["low"].sum(axis=0),
+            "high": costs["high"].sum(axis=0),
+            "mid": costs["mid"].sum(axis=0),
+        },
+        "recommendedTotal": float(costs["mid"][rows, costs["recommended"]].sum()),
+        "assignedTotal": float(costs["mid"][rows, assigned].sum()),
+        "conventionalTotal": costs["conventional"].sum(axis=0),
+        "recommendedCounts": np.bincount(costs["recommended"], minlength=len(index["vehicles"])),
+    }
@@ -0,0 +1,274 @@
+import re
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+# moves must improve the objective by more than this to be applied
+IMPROVEMENT_EPSILON = 1e-9
+
+# Or-opt moves relocate segments of up to this many consecutive stops
+OR_OPT_SEGMENT = 3
+
+# 2-opt and Or-opt only try moves that put a stop next to one of its this many nearest stops
+NEIGHBOURS = 16
+
+# seconds spent improving a route before the best one found so far is returned
+TIME_LIMIT = 0.5
+
+# miles assumed between two addresses in the same city but not on the same street
+CITY_DISTANCE = 3.0
+
+
+@lru_cache(maxsize=100_000)
+def address_parts(address: str) -> Tuple[str, str, str, str, str]:
+    """
+    (house number, street, city, state, zip) of a normalized address, as far as they can be told apart.
+    """
+    parts = [part.strip() for part in address.split(",") if part.strip()]
+    zip_match = re.search(r"\b(\d{5})(?:-\d{4})?\b", address)
+    zip_code = zip_match.group(1) if zip_match else ""
+    # "street, city, state zip": the state is whatever letters are left in the last part
+    state = " ".join(re.sub(r"[^a-z ]", " ", parts[-1]).split()) if len(parts) > 2 else ""
+
+    street = parts[0] if parts else ""
+    house_match = re.match(r"(\d+)\s+(.*)", street)
+    house, street = (house_match.group(1), house_match.group(2)) if house_match else ("", street)
+    city = " ".join(re.sub(r"[^a-z ]", " ", parts[1]).split()) if len(parts) > 1 else ""
+    return house, street, city, state, zip_code
+
+
+def same(values: List[str]) -> np.ndarray:
+    """
+    Pairwise equality of non-empty values.
+    """
+    codes = {value: code for code, value in enumerate(set(values))}
+    array = np.array([codes[value] for value in values])
+    present = np.array([bool(value) for value in values])
+    return (array[:, None] == array[None, :]) & present[:, None] & present[None, :]
+
+
+@lru_cache(maxsize=32)
+def address_distance_matrix(addresses: Tuple[str, ...]) -> np.ndarray:
+    """
+    Rough distances in miles between addresses from how much of the address they share:
+    the same street, the same city or ZIP code, the same state or nothing at all.
+    """
+    houses, streets, cities, states, zips = zip(*(address_parts(" ".join(a.lower().split())) for a in addresses))
+    same_city = same(list(cities)) | same(list(zips))
+    same_street = same_city & same(list(streets))
+
+    numbers = np.array([float(house) if house else np.nan for house in houses])
+    along_street = np.clip(0.1 + np.abs(numbers[:, None] - numbers[None, :]) / 1000, None, 2.0)
+
+    matrix = np.full((len(addresses), len(addresses)), 600.0)
+    matrix[same(list(states))] = 60.0
+    matrix[same_city] = CITY_DISTANCE
+    matrix[same_street] = np.where(np.isnan(along_street), 0.5, along_street)[same_street]
+    np.fill_diagonal(matrix, 0.0)
+    matrix[same([" ".join(a.lower().split()) for a in addresses])] = 0.0
+    matrix.setflags(write=False)
+    return matrix
+
+
+def distance_matrix(addresses: Tuple[str, ...], geodesic: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Distances in miles between addresses. Straight-line distances between geocoded addresses
+    (NaN where unknown) are used between cities; within a city, where geocoding only knows the
+    city centre, and for addresses it could not locate, the address comparison is used instead.
+    """
+    estimate = address_distance_matrix(addresses)
+    if geodesic is None:
+        return estimate
+    between_cities = (estimate > CITY_DISTANCE) & ~np.isnan(geodesic)
+    return np.where(between_cities, np.maximum(np.nan_to_num(geodesic), CITY_DISTANCE), estimate)
+
+
+def nearest_neighbour(distances: np.ndarray, penalties: np.ndarray) -> List[int]:
+    """
+    Greedy route from node 0: repeatedly go to the stop that is closest once its urgency is taken into
+    account, an urgent stop being worth its penalty for every stop it would otherwise wait behind.
+    """
+    size = len(distances)
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = True
+    route = [0]
+    for remaining in range(size - 1, 0, -1):
+        cost = distances[route[-1]] - penalties * remaining / 2
+        cost[visited] = np.inf
+        nearest = int(np.argmin(cost))
+        visited[nearest] = True
+        route.append(nearest)
+    return route
+
+
+def neighbour_lists(distances: np.ndarray, count: int) -> np.ndarray:
+    """
+    The `count` nearest other nodes of every node, in no particular order.
+    """
+    count = min(count, len(distances) - 1)
+    away = np.where(np.eye(len(distances), dtype=bool), np.inf, distances)
+    return np.argpartition(away, count - 1, axis=1)[:, :count]
+
+
+def prefix_sums(route: np.ndarray, penalties: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (position of every node, running penalty, running penalty times position) of a route,
+    the running sums starting at 0 so that a segment's total is a difference of two entries.
+    """
+    where = np.empty(len(route), dtype=int)
+    where[route] = np.arange(len(route))
+    weights = penalties[route]
+    weight_sum = np.concatenate(([0.0], np.cumsum(weights)))
+    position_sum = np.concatenate(([0.0], np.cumsum(weights * np.arange(len(route)))))
+    return where, weight_sum, position_sum
+
+
+def two_opt_pass(
+    route: np.ndarray, distances: np.ndarray, penalties: np.ndarray, neighbours: np.ndarray,
+    active: np.ndarray, touched: np.ndarray, deadline: float,
+) -> bool:
+    """
+    Apply every improving segment reversal found in one sweep, only trying the reversals that start at an
+    `active` or `touched` stop and put a stop next to one of its nearest neighbours. The stops at the ends
+    of a reversal are marked as touched. Returns whether anything changed.
+    """
+    last = len(route) - 2  # route[-1] is the fixed virtual end
+    where, weight_sum, position_sum = prefix_sums(route, penalties)
+    improved = False
+    for i in range(1, last):
+        before, first = route[i - 1], route[i]
+        if not (active[first] or touched[first]):
+            continue
+        # reversing route[i..j] links `before` to route[j] and `first` to route[j + 1]
+        j = np.concatenate((where[neighbours[before]], where[neighbours[first]] - 1, [last]))
+        j = j[j > i]
+        ends, after = route[j], route[j + 1]
+        delta = (
+            distances[before, ends] + distances[first, after]
+            - distances[before, first] - distances[ends, after]
+        )
+        segment_weight = weight_sum[j + 1] - weight_sum[i]
+        segment_position = position_sum[j + 1] - position_sum[i]
+        delta += (i + j) * segment_weight - 2 * segment_position
+
+        best = int(np.argmin(delta))
+        if delta[best] < -IMPROVEMENT_EPSILON:
+            touched[[before, first, ends[best], after[best]]] = True
+            route[i:j[best] + 1] = route[i:j[best] + 1][::-1].copy()
+            where, weight_sum, position_sum = prefix_sums(route, penalties)
+            improved = True
+        if time.perf_counter() > deadline:
+            break
+    return improved
+
+
+def or_opt_pass(
+    route: np.ndarray, distances: np.ndarray, penalties: np.ndarray, neighbours: np.ndarray,
+    active: np.ndarray, touched: np.ndarray, deadline: float,
+) -> bool:
+    """
+    Apply every improving relocation of a short run of stops (either orientation) found in one sweep,
+    only trying runs that start at an `active` or `touched` stop and moving them to the front of the route,
+    its end or next to the run's nearest neighbours. The stops around a relocated run are marked as touched.
+    """
+    end_of_route = len(route) - 2  # the last place to insert at, before the fixed virtual end
+    where, weight_sum, position_sum = prefix_sums(route, penalties)
+    improved = False
+    for length in range(1, OR_OPT_SEGMENT + 1):
+        start = 1
+        while start + length <= len(route) - 1:
+            end = start + length - 1
+            first, last = route[start], route[end]
+            if not (active[first] or touched[first]):
+                start += 1
+                continue
+            segment_weight = weight_sum[end + 1] - weight_sum[start]
+            before, after = route[start - 1], route[end + 1]
+            removal = distances[before, after] - distances[before, first] - distances[last, after]
+
+            # insert between route[t] and route[t + 1], outside the segment and its neighbours
+            nearby = np.concatenate((where[neighbours[first]], where[neighbours[last]]))
+            t = np.concatenate((nearby, nearby - 1, [0, end_of_route]))
+            t = t[((t >= 0) & (t < start - 1)) | ((t > end) & (t <= end_of_route))]
+            if len(t) == 0:
+                start += 1
+                continue
+            left, right = route[t], route[t + 1]
+            forward = distances[left, first] + distances[last, right] - distances[left, right]
+            backward = distances[left, last] + distances[first, right] - distances[left, right]
+
+            shift = np.where(
+                t > end,
+                (t - end) * segment_weight - length * (weight_sum[t + 1] - weight_sum[end + 1]),
+                -(start - t - 1) * segment_weight + length * (weight_sum[start] - weight_sum[t + 1]),
+            )
+            offsets = np.arange(length)
+            reversal = float(np.sum(penalties[route[start:end + 1]] * (length - 1 - 2 * offsets)))
+
+            forward_delta = removal + forward + shift
+            backward_delta = removal + backward + shift + reversal
+            best_forward, best_backward = int(np.argmin(forward_delta)), int(np.argmin(backward_delta))
+            if backward_delta[best_backward] < forward_delta[best_forward]:
+                best, delta, segment = best_backward, backward_delta[best_backward], route[start:end + 1][::-1]
+            else:
+                best, delta, segment = best_forward, forward_delta[best_forward], route[start:end + 1]
+
+            if delta < -IMPROVEMENT_EPSILON:
+                target = int(t[best])
+                touched[[before, after, first, last, left[best], right[best]]] = True
+                rest = np.concatenate((route[:start], route[end + 1:]))
+                insert_at = target + 1 if target < start else target + 1 - length
+                route[:] = np.concatenate((rest[:insert_at], segment, rest[insert_at:]))
+                where, weight_sum, position_sum = prefix_sums(route, penalties)
+                improved = True
+            if time.perf_counter() > deadline:
+                return improved
+            start += 1
+    return improved
+
+
+def solve_route(
+    distances: np.ndarray, penalties: np.ndarray, max_passes: int = 50, time_limit: float = TIME_LIMIT
+) -> List[int]:
+    """
+    Order the stops 1..n of `distances`, node 0 being the start of the route, to minimize the distance
+    travelled plus, for every stop, its penalty times its position in the sequence, so that urgent stops
+    are served early. Nearest-neighbour construction followed by 2-opt and Or-opt improvement, which
+    stops after `time_limit` seconds with the best route found so far.
+    Returns the stop indices in visiting order, without the start.
+    """
+    size = len(distances)
+    if size <= 2:
+        return list(range(1, size))
+    deadline = time.perf_counter() + time_limit
+
+    # a virtual end node at zero distance from everything turns the open route into a fixed-end path
+    extended = np.zeros((size + 1, size + 1))
+    extended[:size, :size] = distances
+    weights = np.append(np.asarray(penalties, dtype=float), 0.0)
+    neighbours = neighbour_lists(distances, NEIGHBOURS)
+
+    route = np.array(nearest_neighbour(distances, weights[:size]) + [size])
+    active = np.ones(size + 1, dtype=bool)
+    for _ in range(max_passes):
+        # a sweep only revisits the stops that a move of the previous sweep touched
+        touched = np.zeros(size + 1, dtype=bool)
+        improved = two_opt_pass(route, extended, weights, neighbours, active, touched, deadline)
+        improved = or_opt_pass(route, extended, weights, neighbours, active, touched, deadline) or improved
+        if not improved or time.perf_counter() > deadline:
+            break
+        active = touched
+
+    return [int(node) for node in route[1:-1]]
+
+
+def route_objective(route: List[int], distances: np.ndarray, penalties: np.ndarray) -> Tuple[float, float]:
+    """
+    (distance travelled, position penalty) of a route that starts at node 0.
+    """
+    path = [0] + list(route)
+    travelled = float(sum(distances[a, b] for a, b in zip(path, path[1:])))
+    penalty = float(sum(penalties[node] * position for position, node in enumerate(path)))
+    return travelled, penalty
@@ -1,8 +1,15 @@
 import json
+from collections import Counter
 from pydantic import BaseModel
-from .custom_types.base_types import Plot, ComparisonPlot
+from .custom_types.base_types import Plot, ComparisonPlot, PlotData
+from .engines.consolidation import consolidate
+from .knowledge.geocoding import build_gazetteer, distance
+from .knowledge.store import knowledge_store
 from pydantic import BaseModel
 
+# lanes shown individually in the consolidation chart, the others are summed up
+CHART_LANES = 15
+
 
 class Order(BaseModel):
     orderWeight: float  # Weight of the order
@@ -77,7 +84,112 @@ class FreightConsolidationAnalysisResults(BaseModel):
     carrierRecommendations: str
 
 
-def freight_consolidation_prompt(inputParameters: FreightConsolidationInputParams):
+class FreightConsolidationNarrative(BaseModel):
+    # the fields of FreightConsolidationAnalysisResults that are left to the model
+    deliveryDelayRisk: str
+    priorityRecommendations: str
+    priorityImpact: str
+    shipmentRecommendations: str
+    costEfficiencyExplanation: str
+    carrierRecommendations: str
+
+
+def freight_consolidation_figures(inputParameters: FreightConsolidationInputParams):
+    """
+    Consolidation figures and charts, computed by the bin-packing engine instead of the model.
+    """
+    parameters = inputParameters.model_dump()
+    result = consolidate(
+        parameters["orders"],
+        parameters["carrierOptions"],
+        inputParameters.shippingCostPerUnit,
+        inputParameters.bulkDiscountRate,
+    )
+
+    lane_orders = Counter()
+    carrier_load = Counter()
+    carrier_capacity = Counter()
+    for load in result["loads"]:
+        if len(load["orders"]) > 1:
+            lane_orders[f'{load["lane"]} ({load["serviceType"]}) - {load["carrier"]}'] += len(load["orders"])
+        carrier_load[load["carrier"]] += load["weight"]
+        carrier_capacity[load["carrier"]] += load["capacity"]
+
+    lanes = lane_orders.most_common(CHART_LANES)
+    other_lanes = sum(lane_orders.values()) - sum(count for _, count in lanes)
+    if other_lanes:
+        lanes.append(("Other lanes", other_lanes))
+
+    carriers = [carrier["carrierName"] for carrier in parameters["carrierOptions"] if carrier["carrierName"] in carrier_load]
+    oversized = len(result["oversizedOrders"])
+
+    return {
+        "consolidationRate": round(result["consolidationRate"], 2),
+        "consolidationDetails": Plot(
+            xLabel="Lane and carrier",
+            yLabel="Consolidated orders",
+            chartType="barChart",
+            data=[PlotData(label=label, value=count) for label, count in lanes],
+            explanation=(
+                f'{result["consolidatedOrders"]} of {len(parameters["orders"])} orders share a load with at least one '
+                f'other order on the same lane and service type, packed into {len(result["loads"])} loads.'
+                + (f" {oversized} orders exceed every carrier's capacity and ship on their own." if oversized else "")
+            ),
+        ),
+        "totalShippingCostBefore": result["totalShippingCostBefore"],
+        "totalShippingCostAfter": result["totalShippingCostAfter"],
+        "costSavings": result["costSavings"],
+        "discountApplied": result["discountApplied"],
+        "carrierUsage": ComparisonPlot(
+            xLabel="Carrier",
+            yLabel="Weight",
+            yActualLabel="Loaded weight",
+            yComparedLabel="Capacity of the loads used",
+            chartType="barChart",
+            actualData=[PlotData(label=carrier, value=round(carrier_load[carrier], 2)) for carrier in carriers],
+            comparedData=[PlotData(label=carrier, value=round(carrier_capacity[carrier], 2)) for carrier in carriers],
+            explanation="Weight loaded on each carrier against the total capacity of the loads assigned to it.",
+        ),
+        "carrierLoadDistribution": Plot(
+            xLabel="Carrier",
+            yLabel="Capacity utilization (%)",
+            chartType="barChart",
+            data=[
+                PlotData(label=carrier, value=round(100 * carrier_load[carrier] / carrier_capacity[carrier], 2))
+                for carrier in carriers
+            ],
+            explanation="Each load is assigned the smallest carrier it fits in, which keeps utilization high.",
+        ),
+        "costComparison": Plot(
+            xLabel="Scenario",
+            yLabel="Shipping cost",
+            chartType="pieChart",
+            data=[
+                PlotData(label="Before consolidation", value=result["totalShippingCostBefore"]),
+                PlotData(label="After consolidation", value=result["totalShippingCostAfter"]),
+            ],
+            explanation=(
+                f'Consolidated loads receive the {result["discountApplied"]}% bulk discount, '
+                f'saving {result["costSavings"]} in total.'
+            ),
+        ),
+    }
+
+
+def lane_miles(orders: list[Order]):
+    """
+    Straight-line miles of the busiest lanes, from the offline gazetteer.
+    """
+    gazetteer = knowledge_store.index("gazetteer.json", build_gazetteer)
+    lanes = Counter((order.originAddress, order.destinationAddress) for order in orders)
+    miles = {}
+    for (origin, destination), _ in lanes.most_common(CHART_LANES):
+        lane_distance = distance(gazetteer, origin, destination)
+        miles[f"{origin} → {destination}"] = round(lane_distance) if lane_distance is not None else None
+    return miles
+
+
+def freight_consolidation_prompt(inputParameters: FreightConsolidationInputParams, computed: dict):
     system_prompt = """
     You are an assistant for a shipping community called the Freight Consolidation Tool. Your task is to analyze the input provided by the user and generate actionable recommendations for optimizing the freight consolidation process.
 
@@ -86,34 +198,44 @@ def freight_consolidation_prompt(inputParameters: FreightConsolidationInputParam
     
     There is no Compulsion to go with the same order of the input, but make sure you cover all the points.
     Make use of all the input parameters provided to generate insightful analysis and recommendations.
-    The output should include visualizations and explanations for each aspect of the consolidation process.
-    Try to combine as many orders as as possible into larger one while considering the carrier capacities.
+    The orders have already been consolidated by a bin-packing engine. Base every explanation on its results
+    and do not recompute the figures.
     
     Output Format:
-    - Consolidation Rate: The percentage of orders that were successfully consolidated.
-    - Consolidation Details: A barChart visualizing the breakdown of consolidated orders and their carrier.
-    - Toatal Shipping Cost Before: The total cost before consolidation.
-    - Total Shipping Cost After: The total cost after consolidation.
-    - Cost Savings: Amount of cost savings achieved.
-    - Discount Applied: Discount percentage applied to consolidated shipments.
-    - Carrier Usage: A barChart visualizing how efficiently each carrier's capacity was utilized with values in weights.
-    - Carrier Load Distribution: A barChart showing how each carrier's capacity is utilized after consolidation.
-    - Cost Comparison: A pieChart visualizing the distribution of shipping costs before and after consolidation.
     - Delivery Delay Risk: Markdown explanation of delay risks.
     - Priority Recommendations: Markdown recommendations for handling priority orders.
     - Priority Impact: Markdown explanation of how priority orders were impacted.
     - Shipment Recommendations: Markdown explanation of consolidation impact and future suggestions.
     - Cost Efficiency Explanation: Markdown explanation of cost savings.
     - Carrier Recommendations: Markdown explanation of carrier performance and suggestions for future shipments.
-    
-    Note: 
-    Chart Types can only include barChart, pieChart, or lineChart.
     """
 
+    # a summary of the orders keeps the prompt small however long the order list is
+    orders = inputParameters.orders
+    summary = {
+        "orderCount": len(orders),
+        "totalWeight": round(sum(order.orderWeight for order in orders), 2),
+        "lanes": len(set((order.originAddress, order.destinationAddress) for order in orders)),
+        "serviceTypes": dict(Counter(order.serviceType for order in orders)),
+        "carrierOptions": [carrier.model_dump() for carrier in inputParameters.carrierOptions],
+        "shippingCostPerUnit": inputParameters.shippingCostPerUnit,
+        "bulkDiscountRate": inputParameters.bulkDiscountRate,
+        "priorityLevel": inputParameters.priorityLevel,
+        "laneMiles": lane_miles(orders),
+    }
+    results = {
+        name: value.model_dump() if isinstance(value, BaseModel) else value
+        for name, value in computed.items()
+    }
+
     user_prompt = """
     I need you to analyze the freight consolidation process based on the following input:
     
-    """ + json.dumps(inputParameters.model_dump(), indent=4)
+    """ + json.dumps(summary, indent=4) + """
+
+    Consolidation results:
+
+    """ + json.dumps(results, indent=4)
 
     messages = [
         {"role": "system", "content": system_prompt},
@@ -126,7 +248,9 @@ def freight_consolidation_prompt(inputParameters: FreightConsolidationInputParam
 tool_config = {
     "freight-consolidation": {
         "prompt_func": freight_consolidation_prompt,
+        "compute_func": freight_consolidation_figures,
         "response_format": FreightConsolidationAnalysisResults,
+        "llm_response_format": FreightConsolidationNarrative,
         "input_format": FreightConsolidationInputParams,
         "options": {
             "serviceType": ["Standard", "Express", "Priority"],
@@ -36,5 +36,7 @@ tool_config = {
         "prompt_func": health_check_prompt,
         "response_format": HealthCheckAnalysisResults,
         "input_format": HealthCheckInputParamsType,
+        # a health check has to reach the model every time
+        "cache": False,
     }
 }
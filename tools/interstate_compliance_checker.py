@@ -1,7 +1,19 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import json
-from .custom_types.base_types import Plot, ComparisonPlot
+import numpy as np
+from .custom_types.base_types import Plot, PlotData
+from .engines.compliance_rules import compliance_matrix, compliance_result
+from .knowledge.store import knowledge_store
+from .knowledge.compliance_index import (
+    build_compliance_rules, canonical_items, find_state_position, related_items, resolved_item
+)
+
+# shipments checked by a single manifest request
+MAX_MANIFEST_SHIPMENTS = 100_000
+
+# compliance score points taken off per requirement a state places on a shipment it does not prohibit
+REQUIREMENT_PENALTY = 10
 
 class RestrictedItem(BaseModel):
     item: str
@@ -53,17 +65,250 @@ class ComplianceAnalysisResults(BaseModel):
     restrictionComparison: Plot
     taxesAndFees: Plot
 
-def compliance_checker_prompt(inputParameters: ComplianceInputParams):
-    knowledge_file = open("data/compliance.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+class ComplianceWarnings(BaseModel):
+    # the fields of ComplianceAnalysisResults that are left to the model
+    warnings: List[str]
+
+
+class ComplianceShipment(ComplianceInputParams):
+    shipmentId: Optional[str] = None  # Identifier of the shipment in the manifest
+
+
+class ComplianceManifestInputParams(BaseModel):
+    shipments: List[ComplianceShipment]  # Shipments of the manifest
+
+
+class ShipmentCompliance(BaseModel):
+    shipmentId: Optional[str]
+    status: str  # "Prohibited", "Restricted" or "Allowed"
+    requiredDocuments: List[str]
+    packagingRequirements: List[str]
+    applicableFees: List[str]
+    restrictedCarriers: List[str]  # Carriers restricted from carrying the item by either state
+    carrierRestricted: Optional[bool]  # Whether the shipment's own carrier is among them, when it names one
+
+
+class ComplianceManifestResults(BaseModel):
+    shipmentCount: int
+    prohibitedCount: int
+    restrictedCount: int
+    carrierRestrictedCount: int  # Shipments whose carrier is restricted from carrying their item
+    shipments: List[ShipmentCompliance]
+
+
+def build_compliance_matrix(knowledge: List[Dict]) -> Dict:
+    return compliance_matrix(build_compliance_rules(knowledge))
+
+
+# materialized at startup rather than on the first check, and again whenever compliance.json changes
+knowledge_store.index("compliance.json", build_compliance_matrix)
+
+
+def state_names(matrix: Dict, result: Dict, origin: int, destination: int) -> Dict[str, str]:
+    if result["sameState"]:
+        return {"origin": matrix["states"][origin], "destination": matrix["states"][destination]}
+    return {"origin": f"{matrix['states'][origin]} (origin)", "destination": f"{matrix['states'][destination]} (destination)"}
+
+
+def attributed_states(roles, names: Dict[str, str]) -> str:
+    # a state shipped within is named once
+    return " and ".join(dict.fromkeys(names[role] for role in roles))
+
+
+def status(result: Dict) -> str:
+    return "Prohibited" if result["prohibited"] else "Restricted" if result["restricted"] else "Allowed"
+
+
+def prohibition_status(result: Dict, names: Dict[str, str], item_type: str) -> str:
+    roles = ("origin",) if result["sameState"] else ("origin", "destination")
+    if result["prohibited"]:
+        reasons = [
+            f"{names[role]} prohibits {', '.join(result[role]['prohibited'])}"
+            for role in roles if result[role]["prohibited"]
+        ]
+        return f"Prohibited: {'; '.join(reasons)}. {item_type} cannot be shipped between these states."
+    if result["restricted"]:
+        reasons = []
+        for role in roles:
+            ruling = result[role]
+            if not ruling["restricted"]:
+                continue
+            conditions = (["age verification"] if ruling["ageVerification"] else []) + list(ruling["shippingRestrictions"])
+            reasons.append(
+                f"{names[role]} restricts {', '.join(ruling['restricted'])}"
+                + (f" ({', '.join(conditions)})" if conditions else "")
+            )
+        return f"Restricted: {'; '.join(reasons)}. {item_type} can be shipped when the requirements below are met."
+    return f"Not prohibited or restricted: no rule of {attributed_states(roles, names)} prohibits or restricts {item_type}."
+
+
+def requirement_count(ruling: Dict) -> int:
+    return (len(ruling["documents"]) + len(ruling["packaging"]) + len(ruling["fees"]) + len(ruling["carriers"])
+            + len(ruling["shippingRestrictions"]) + int(ruling["ageVerification"]))
+
+
+def compliance_score(ruling: Dict) -> float:
+    if ruling["prohibited"]:
+        return 0.0
+    return float(max(0, 100 - REQUIREMENT_PENALTY * requirement_count(ruling)))
+
+
+def compliance_results(inputParameters: ComplianceInputParams):
+    """
+    Prohibitions, documents, packaging, fees and carrier restrictions looked up in the materialized
+    compliance matrix instead of worked out by the model.
+    """
+    matrix = knowledge_store.index("compliance.json", build_compliance_matrix)
+    origin = find_state_position(matrix, inputParameters.originState)
+    destination = find_state_position(matrix, inputParameters.destinationState)
+    result = compliance_result(matrix, origin, destination, canonical_items(matrix, inputParameters.itemType))
+    names = state_names(matrix, result, origin, destination)
+    roles = ("origin",) if result["sameState"] else ("origin", "destination")
+
+    return {
+        "prohibitionStatus": prohibition_status(result, names, inputParameters.itemType),
+        "requiredDocuments": result["requiredDocuments"],
+        "packagingRequirements": result["packagingRequirements"],
+        "applicableFees": [f"{category}: {attributed_states(fee_roles, names)}" for category, fee_roles in result["fees"]],
+        "carrierRestrictions": [
+            CarrierRestriction(
+                carrier=carrier,
+                restriction=f"Restricted from carrying {item}",
+                reason=f"Carrier restriction of {attributed_states(carrier_roles, names)} on {item} shipments"
+                + ("; age verification is required on delivery" if any(
+                    result[role]["ageVerification"] for role in carrier_roles) else ""),
+            )
+            for (carrier, item), carrier_roles in result["carriers"]
+        ],
+        "complianceScore": Plot(
+            xLabel="State",
+            yLabel="Compliance score",
+            chartType="barChart",
+            data=[PlotData(label=names[role], value=compliance_score(result[role])) for role in roles],
+            explanation=(
+                f"100 for a state without requirements on {inputParameters.itemType}, {REQUIREMENT_PENALTY} less "
+                "for every document, packaging requirement, fee, carrier or shipping restriction and age check "
+                "it requires, 0 where it is prohibited."
+            ),
+        ),
+        "restrictionComparison": Plot(
+            xLabel="State and rule",
+            yLabel="Number of rules",
+            chartType="barChart",
+            data=[
+                PlotData(label=f"{names[role]} {label}", value=len(result[role][field]))
+                for role in roles
+                for field, label in (("prohibited", "prohibitions"), ("restricted", "restrictions"),
+                                     ("documents", "documents"), ("packaging", "packaging requirements"),
+                                     ("carriers", "carrier restrictions"))
+            ],
+            explanation=f"Rules of each state that apply to {inputParameters.itemType}, by kind.",
+        ),
+        "taxesAndFees": Plot(
+            xLabel="Tax or fee",
+            yLabel="States levying it",
+            chartType="barChart",
+            data=[PlotData(label=category, value=len(set(names[role] for role in fee_roles)))
+                  for category, fee_roles in result["fees"]],
+            explanation=(
+                f"Taxes and fees on {inputParameters.itemType} in {attributed_states(roles, names)}."
+                if result["fees"] else f"No taxes or fees apply to {inputParameters.itemType}."
+            ),
+        ),
+    }
+
+
+def compliance_manifest_results(inputParameters: ComplianceManifestInputParams):
+    """
+    Compliance of every shipment of a manifest: states and item types are resolved once per distinct value
+    and the results looked up in the compliance matrix for all shipments at once.
+    """
+    shipments = inputParameters.shipments
+    if len(shipments) > MAX_MANIFEST_SHIPMENTS:
+        raise ValueError(f"A manifest can have at most {MAX_MANIFEST_SHIPMENTS} shipments, got {len(shipments)}")
+
+    matrix = knowledge_store.index("compliance.json", build_compliance_matrix)
+    states = {}
+    items = {}
+    for shipment in shipments:
+        for state in (shipment.originState, shipment.destinationState):
+            if state not in states:
+                states[state] = find_state_position(matrix, state)
+        if shipment.itemType not in items:
+            items[shipment.itemType] = canonical_items(matrix, shipment.itemType)
+
+    origins = np.array([states[shipment.originState] for shipment in shipments], dtype=np.int64)
+    destinations = np.array([states[shipment.destinationState] for shipment in shipments], dtype=np.int64)
+    # items that are an instance of several canonical items have no column and are merged per shipment
+    columns = np.array([
+        items[shipment.itemType][0] if len(items[shipment.itemType]) == 1
+        else matrix["otherItem"] if not items[shipment.itemType] else -1
+        for shipment in shipments
+    ], dtype=np.int64)
+    result_ids = matrix["matrix"][origins, destinations, np.maximum(columns, 0)].tolist()
+
+    checked = []
+    summaries = {}
+    for shipment, origin, destination, column, result_id in zip(
+        shipments, origins.tolist(), destinations.tolist(), columns.tolist(), result_ids
+    ):
+        key = (result_id, origin, destination) if column >= 0 else (shipment.itemType, origin, destination)
+        if key not in summaries:
+            result = (matrix["results"][result_id] if column >= 0
+                      else compliance_result(matrix, origin, destination, items[shipment.itemType]))
+            names = state_names(matrix, result, origin, destination)
+            carriers = list(dict.fromkeys(carrier for (carrier, _), _ in result["carriers"]))
+            summaries[key] = {
+                "fields": {
+                    "status": status(result),
+                    "requiredDocuments": result["requiredDocuments"],
+                    "packagingRequirements": result["packagingRequirements"],
+                    "applicableFees": [f"{category}: {attributed_states(roles, names)}" for category, roles in result["fees"]],
+                    "restrictedCarriers": carriers,
+                },
+                "carrierKeys": {carrier.lower() for carrier in carriers},
+            }
+        summary = summaries[key]
+        carrier_restricted = None
+        if shipment.carrierName:
+            carrier_restricted = shipment.carrierName.strip().lower() in summary["carrierKeys"]
+        # plain dicts, validated into ShipmentCompliance once with the whole response
+        checked.append({"shipmentId": shipment.shipmentId, "carrierRestricted": carrier_restricted, **summary["fields"]})
+
+    return {
+        "shipmentCount": len(checked),
+        "prohibitedCount": sum(shipment["status"] == "Prohibited" for shipment in checked),
+        "restrictedCount": sum(shipment["status"] == "Restricted" for shipment in checked),
+        "carrierRestrictedCount": sum(bool(shipment["carrierRestricted"]) for shipment in checked),
+        "shipments": checked,
+    }
+
+def compliance_checker_prompt(inputParameters: ComplianceInputParams, computed: dict):
+    matrix = knowledge_store.index("compliance.json", build_compliance_matrix)
+
+    # the special notes of the two states involved, with the entries that share a word with the item
+    # and may concern it beyond the rules already applied
+    knowledge = []
+    for state in dict.fromkeys([
+        find_state_position(matrix, inputParameters.originState),
+        find_state_position(matrix, inputParameters.destinationState),
+    ]):
+        knowledge.append({
+            "state": matrix["states"][state],
+            "specialNotes": matrix["notes"][state],
+            "relatedEntries": related_items(matrix, state, inputParameters.itemType),
+        })
+    items = [matrix["items"][item] for item in resolved_item(matrix, inputParameters.itemType)["items"]]
 
     system_prompt = (
         """
-    You are an interstate shipping compliance expert. Your task is to analyze shipping requirements 
-    and restrictions between states based on the provided compliance data.
+    You are an interstate shipping compliance expert. Your task is to point out the compliance warnings
+    for shipping an item between two states.
 
-    Strictly use the following compliance data as the foundation for your analysis:
+    The prohibitions, required documents, packaging requirements, fees and carrier restrictions
+    have already been determined from the states' compliance data and are given below. Base your warnings
+    on them and do not recompute them. Strictly use the following notes of the origin and destination states,
+    with the names of their entries that share a word with the item being shipped, as the only other source:
     """
         + json.dumps(knowledge, indent=4) +
         """
@@ -72,18 +317,8 @@ def compliance_checker_prompt(inputParameters: ComplianceInputParams):
 
     Your output should include the following fields:
 
-    - `prohibitionStatus`: Detailed explanation of any prohibitions
-    - `requiredDocuments`: List of all required documentation for shipping the given product
-    - `packagingRequirements`: List of packaging and labeling requirements for the given product
-    - `applicableFees`: List of applicable taxes and fees to ship the given product
-    - `carrierRestrictions`: List of carrier-specific restrictions 
-    - `warnings`: List of important compliance warnings
-    - `complianceScore`: Chart showing overall compliance status
-    - `restrictionComparison`: Chart comparing restrictions between states
-    - `taxesAndFees`: Chart showing taxes and fees completeness
-
-    **Note:**
-    Only use the following chart types: ["barChart", "lineChart", "pieChart"]
+    - `warnings`: List of important compliance warnings, including special notes and related entries
+      that may apply to the item
     """
     )
 
@@ -92,6 +327,24 @@ def compliance_checker_prompt(inputParameters: ComplianceInputParams):
         Please analyze the shipping compliance requirements for:
         """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        The item is covered by the compliance data as: """
+        + (", ".join(items) if items else "no item the data names")
+        + """
+
+        Compliance determined from the data:
+        """
+        + json.dumps(
+            {
+                "prohibitionStatus": computed["prohibitionStatus"],
+                "requiredDocuments": computed["requiredDocuments"],
+                "packagingRequirements": computed["packagingRequirements"],
+                "applicableFees": computed["applicableFees"],
+                "carrierRestrictions": [restriction.model_dump() for restriction in computed["carrierRestrictions"]],
+            },
+            indent=4,
+        )
     )
 
     messages = [
@@ -104,8 +357,18 @@ def compliance_checker_prompt(inputParameters: ComplianceInputParams):
 tool_config = {
     "interstate-compliance-checker": {
         "prompt_func": compliance_checker_prompt,
+        "compute_func": compliance_results,
         "response_format": ComplianceAnalysisResults,
+        "llm_response_format": ComplianceWarnings,
         "input_format": ComplianceInputParams,
         "options": {}
+    },
+    # manifests are checked entirely locally, without the language model
+    "interstate-compliance-manifest-checker": {
+        "compute_func": compliance_manifest_results,
+        "response_format": ComplianceManifestResults,
+        "input_format": ComplianceManifestInputParams,
+        "cache": False,
+        "options": {}
     }
 }
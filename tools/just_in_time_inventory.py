@@ -1,9 +1,34 @@
 import json
 from pydantic import BaseModel
 from typing import List,  Optional
-from .custom_types.base_types import Plot, ComparisonPlot
+import numpy as np
+from .custom_types.base_types import Plot, PlotData, ComparisonPlot
+from .engines.inventory_simulation import simulate_inventory
 import random
 
+# demand and lead time paths simulated per request, a fixed seed keeps responses reproducible
+SIMULATION_PATHS = 10_000
+SIMULATION_DAYS = 365
+SIMULATION_SEED = 0
+
+# assumed replenishment lead time and the variability of lead times and daily demand (coefficients of variation)
+LEAD_TIME_DAYS = 7
+LEAD_TIME_CV = 0.3
+DEMAND_CV = 0.25
+
+# how the current challenges change those assumptions
+CHALLENGE_ASSUMPTIONS = {
+    "long lead times": {"leadTimeDays": 14},
+    "supplier unreliability": {"leadTimeCv": 0.6},
+    "production delays": {"capacityFactor": 0.85},
+}
+
+# lead times drawn by fewer paths are left out of the lead time chart
+MIN_PATHS_PER_LEAD_TIME = 100
+
+# stockout or overstock probabilities (%) below which the risk is Low, and Medium
+RISK_LEVELS = ((20, "Low"), (50, "Medium"))
+
 
 class RiskAnalysis(BaseModel):
     riskLevel: str  # E.g., 'Low', 'Medium', 'High'
@@ -46,7 +71,147 @@ class JustInTimeInventoryAnalysisResults(BaseModel):
     conclusion: str
 
 
-def just_in_time_inventory_prompt(inputParameters: JustInTimeInventoryInputParams):
+class JustInTimeInventoryNarrative(BaseModel):
+    # the fields of JustInTimeInventoryAnalysisResults that are left to the model
+    objectiveFulfillmentAnalysis: Plot
+    costToServeAnalysis: Plot
+    costSavingsPotential: EfficiencyScore
+    keyPerformanceIndicators: List[str]
+    implementationPlan: str
+    conclusion: str
+
+
+def simulation_assumptions(challenges: Optional[List[str]]) -> dict:
+    assumptions = {"leadTimeDays": LEAD_TIME_DAYS, "leadTimeCv": LEAD_TIME_CV, "demandCv": DEMAND_CV, "capacityFactor": 1.0}
+    for challenge in challenges or []:
+        assumptions.update(CHALLENGE_ASSUMPTIONS.get(challenge.strip().lower(), {}))
+    return assumptions
+
+
+def risk_level(probability: float) -> str:
+    return next((level for limit, level in RISK_LEVELS if probability < limit), "High")
+
+
+def just_in_time_simulation(inputParameters: JustInTimeInventoryInputParams):
+    """
+    Inventory, stockout, capacity and overstock charts and the risk assessment from a Monte Carlo simulation
+    of a year of daily demand and replenishment lead times under a just-in-time pull policy.
+    """
+    assumptions = simulation_assumptions(inputParameters.current_challenges)
+    capacity = inputParameters.production_capacity_units_per_month * assumptions["capacityFactor"]
+    simulation = simulate_inventory(
+        inputParameters.average_monthly_demand_units,
+        inputParameters.current_inventory_level_units,
+        capacity,
+        inputParameters.warehouse_capacity_units,
+        assumptions["leadTimeDays"],
+        assumptions["leadTimeCv"],
+        assumptions["demandCv"],
+        paths=SIMULATION_PATHS,
+        days=SIMULATION_DAYS,
+        seed=SIMULATION_SEED,
+    )
+    paths = simulation["paths"]
+    months = [f"Month {month}" for month in range(1, simulation["monthEndInventory"].shape[1] + 1)]
+    low, median, high = np.percentile(simulation["monthEndInventory"], [5, 50, 95], axis=0)
+    stockouts = simulation["stockoutDays"] > 0
+    overstocked = simulation["overCapacityDays"] > 0
+    stockout_probability = 100 * float(stockouts.mean())
+    overstock_probability = 100 * float(overstocked.mean())
+    utilization = 100 * float(np.median(simulation["capacityUtilization"]))
+    assumed = (
+        f"{paths:,} simulated years of gamma distributed daily demand (CV {assumptions['demandCv']:g}) and lognormal "
+        f"lead times averaging {assumptions['leadTimeDays']:g} days (CV {assumptions['leadTimeCv']:g}), replenished "
+        f"up to {simulation['target']:,.0f} units of inventory position"
+    )
+
+    lead_days, lead_paths = np.unique(simulation["leadTimes"], return_counts=True)
+    lead_stockouts = np.bincount(simulation["leadTimes"], weights=stockouts)[lead_days]
+    charted = lead_paths >= MIN_PATHS_PER_LEAD_TIME
+
+    risk = max(stockout_probability, overstock_probability)
+    explanation = (
+        f"In {stockout_probability:.1f}% of the simulated years demand goes unserved on at least one day "
+        f"(median {float(np.median(simulation['stockoutDays'])):.0f} stockout days, "
+        f"{100 * float(simulation['fillRate'].mean()):.1f}% of demand served on average) and in "
+        f"{overstock_probability:.1f}% inventory exceeds the warehouse capacity"
+    )
+    if overstocked.any():
+        explanation += (
+            f" (by {float(np.median(simulation['overCapacityUnits'][overstocked])):,.0f} units at the median peak, "
+            f"for a median of {float(np.median(simulation['overCapacityDays'][overstocked])):.0f} days)"
+        )
+    explanation += "."
+
+    return {
+        "inventoryLevelVsDemand": Plot(
+            xLabel="Month",
+            yLabel="Inventory at month end (units)",
+            chartType="lineChart",
+            data=[PlotData(label=label, value=round(float(value), 1)) for label, value in zip(months, median)],
+            explanation=(
+                f"Median month-end inventory of {assumed}, against an average demand of "
+                f"{inputParameters.average_monthly_demand_units:,} units a month. In 90% of the years it stays between "
+                + ", ".join(
+                    f"{float(lower):,.0f} and {float(upper):,.0f} ({label})"
+                    for label, lower, upper in zip(months[::3], low[::3], high[::3])
+                )
+                + "."
+            ),
+        ),
+        "productionCapacityUtilization": Plot(
+            xLabel="Production capacity",
+            yLabel="Share of capacity (%)",
+            chartType="pieChart",
+            data=[
+                PlotData(label="Used", value=round(utilization, 1)),
+                PlotData(label="Idle", value=round(100 - utilization, 1)),
+            ],
+            explanation=(
+                f"Median share of the {capacity:,.0f} units of monthly production capacity the pull policy uses "
+                f"in the simulated years, between {100 * float(np.percentile(simulation['capacityUtilization'], 5)):.1f}% "
+                f"and {100 * float(np.percentile(simulation['capacityUtilization'], 95)):.1f}% in 90% of them."
+            ),
+        ),
+        "warehouseCapacityVsInventory": ComparisonPlot(
+            xLabel="Month",
+            yLabel="Units",
+            yActualLabel="Inventory at month end (95th percentile)",
+            yComparedLabel="Warehouse capacity",
+            chartType="barChart",
+            actualData=[PlotData(label=label, value=round(float(value), 1)) for label, value in zip(months, high)],
+            comparedData=[
+                PlotData(label=label, value=float(inputParameters.warehouse_capacity_units)) for label in months
+            ],
+            explanation=(
+                f"Inventory exceeds the warehouse capacity of {inputParameters.warehouse_capacity_units:,} units "
+                f"at some point in {overstock_probability:.1f}% of the simulated years, the median peak inventory "
+                f"is {float(np.median(simulation['peakInventory'])):,.0f} units."
+            ),
+        ),
+        "leadTimeVsStockouts": Plot(
+            xLabel="Lead time (days)",
+            yLabel="Years with a stockout (%)",
+            chartType="lineChart",
+            data=[
+                PlotData(label=f"{days} days", value=round(100 * float(count) / float(total), 1))
+                for days, count, total in zip(lead_days[charted], lead_stockouts[charted], lead_paths[charted])
+            ],
+            explanation=(
+                f"Share of the simulated years with at least one stockout day by the lead time of the year, "
+                f"{stockout_probability:.1f}% over all lead times. Lead times drawn in fewer than "
+                f"{MIN_PATHS_PER_LEAD_TIME} years are not shown."
+            ),
+        ),
+        "riskAssessment": RiskAnalysis(
+            riskLevel=risk_level(risk),
+            progress=int(round(risk)),
+            explanation=explanation,
+        ),
+    }
+
+
+def just_in_time_inventory_prompt(inputParameters: JustInTimeInventoryInputParams, computed: dict):
 
     system_prompt = (
     """
@@ -56,6 +221,8 @@ Your output should be flexible and tailored to the user's context, taking into a
 
 The primary goal is to help users minimize inventory holding costs while maintaining operational efficiency. Use a combination of visual data (charts) and analytical insights to provide comprehensive recommendations. Your responses should be tailored to the input and aim to provide practical solutions rather than deterministic answers.
 
+The inventory level vs. demand, production capacity utilization, warehouse capacity vs. inventory level and lead time vs. stockouts charts and the risk assessment have already been computed from a Monte Carlo simulation of a year of demand and lead times and are given below. Base your analysis and recommendations on them and do not recompute them.
+
 ## *Steps to Follow:* 
 
 1. **Understand the User's Context:**
@@ -122,13 +289,8 @@ The primary goal is to help users minimize inventory holding costs while maintai
    Summarize the key actionable recommendations in a **markdown** conclusion. The conclusion should not be generic but offer specific next steps based on the user's data and objectives. Make the conclusion clear, actionable, and adaptable, helping the user understand what to do next to optimize inventory using JIT.
 
 6. **Output Format:**
-     - `inventoryLevelVsDemand`: A `Plot` object with line chart data.
-     - `productionCapacityUtilization`: A `Plot` object with bar chart data.
-     - `warehouseCapacityVsInventory`: A `Plot` object with stacked bar chart data.
      - `objectiveFulfillmentAnalysis`: A `Plot` object with bar chart data.
-     - `leadTimeVsStockouts`: A `Plot` object with scatter plot data.
      - `costToServeAnalysis`: A `Plot` object with bar chart data.
-     - `riskAssessment`: A `RiskAnalysis` object with a progress bar and **markdown** explanation.
      - `costSavingsPotential`: An `EfficiencyScore` object with a percentage and **markdown** explanation.
      - `keyPerformanceIndicators`: A list of KPIs with **markdown** explanations.
      - `implementationPlan`: A markdown-based implementation plan.
@@ -148,6 +310,23 @@ The primary goal is to help users minimize inventory holding costs while maintai
 Please analyze the following data and provide recommendations for implementing Just-In-Time inventory management:
 """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+Simulated inventory, capacity and stockouts:
+"""
+        + json.dumps(
+            {
+                key: computed[key].model_dump()
+                for key in (
+                    "inventoryLevelVsDemand",
+                    "productionCapacityUtilization",
+                    "warehouseCapacityVsInventory",
+                    "leadTimeVsStockouts",
+                    "riskAssessment",
+                )
+            },
+            indent=4,
+        )
     )
 
     messages = [
@@ -161,7 +340,9 @@ Please analyze the following data and provide recommendations for implementing J
 tool_config = {
     "just-in-time-inventory": {
         "prompt_func": just_in_time_inventory_prompt,
+        "compute_func": just_in_time_simulation,
         "response_format": JustInTimeInventoryAnalysisResults,
+        "llm_response_format": JustInTimeInventoryNarrative,
         "input_format": JustInTimeInventoryInputParams,
         "options": {
             "main_objectives": [
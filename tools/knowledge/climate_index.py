@@ -0,0 +1,178 @@
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .store import memoized
+from .text_matching import word_tokens, best_matches
+
+# free-text lookups memoized per version of climate.json, the least recently used are dropped beyond this
+RESOLVED_CACHE_SIZE = 10_000
+
+
+# free-text weather words mapped to the words used by the conditions in climate.json
+CONDITION_SYNONYMS = {
+    "hot": "heat",
+    "heatwave": "heat",
+    "summer": "heat sun",
+    "sunny": "sun",
+    "sunlight": "sun",
+    "cold": "freezing",
+    "freeze": "freezing cold",
+    "freezing": "cold",
+    "frost": "freezing cold",
+    "snow": "freezing cold",
+    "winter": "freezing cold",
+    "ice": "freezing cold",
+    "humid": "humidity",
+    "rain": "humidity",
+    "rainy": "humidity",
+    "fog": "humidity",
+    "fogg": "humidity",
+    "storm": "humidity fluctuation",
+    "moisture": "humidity",
+    "dry": "dry",
+    "fluctuating": "fluctuation",
+    "variable": "fluctuation",
+}
+
+PRODUCT_SYNONYMS = {
+    "wine": "spirit",
+    "liquor": "spirit",
+    "beer": "spirit",
+    "drug": "pharmaceutical medicine",
+    "medication": "pharmaceutical medicine",
+    "vaccine": "pharmaceutical medicine",
+    "makeup": "cosmetic",
+    "clothing": "textile apparel",
+    "clothe": "textile apparel",
+    "fabric": "textile",
+    "food": "food",
+    "produce": "perishable",
+    "grocery": "food perishable",
+    "frozen": "frozen",
+    "glass": "glassware",
+    "chemical": "chemical",
+    "hazmat": "hazardous",
+    "electronic": "electronic",
+    "instrument": "musical",
+    "piano": "musical instrument",
+    "guitar": "musical instrument",
+    "machinery": "industrial equipment",
+}
+
+
+# ambient temperature assumed for conditions that do not state one (humidity, sun exposure)
+MILD_TEMPERATURE = (70.0, 70.0)
+
+
+def parse_temperature_range(text: str) -> Tuple[float, float]:
+    """
+    "95°F to 120°F" -> (95.0, 120.0), "Below 32°F" -> (32.0, 32.0), MILD_TEMPERATURE for "Above 75%".
+    """
+    temperatures = [float(value) for value in re.findall(r"(-?\d+(?:\.\d+)?)\s*°\s*F", text)]
+    if not temperatures:
+        return MILD_TEMPERATURE
+    return min(temperatures), max(temperatures)
+
+
+def build_climate_index(knowledge: List[Dict]) -> Dict:
+    """
+    Index climate.json by product type, by weather condition within each product, and by carrier name.
+    Product types listed more than once are merged.
+    """
+    products: Dict[str, Dict[str, Dict]] = {}
+    carriers: Dict[str, Dict] = {}
+    for record in knowledge:
+        conditions = products.setdefault(record["productType"], {})
+        for condition in record["weatherConditions"]:
+            conditions.setdefault(condition["condition"], condition)
+            for carrier in condition["recommendedCarriers"]:
+                carriers.setdefault(carrier["name"], carrier)
+
+    return {
+        "products": products,
+        "product_tokens": [(name, word_tokens(name)) for name in products],
+        "condition_tokens": {
+            product: [(name, word_tokens(name)) for name in conditions]
+            for product, conditions in products.items()
+        },
+        "carriers": carriers,
+        "carrier_tokens": [(name, word_tokens(name)) for name in carriers],
+        "resolved": OrderedDict(),  # memoized lookups for repeated free-text values, see RESOLVED_CACHE_SIZE
+    }
+
+
+def match_products(index: Dict, product_type: str) -> List[str]:
+    return memoized(
+        index["resolved"], ("product", product_type), RESOLVED_CACHE_SIZE,
+        lambda: best_matches(word_tokens(product_type, PRODUCT_SYNONYMS), index["product_tokens"])[:3],
+    )
+
+
+def match_conditions(index: Dict, product: str, condition: str) -> List[str]:
+    return memoized(
+        index["resolved"], ("condition", product, condition), RESOLVED_CACHE_SIZE,
+        lambda: best_matches(
+            word_tokens(condition, CONDITION_SYNONYMS), index["condition_tokens"][product], threshold=0.3
+        ),
+    )
+
+
+def match_carrier(index: Dict, carrier: str) -> List[str]:
+    return memoized(
+        index["resolved"], ("carrier", carrier), RESOLVED_CACHE_SIZE,
+        lambda: best_matches(word_tokens(carrier), index["carrier_tokens"], threshold=0.6)[:1],
+    )
+
+
+def climate_records(index: Dict, product_type: str, condition: str) -> List[Dict]:
+    """
+    The climate.json records for the product types matching `product_type`, each narrowed to the
+    weather conditions matching `condition` (all of its conditions when none match).
+    Empty when no product type matches.
+    """
+    records = []
+    for product in match_products(index, product_type):
+        conditions = index["products"][product]
+        names = match_conditions(index, product, condition) or list(conditions)
+        records.append({
+            "productType": product,
+            "weatherConditions": [conditions[name] for name in names],
+        })
+    return records
+
+
+def carrier_records(index: Dict, carriers: List[str]) -> List[Dict]:
+    records = []
+    for carrier in carriers:
+        for name in match_carrier(index, carrier):
+            if index["carriers"][name] not in records:
+                records.append(index["carriers"][name])
+    return records
+
+
+def shipment_profile(index: Dict, product_type: str, condition: str, carrier: str) -> Dict:
+    """
+    What a shipment is costed with: the packaging recommended for the best matching product type and
+    weather condition, its ambient temperature range and the carrier, which is the named one when it is
+    known and else the one recommended for the condition. Raises ValueError when there is no carrier.
+    """
+    return memoized(
+        index["resolved"], ("profile", product_type, condition, carrier), RESOLVED_CACHE_SIZE,
+        lambda: resolve_profile(index, product_type, condition, carrier),
+    )
+
+
+def resolve_profile(index: Dict, product_type: str, condition: str, carrier: str) -> Dict:
+    records = climate_records(index, product_type, condition)
+    matched: Optional[Dict] = records[0]["weatherConditions"][0] if records else None
+    carriers = carrier_records(index, [carrier]) or (matched["recommendedCarriers"][:1] if matched else [])
+    if not carriers:
+        raise ValueError(f'Unknown carrier "{carrier}", expected one of: {", ".join(index["carriers"])}')
+
+    return {
+        "productType": records[0]["productType"] if records else None,
+        "condition": matched["condition"] if matched else None,
+        "packaging": matched["recommendedPackaging"] if matched else [],
+        "ambient": parse_temperature_range(matched["temperatureRange"]) if matched else MILD_TEMPERATURE,
+        "carrier": carriers[0],
+    }
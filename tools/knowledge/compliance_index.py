@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from typing import Any, Dict, List
+from .store import memoized
+from .text_matching import character_ngrams, token_similarity, word_tokens
+
+
+STATE_ABBREVIATIONS = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "FL": "Florida", "GA": "Georgia",
+    "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois", "IN": "Indiana", "IA": "Iowa",
+    "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana", "ME": "Maine", "MD": "Maryland",
+    "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota", "MS": "Mississippi", "MO": "Missouri",
+    "MT": "Montana", "NE": "Nebraska", "NV": "Nevada", "NH": "New Hampshire", "NJ": "New Jersey",
+    "NM": "New Mexico", "NY": "New York", "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio",
+    "OK": "Oklahoma", "OR": "Oregon", "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina",
+    "SD": "South Dakota", "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont",
+    "VA": "Virginia", "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+}
+
+# words (in word_tokens' singular form) that qualify an item name without identifying what the item is
+QUALIFIER_WORDS = {"certain", "good", "product", "material", "item"}
+
+# everyday names of items -> the words of the items compliance.json names them under
+ITEM_SYNONYMS = {
+    **dict.fromkeys(
+        ["wine", "beer", "ale", "spirits", "liquor", "whiskey", "whisky", "bourbon", "vodka", "rum", "gin", "tequila",
+         "brandy", "champagne", "sake", "cider", "liqueur", "alcoholic", "booze"],
+        "alcohol",
+    ),
+    **dict.fromkeys(
+        ["vape", "vaping", "e-cigarette", "e cig", "ecig", "cigarette", "cigar", "cigarillo", "nicotine", "snuff",
+         "hookah", "shisha", "e-liquid", "e liquid"],
+        "tobacco",
+    ),
+    **dict.fromkeys(
+        ["lithium", "li-ion", "aerosol", "paint", "propane", "butane", "gasoline", "petrol", "kerosene", "solvent",
+         "bleach", "corrosive", "toxic", "poison", "radioactive", "explosive", "dry ice", "compressed gas"],
+        "hazardous",
+    ),
+    **dict.fromkeys(
+        ["gun", "rifle", "pistol", "handgun", "shotgun", "revolver", "ammunition", "ammo"],
+        "firearms",
+    ),
+    **dict.fromkeys(["firecracker", "sparkler", "pyrotechnic", "roman candle"], "fireworks"),
+    **dict.fromkeys(
+        ["laptop", "computer", "phone", "smartphone", "tablet", "television", "tv", "camera", "console",
+         "electronic", "gadget"],
+        "electronics",
+    ),
+    **dict.fromkeys(
+        ["fruit", "vegetable", "produce", "plant", "seed", "soil", "citrus", "nursery stock", "crop", "grain", "hay"],
+        "agricultural",
+    ),
+    **dict.fromkeys(["herbicide", "fungicide", "rodenticide", "weed killer"], "pesticides"),
+    **dict.fromkeys(["bug spray", "roach killer", "ant killer"], "insecticides"),
+    **dict.fromkeys(["cheese", "butter", "yogurt", "cream"], "dairy"),
+    **dict.fromkeys(
+        ["fish", "seafood", "shellfish", "oyster", "lobster", "crab", "shrimp", "clam", "mussel", "coral"],
+        "marine",
+    ),
+    **dict.fromkeys(["food", "meat", "flowers", "groceries", "perishable"], "perishables"),
+    **dict.fromkeys(["sharps", "syringe", "needle", "biohazard"], "medical waste"),
+    **dict.fromkeys(["car battery", "automotive battery", "car batteries"], "lead-acid batteries"),
+}
+
+# words shorter than this are never corrected as typos, too many item words are a letter away from them
+MIN_CORRECTED_LENGTH = 5
+
+# a word is taken for a typo of an item word sharing this much of their trigrams and this similar to it,
+# "alchohol" is "alcohol" but "painting" is not "paint"
+MIN_TRIGRAM_OVERLAP = 0.4
+MIN_WORD_SIMILARITY = 0.8
+
+# item types resolved per version of compliance.json, the least recently used are dropped beyond this
+RESOLVED_CACHE_SIZE = 10_000
+
+
+def normalize_state(state: str) -> str:
+    return " ".join(state.lower().replace(".", "").split())
+
+
+def item_words(name: str) -> List[str]:
+    return [word for word in word_tokens(name) if word not in QUALIFIER_WORDS]
+
+
+def item_tokens(name: str) -> frozenset:
+    return frozenset(item_words(name))
+
+
+def entry_items(entry: Any) -> List[str]:
+    if isinstance(entry, str):
+        return [entry]
+    if "item" in entry:
+        return [entry["item"]]
+    return entry.get("items", [])
+
+
+def state_positions(states: List[str]) -> Dict[str, int]:
+    # full names and postal abbreviations
+    positions = {normalize_state(state): position for position, state in enumerate(states)}
+    for abbreviation, state in STATE_ABBREVIATIONS.items():
+        if normalize_state(state) in positions:
+            positions[abbreviation.lower()] = positions[normalize_state(state)]
+    return positions
+
+
+def build_compliance_rules(knowledge: List[Dict]) -> Dict:
+    """
+    The entries of compliance.json as rules: every entry of a state applies to the items whose words include
+    all the words of the entry's item ("Certain pesticides" applies to "agricultural pesticides").
+    Item names with the same words ("Fireworks", "Certain fireworks") are one canonical item,
+    named after the variant most states use.
+    """
+    states = []
+    notes = []
+    rules = []
+    variants: Dict[frozenset, Dict[str, int]] = {}
+    for record in knowledge:
+        state_rules = []
+        for section, entries in record["compliance"].items():
+            if not isinstance(entries, list):
+                continue
+            for entry in entries:
+                for name in entry_items(entry):
+                    tokens = item_tokens(name)
+                    if not tokens:
+                        continue
+                    state_rules.append({"section": section, "item": name, "tokens": tokens, "entry": entry})
+                    names = variants.setdefault(tokens, {})
+                    names[name] = names.get(name, 0) + 1
+        states.append(record["state"])
+        notes.append(record["compliance"].get("specialNotes", ""))
+        rules.append(state_rules)
+
+    items = sorted(variants, key=lambda tokens: (len(tokens), sorted(tokens)))
+
+    # synonyms by their words, and a trigram index over every word a resolved item type can be made of
+    synonyms = {tuple(item_words(alias)): item_tokens(canonical) for alias, canonical in ITEM_SYNONYMS.items()}
+    vocabulary = set().union(*items, *(alias for alias in synonyms if len(alias) == 1))
+    trigrams: Dict[str, set] = {}
+    for word in vocabulary:
+        for trigram in character_ngrams(word):
+            trigrams.setdefault(trigram, set()).add(word)
+
+    return {
+        "states": states,
+        "positions": state_positions(states),
+        "notes": notes,
+        "rules": rules,
+        "items": [max(variants[tokens], key=lambda name: (variants[tokens][name], -len(name))) for tokens in items],
+        "itemTokens": items,
+        "synonyms": synonyms,
+        "longestSynonym": max((len(alias) for alias in synonyms), default=1),
+        "vocabulary": vocabulary,
+        "trigrams": trigrams,
+        "resolved": OrderedDict(),  # memoized resolutions of repeated free-text item types, see RESOLVED_CACHE_SIZE
+    }
+
+
+def find_state_position(rules: Dict, state: str) -> int:
+    position = rules["positions"].get(normalize_state(state))
+    if position is None:
+        raise ValueError(f'No compliance data for the state "{state}", expected a US state name or postal abbreviation')
+    return position
+
+
+def corrected_word(rules: Dict, word: str) -> str:
+    """
+    The word of an item name or synonym a misspelt word was meant to be ("alchohol" -> "alcohol"),
+    found among the words sharing a trigram with it. The word itself when none is close enough.
+    """
+    if word in rules["vocabulary"] or len(word) < MIN_CORRECTED_LENGTH:
+        return word
+    trigrams = character_ngrams(word)
+    candidates = set().union(*(rules["trigrams"].get(trigram, ()) for trigram in trigrams))
+    scored = []
+    for candidate in candidates:
+        shared = trigrams & character_ngrams(candidate)
+        overlap = len(shared) / len(trigrams | character_ngrams(candidate))
+        if overlap >= MIN_TRIGRAM_OVERLAP and token_similarity(word, candidate) >= MIN_WORD_SIMILARITY:
+            scored.append((overlap, candidate))
+    return max(scored)[1] if scored else word
+
+
+def resolve_item_tokens(rules: Dict, item_type: str) -> frozenset:
+    """
+    The words of a free-text item type with typos corrected and everyday names ("wine", "vape pens",
+    "lithium batteries") expanded to the words of the items compliance.json names them under.
+    """
+    words = [corrected_word(rules, word) for word in item_words(item_type)]
+    tokens = set(words)
+    # "fire works" and "fire-works" are "fireworks"
+    for first, second in zip(words, words[1:]):
+        if first + second in rules["vocabulary"]:
+            tokens.add(first + second)
+    for start in range(len(words)):
+        for length in range(1, min(rules["longestSynonym"], len(words) - start) + 1):
+            tokens.update(rules["synonyms"].get(tuple(words[start:start + length]), ()))
+    return frozenset(tokens)
+
+
+def resolved_item(rules: Dict, item_type: str) -> Dict:
+    """
+    The resolved words of an item type and the positions of the most specific canonical items it is an
+    instance of: "hazardous waste" is "Hazardous waste", whose rules include those of "Hazardous materials".
+    No items for item types no rule names. Memoized per item type.
+    """
+    def resolve() -> Dict:
+        wanted = resolve_item_tokens(rules, item_type)
+        matches = [position for position, tokens in enumerate(rules["itemTokens"]) if tokens <= wanted]
+        return {
+            "tokens": wanted,
+            "items": [
+                position for position in matches
+                if not any(rules["itemTokens"][position] < rules["itemTokens"][other] for other in matches)
+            ],
+        }
+
+    return memoized(rules["resolved"], item_type.strip().lower(), RESOLVED_CACHE_SIZE, resolve)
+
+
+def canonical_items(rules: Dict, item_type: str) -> List[int]:
+    return resolved_item(rules, item_type)["items"]
+
+
+def related_items(rules: Dict, state: int, item_type: str) -> List[str]:
+    # names of a state's entries sharing a word with the resolved item type, applied or not
+    wanted = resolved_item(rules, item_type)["tokens"]
+    return list(dict.fromkeys(rule["item"] for rule in rules["rules"][state] if rule["tokens"] & wanted))
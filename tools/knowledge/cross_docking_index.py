@@ -0,0 +1,80 @@
+import math
+from typing import Dict, List
+import numpy as np
+
+
+# ordinal scales for the categorical inputs, matched on the first word of the value
+PRIORITY_LEVELS = {"low": 0.0, "medium": 1.0, "high": 2.0}
+TRAFFIC_LEVELS = {"light": 0.0, "moderate": 1.0, "heavy": 2.0}
+WEATHER_LEVELS = {
+    "clear": 0.0, "sunny": 0.0, "cloudy": 0.0,
+    "fog": 1.0, "fogg": 1.0, "foggy": 1.0, "rain": 1.0, "rainy": 1.0,
+    "snow": 2.0, "snowy": 2.0,
+    "storm": 3.0, "stormy": 3.0,
+}
+
+
+def level(levels: Dict[str, float], value: str) -> float:
+    words = value.lower().split()
+    return levels.get(words[0], 1.0) if words else 1.0
+
+
+def scenario_features(scenario: Dict) -> List[float]:
+    """
+    Numeric description of a cross-docking situation, from a knowledge scenario or a request.
+    Volumes are log-scaled so the distance stays meaningful for very large docks.
+    """
+    incoming = scenario["incomingTrucks"]
+    outbound = scenario["outboundTrucks"]
+    incoming_quantity = sum(truck["quantity"] for truck in incoming)
+    outbound_capacity = sum(truck["capacity"] for truck in outbound)
+
+    def load_share(load_type: str) -> float:
+        if not incoming_quantity:
+            return 0.0
+        quantity = sum(truck["quantity"] for truck in incoming if truck["loadType"].lower() == load_type)
+        return quantity / incoming_quantity
+
+    return [
+        math.log1p(len(incoming)),
+        math.log1p(len(outbound)),
+        math.log1p(incoming_quantity),
+        math.log1p(outbound_capacity),
+        math.log1p(scenario["docksAvailable"]),
+        math.log1p(scenario["laborAvailable"]),
+        load_share("perishable"),
+        load_share("fragile"),
+        level(PRIORITY_LEVELS, scenario["priorityLevel"]),
+        level(TRAFFIC_LEVELS, scenario["trafficConditions"]),
+        level(WEATHER_LEVELS, scenario["weatherConditions"]),
+    ]
+
+
+def build_cross_docking_index(knowledge: List[Dict]) -> Dict:
+    """
+    Feature matrix over the worked scenarios of cross_docking.json, standardized per feature.
+    """
+    features = np.array([scenario_features(scenario) for scenario in knowledge], dtype=float)
+    center = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale < 1e-9] = 1.0
+
+    return {
+        "scenarios": knowledge,
+        "center": center,
+        "scale": scale,
+        "features": (features - center) / scale,
+    }
+
+
+def nearest_scenarios(index: Dict, request: Dict, k: int) -> List[Dict]:
+    """
+    The k scenarios closest to the request, nearest first.
+    """
+    query = (np.array(scenario_features(request), dtype=float) - index["center"]) / index["scale"]
+    distances = np.linalg.norm(index["features"] - query, axis=1)
+
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    nearest = nearest[np.argsort(distances[nearest])]
+    return [index["scenarios"][i] for i in nearest]
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from .store import memoized
+
+
+# sqlite file that keeps geocoded addresses across restarts, empty to keep them in memory only
+GEOCODE_CACHE_DB = os.getenv("GEOCODE_CACHE_DB", "")
+GEOCODE_CACHE_SIZE = 100_000
+DISTANCE_CACHE_SIZE = 100_000
+MATRIX_CACHE_SIZE = 32
+
+EARTH_RADIUS_MILES = 3958.8
+
+# spellings of the same word in place names, mapped to the form the gazetteer is indexed by
+PLACE_WORDS = {
+    "saint": "st",
+    "ste": "st",
+    "ft": "fort",
+    "mt": "mount",
+    "nyc": "new york",
+}
+
+
+class Location(NamedTuple):
+    latitude: float
+    longitude: float
+    place: str  # the gazetteer entry the address resolved to, e.g. "Chicago, IL"
+    precision: str  # "zip", "city" or "state"
+
+
+def normalize_address(address: str) -> str:
+    words = []
+    for word in re.findall(r"[a-z0-9-]+|,", address.lower().replace(".", "")):
+        words.append(PLACE_WORDS.get(word, word))
+    return " ".join(words).replace(" ,", ",")
+
+
+def zip_prefixes(spec: List[str]) -> List[str]:
+    prefixes = []
+    for entry in spec:
+        start, _, end = entry.partition("-")
+        prefixes.extend(f"{prefix:03d}" for prefix in range(int(start), int(end or start) + 1))
+    return prefixes
+
+
+def build_gazetteer(knowledge: Dict) -> Dict:
+    """
+    Index gazetteer.json by normalized city and state name, postal abbreviation and 3-digit ZIP prefix.
+    """
+    states = {}
+    state_names = {}
+    state_zips = {}
+    for state in knowledge["states"]:
+        location = Location(state["latitude"], state["longitude"], state["name"], "state")
+        states[state["abbreviation"].lower()] = location
+        state_names[normalize_address(state["name"])] = state["abbreviation"].lower()
+        for prefix in zip_prefixes(state["zipPrefixes"]):
+            state_zips[prefix] = state["abbreviation"].lower()
+
+    # city name -> {state: location}, in file order so the first entry is the default for a bare name
+    cities: Dict[str, Dict[str, Location]] = {}
+    city_zips = {}
+    for city in knowledge["cities"]:
+        location = Location(city["latitude"], city["longitude"], f'{city["name"]}, {city["state"]}', "city")
+        cities.setdefault(normalize_address(city["name"]), {})[city["state"].lower()] = location
+        for prefix in zip_prefixes(city["zipPrefixes"]):
+            city_zips.setdefault(prefix, location._replace(precision="zip"))
+
+    return {
+        "version": hashlib.sha256(json.dumps(knowledge, sort_keys=True).encode()).hexdigest(),
+        "states": states,
+        "stateNames": state_names,
+        "stateZips": state_zips,
+        "cities": cities,
+        "cityZips": city_zips,
+        "longestName": max(len(name.split()) for name in list(cities) + list(state_names)),
+    }
+
+
+def phrases(text: str, longest: int):
+    """
+    Word n-grams of a text, longest first.
+    """
+    words = text.split()
+    for size in range(min(longest, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            yield " ".join(words[start:start + size])
+
+
+def find_state(gazetteer: Dict, parts: List[str]) -> Optional[str]:
+    for part in reversed(parts):
+        words = [word for word in part.split() if not word[0].isdigit()]
+        # a postal abbreviation only counts as the last word of a part, "in" or "me" are words too
+        if words and words[-1] in gazetteer["states"]:
+            return words[-1]
+        candidates = list(phrases(" ".join(words), gazetteer["longestName"]))
+        # "kansas" in "kansas city" names the city, not the state
+        city_names = [phrase for phrase in candidates if phrase in gazetteer["cities"]]
+        for phrase in candidates:
+            if phrase in gazetteer["stateNames"] and not any(
+                phrase != name and f" {phrase} " in f" {name} " for name in city_names
+            ):
+                return gazetteer["stateNames"][phrase]
+    return None
+
+
+def find_city(gazetteer: Dict, parts: List[str], state: Optional[str]) -> Optional[Location]:
+    fallback = None
+    for part in reversed(parts):
+        for phrase in phrases(part, gazetteer["longestName"]):
+            by_state = gazetteer["cities"].get(phrase)
+            if not by_state:
+                continue
+            if state is None:
+                return next(iter(by_state.values()))
+            if state in by_state:
+                return by_state[state]
+            fallback = fallback or next(iter(by_state.values()))
+    return None if state else fallback
+
+
+def resolve(gazetteer: Dict, normalized: str) -> Optional[Location]:
+    """
+    Locate a normalized address by ZIP code, then city, then state.
+    """
+    parts = [part.strip() for part in normalized.split(",") if part.strip()]
+    # a leading street part rarely names the place and often looks like one ("washington ave")
+    has_street = len(parts) > 2 or (len(parts) == 2 and parts[0][0].isdigit())
+    places = parts[1:] if has_street else parts
+    state = find_state(gazetteer, places)
+
+    zip_codes = re.findall(r"\b(\d{5})(?:-\d{4})?\b", " ".join(places))
+    if zip_codes:
+        prefix = zip_codes[-1][:3]
+        if prefix in gazetteer["cityZips"]:
+            return gazetteer["cityZips"][prefix]
+        state = state or gazetteer["stateZips"].get(prefix)
+
+    city = find_city(gazetteer, places, state)
+    if city is not None:
+        return city
+    if state is not None:
+        return gazetteer["states"][state]
+    return None
+
+
+class GeocodeCache:
+    """
+    Resolved addresses by gazetteer version and normalized address: an in-process LRU in front of
+    an optional sqlite table, so addresses seen before a restart are not resolved again.
+    """
+
+    def __init__(self, size: int, db_path: str):
+        self.size = size
+        self.entries: "OrderedDict[str, Optional[Location]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS locations "
+                "(key TEXT PRIMARY KEY, latitude REAL, longitude REAL, place TEXT, precision TEXT)"
+            )
+            self.db.commit()
+
+    def get(self, key: str) -> Tuple[bool, Optional[Location]]:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return True, self.entries[key]
+            if self.db is None:
+                return False, None
+            try:
+                row = self.db.execute(
+                    "SELECT latitude, longitude, place, precision FROM locations WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                return False, None
+        if row is None:
+            return False, None
+        location = Location(*row) if row[0] is not None else None
+        self.put_local(key, location)
+        return True, location
+
+    def put_local(self, key: str, location: Optional[Location]):
+        with self.lock:
+            self.entries[key] = location
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def put(self, key: str, location: Optional[Location]):
+        self.put_local(key, location)
+        if self.db is None:
+            return
+        with self.lock:
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO locations (key, latitude, longitude, place, precision) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key,) + (tuple(location) if location else (None, None, None, None)),
+                )
+                self.db.commit()
+            except sqlite3.Error:
+                pass
+
+
+geocode_cache = GeocodeCache(GEOCODE_CACHE_SIZE, GEOCODE_CACHE_DB)
+
+# (version, first, second) -> miles and (version, addresses) -> matrix
+distance_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+matrix_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], np.ndarray]" = OrderedDict()
+
+
+def geocode(gazetteer: Dict, address: str) -> Optional[Location]:
+    normalized = normalize_address(address)
+    key = gazetteer["version"] + "\x1f" + normalized
+    found, location = geocode_cache.get(key)
+    if not found:
+        location = resolve(gazetteer, normalized)
+        geocode_cache.put(key, location)
+    return location
+
+
+def locate(gazetteer: Dict, addresses: List[str]) -> np.ndarray:
+    """
+    (latitude, longitude) rows for the addresses, NaN where an address could not be located.
+    """
+    points = np.full((len(addresses), 2), np.nan)
+    for row, address in enumerate(addresses):
+        location = geocode(gazetteer, address)
+        if location is not None:
+            points[row] = location.latitude, location.longitude
+    return points
+
+
+def haversine_matrix(first: np.ndarray, second: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Great-circle distances in miles between every row of `first` and every row of `second`
+    (or of `first` itself), both given as (latitude, longitude) in degrees.
+    """
+    second = first if second is None else second
+    lat1, lon1 = np.radians(first[:, 0])[:, None], np.radians(first[:, 1])[:, None]
+    lat2, lon2 = np.radians(second[:, 0])[None, :], np.radians(second[:, 1])[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(gazetteer: Dict, addresses: Tuple[str, ...]) -> np.ndarray:
+    """
+    Read-only matrix of straight-line miles between addresses, NaN where either could not be located.
+    """
+    def compute():
+        matrix = haversine_matrix(locate(gazetteer, list(addresses)))
+        matrix.setflags(write=False)
+        return matrix
+
+    return memoized(matrix_cache, (gazetteer["version"], tuple(addresses)), MATRIX_CACHE_SIZE, compute)
+
+
+def distance(gazetteer: Dict, first: str, second: str) -> Optional[float]:
+    """
+    Straight-line miles between two addresses, None if either could not be located.
+    """
+    first, second = sorted((normalize_address(first), normalize_address(second)))
+
+    def compute():
+        return float(haversine_matrix(locate(gazetteer, [first, second]))[0, 1])
+
+    miles = memoized(distance_cache, (gazetteer["version"], first, second), DISTANCE_CACHE_SIZE, compute)
+    return None if np.isnan(miles) else miles
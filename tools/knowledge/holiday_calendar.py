@@ -0,0 +1,108 @@
+import calendar
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%Y/%m/%d")
+
+# days before the end of a quarter that count as its last week
+END_OF_QUARTER_DAYS = 7
+
+
+def parse_date(value: str) -> date:
+    text = " ".join(value.strip().split())
+    # "YYYY-MM-DD" is by far the most common, and much faster than strptime
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    # "2024-12-24 10:00 AM" and ISO timestamps
+    try:
+        return datetime.fromisoformat(text[:10]).date()
+    except ValueError:
+        raise ValueError(f'Invalid date "{value}", expected "YYYY-MM-DD"')
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    # n-th (1-based, -1 for the last) weekday of a month
+    days = [day for day in calendar.Calendar().itermonthdates(year, month) if day.month == month and day.weekday() == weekday]
+    return days[n - 1] if n > 0 else days[n]
+
+
+def observed(day: date) -> date:
+    # holidays on a Saturday are observed on the Friday before, on a Sunday the Monday after
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def holiday_dates(year: int) -> List[Tuple[date, str]]:
+    """
+    The US federal holidays of a year on their actual dates, which for the fixed-date ones can be a weekend.
+    """
+    holidays = [
+        (date(year, 1, 1), "New Year's Day"),
+        (nth_weekday(year, 1, calendar.MONDAY, 3), "Martin Luther King Jr. Day"),
+        (nth_weekday(year, 2, calendar.MONDAY, 3), "Washington's Birthday"),
+        (nth_weekday(year, 5, calendar.MONDAY, -1), "Memorial Day"),
+        (date(year, 7, 4), "Independence Day"),
+        (nth_weekday(year, 9, calendar.MONDAY, 1), "Labor Day"),
+        (nth_weekday(year, 10, calendar.MONDAY, 2), "Columbus Day"),
+        (date(year, 11, 11), "Veterans Day"),
+        (nth_weekday(year, 11, calendar.THURSDAY, 4), "Thanksgiving Day"),
+        (date(year, 12, 25), "Christmas Day"),
+    ]
+    if year >= 2021:
+        holidays.append((date(year, 6, 19), "Juneteenth National Independence Day"))
+    return sorted(holidays)
+
+
+def federal_holidays(year: int) -> List[Tuple[date, str]]:
+    """
+    The US federal holidays of a year on the days they are observed.
+    """
+    return sorted((observed(day), name) for day, name in holiday_dates(year))
+
+
+def peak_season(day: date) -> Optional[str]:
+    """
+    The peak shipping season a day falls in: the holiday season from Thanksgiving to the end of the year,
+    or the last week of a quarter.
+    """
+    if nth_weekday(day.year, 11, calendar.THURSDAY, 4) <= day <= date(day.year, 12, 31):
+        return "Holiday Season"
+    if day.month % 3 == 0 and calendar.monthrange(day.year, day.month)[1] - day.day < END_OF_QUARTER_DAYS:
+        return "End of Quarter"
+    return None
+
+
+@lru_cache(maxsize=8)
+def business_calendar(first_year: int, last_year: int) -> Dict:
+    """
+    Weekday calendar without the federal holidays of the years, for numpy's business day functions,
+    with the holiday names by observed day and by actual date.
+    """
+    years = range(first_year, last_year + 1)
+    holidays = [holiday for year in years for holiday in federal_holidays(year)]
+    return {
+        "calendar": np.busdaycalendar(weekmask="1111100", holidays=[day for day, _ in holidays]),
+        "names": {day: name for day, name in holidays},
+        "holidays": {day: name for year in years for day, name in holiday_dates(year)},
+        "years": (first_year, last_year),
+    }
+
+
+def calendar_for(days: List[date], default: Dict) -> Dict:
+    # the default calendar when it covers every day, with a year to spare for rolling forward
+    first, last = min(day.year for day in days), max(day.year for day in days) + 1
+    if default["years"][0] <= first and last <= default["years"][1]:
+        return default
+    return business_calendar(min(first, default["years"][0]), max(last, default["years"][1]))
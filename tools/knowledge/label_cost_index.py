@@ -0,0 +1,90 @@
+import math
+import re
+from typing import Dict, Tuple
+import numpy as np
+
+# transit conditions of a shipping type, matched against the "recommendedFor" of the label materials
+SHIPPING_CONDITIONS = {"international": "long transit", "domestic": "short transit"}
+
+
+def parse_quantity_range(text: str) -> Tuple[float, float]:
+    """
+    "101-500 labels" -> (101.0, 500.0), "1001+ labels" -> (1001.0, inf).
+    """
+    numbers = [float(number) for number in re.findall(r"\d+", text.replace(",", ""))]
+    if not numbers:
+        raise ValueError(f'No quantity in "{text}"')
+    if "+" in text or len(numbers) == 1:
+        return numbers[0], math.inf
+    return numbers[0], numbers[1]
+
+
+def readable(key: str) -> str:
+    # "highDurabilitySynthetic" -> "High Durability Synthetic"
+    return " ".join(word.capitalize() for word in re.findall(r"[a-z]+|[A-Z][a-z]*", key))
+
+
+def build_label_cost_index(knowledge: Dict) -> Dict:
+    """
+    The label size and material prices of labeling.json and its bulk discount tiers as arrays,
+    materials in file order and tiers sorted by their first quantity.
+    """
+    sizes = {
+        size.lower(): {"dimensions": entry["dimensions"], "costPerLabel": float(entry["costPerLabel"])}
+        for size, entry in knowledge["label_requirements"]["standardLabelSize"].items()
+    }
+    materials = [
+        {
+            "key": material["materialType"],
+            "name": readable(material["materialType"]),
+            "costPerLabel": float(material["costPerLabel"]),
+            "durability": material.get("durability", ""),
+            "recommendedFor": [use.lower() for use in material.get("recommendedFor", [])],
+        }
+        for material in knowledge["label_material_and_costs"]
+    ]
+    tiers = sorted(
+        (parse_quantity_range(tier["sizeRange"])[0], float(tier["discountPercentage"]), tier["sizeRange"])
+        for tier in knowledge.get("bulk_printing_discounts", {}).get("batchSizes", [])
+    )
+
+    return {
+        "sizes": sizes,
+        "materials": materials,
+        "materialCosts": np.array([material["costPerLabel"] for material in materials]),
+        "tierStarts": np.array([tier[0] for tier in tiers]),
+        "tierDiscounts": np.array([tier[1] for tier in tiers]),
+        "tierNames": [tier[2] for tier in tiers],
+        "carrierSizes": {
+            carrier.lower(): requirement.get("labelSize", "")
+            for carrier, requirement in knowledge["label_requirements"].get("carrierSpecificRequirements", {}).items()
+        },
+    }
+
+
+def find_label_size(index: Dict, package_size: str, carrier: str) -> str:
+    """
+    The standard label size a carrier prescribes, by its dimensions, or else the one named after the package size.
+    """
+    dimensions = index["carrierSizes"].get(carrier.strip().lower())
+    for size, entry in index["sizes"].items():
+        if dimensions and entry["dimensions"] == dimensions:
+            return size
+    size = package_size.strip().lower()
+    if size not in index["sizes"]:
+        raise ValueError(f'Unknown packageSize "{package_size}", expected one of: {", ".join(index["sizes"])}')
+    return size
+
+
+def find_material(index: Dict, shipping_type: str) -> int:
+    """
+    Position of the cheapest material recommended for the transit of a shipping type, the cheapest overall if none is.
+    """
+    normalized = shipping_type.lower()
+    condition = next(
+        (condition for kind, condition in SHIPPING_CONDITIONS.items() if kind in normalized),
+        SHIPPING_CONDITIONS["domestic"],
+    )
+    suited = [position for position, material in enumerate(index["materials"]) if condition in material["recommendedFor"]]
+    candidates = suited or range(len(index["materials"]))
+    return min(candidates, key=lambda position: index["materialCosts"][position])
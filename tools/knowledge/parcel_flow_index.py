@@ -0,0 +1,129 @@
+import json
+import re
+from typing import Dict, List
+from .text_matching import word_tokens
+
+
+SEASON_SYNONYMS = {
+    "christmas": "holiday winter peak",
+    "holiday": "peak",
+    "thanksgiving": "holiday peak",
+    "peak": "holiday",
+    "autumn": "fall",
+    "fall": "autumn",
+    "school": "back",
+    "sale": "promotional event",
+    "promotion": "promotional event sale",
+    "quarter": "end",
+    "monsoon": "rainfall",
+}
+
+WEATHER_SYNONYMS = {
+    "rain": "rainfall weather",
+    "rainy": "rain rainfall weather",
+    "snow": "winter storm weather",
+    "storm": "weather",
+    "stormy": "storm weather",
+    "fog": "weather",
+    "fogg": "fog weather",
+    "heat": "temperature weather",
+    "hot": "heat temperature weather",
+    "flood": "disaster weather",
+    "hurricane": "storm disaster weather",
+}
+
+# words in a scenario that describe weather trouble
+WEATHER_WORDS = {
+    "weather", "storm", "rain", "rainfall", "snow", "heat", "temperature", "winter",
+    "disaster", "flood", "hurricane", "fog",
+}
+
+SHORTAGE_WORDS = {"low", "limited", "short", "shortage", "reduced", "minimal", "understaffed", "strike", "none"}
+
+VOLUME_LEVELS = {"low": 0, "medium": 1, "moderate": 1, "normal": 1, "high": 2, "peak": 2, "very": 2}
+
+# rough characters-per-token ratio used to keep prompts under the token budget
+CHARS_PER_TOKEN = 4
+
+# relative importance of each input attribute when ranking scenarios
+WEIGHTS = {"season": 3.0, "volume": 2.0, "type": 2.0, "weather": 1.5, "staff": 1.0}
+
+
+def volume_level(scenario: Dict) -> int:
+    increase = scenario["seasonalImpact"].get("volumeIncrease", "")
+    match = re.search(r"(\d+)%\s*(increase|decrease)?", increase)
+    if match is None:
+        return 2 if re.search(r"high volume|surge", scenario["description"], re.IGNORECASE) else 1
+    if match.group(2) == "decrease":
+        return 0
+
+    percent = int(match.group(1))
+    return 2 if percent >= 35 else 1 if percent >= 15 else 0
+
+
+def build_parcel_flow_index(knowledge: List[Dict]) -> List[Dict]:
+    """
+    Precomputed matching attributes for every scenario of parcel_flow.json: season, volume level,
+    parcel types, weather and staffing trouble, and the serialized size of the scenario in tokens.
+    """
+    index = []
+    for scenario in knowledge:
+        text = " ".join([
+            scenario["description"],
+            " ".join(delay["cause"] for delay in scenario["commonDelays"]),
+            " ".join(scenario["bottleneckIndicators"].values()),
+        ])
+        words = set(word_tokens(text + " " + scenario["seasonalImpact"]["season"]))
+        serialized = json.dumps(scenario, indent=4)
+
+        index.append({
+            "scenario": scenario,
+            "season": set(word_tokens(scenario["seasonalImpact"]["season"] + " " + scenario["description"])),
+            "volume": volume_level(scenario),
+            "types": set(word_tokens(" ".join(
+                [item["type"] for item in scenario["parcelCharacteristics"]]
+                + [item["category"] for item in scenario["riskLevels"]]
+            ))),
+            "weather": words & WEATHER_WORDS,
+            "staffShortage": bool(re.search(r"(staff|labor)\w*\s+(shortage|strike)|shortage", text, re.IGNORECASE)),
+            "tokens": len(serialized) // CHARS_PER_TOKEN,
+        })
+    return index
+
+
+def overlap(query: set, candidate: set) -> float:
+    return len(query & candidate) / len(query) if query else 0.0
+
+
+def select_scenarios(index: List[Dict], inputParameters, token_budget: int) -> List[Dict]:
+    """
+    The best-matching scenarios for the request, best first, for as many as fit in `token_budget`.
+    The best scenario is always included.
+    """
+    season = set(word_tokens(inputParameters.season, SEASON_SYNONYMS))
+    parcel_types = set(word_tokens(inputParameters.type))
+    weather = set(word_tokens(inputParameters.weatherCondition, WEATHER_SYNONYMS)) & WEATHER_WORDS
+    volume_words = word_tokens(inputParameters.volume)
+    volume = VOLUME_LEVELS.get(volume_words[0], 1) if volume_words else 1
+    shortage = bool(SHORTAGE_WORDS.intersection(word_tokens(inputParameters.staffAvailability)))
+
+    ranked = []
+    for position, entry in enumerate(index):
+        score = (
+            WEIGHTS["season"] * overlap(season, entry["season"])
+            + WEIGHTS["volume"] * (1.0 - abs(volume - entry["volume"]) / 2)
+            + WEIGHTS["type"] * overlap(parcel_types, entry["types"])
+            + WEIGHTS["weather"] * (overlap(weather, entry["weather"]) if weather else float(not entry["weather"]))
+            + WEIGHTS["staff"] * float(shortage == entry["staffShortage"])
+        )
+        ranked.append((-score, position, entry))
+    ranked.sort(key=lambda item: item[:2])
+
+    selected = []
+    used = 0
+    for _, _, entry in ranked:
+        if selected and used + entry["tokens"] > token_budget:
+            break
+        selected.append(entry["scenario"])
+        used += entry["tokens"]
+    return selected
@@ -0,0 +1,105 @@
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .text_matching import word_tokens
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# congestion levels by index, the level of every slot is one of these
+CONGESTION_LEVELS = ["Low", "Moderate", "High"]
+
+# address words that place a stop in a zone, besides the words of the zone name itself
+ZONE_SYNONYMS = {
+    "downtown": ["center", "centre", "cbd", "midtown", "uptown", "financial", "plaza", "square", "city hall"],
+    "commercial": ["business", "industrial", "mall", "market", "warehouse", "retail", "office"],
+    "residential": ["apartment", "apt", "unit", "lane", "ln", "court", "ct", "terrace", "cul de sac"],
+    "suburb": ["outer", "township", "village", "county", "rural", "borough"],
+}
+
+
+def parse_clock(text: str) -> int:
+    """
+    Minutes after midnight of "7:00 AM", "7 pm" or "19:30".
+    """
+    match = re.search(r"(\d{1,2})(?::(\d{2}))?\s*([ap])\.?\s*m\b", text, re.IGNORECASE)
+    if match is None:
+        match = re.search(r"\b(\d{1,2}):(\d{2})\b", text)
+        if match is None:
+            raise ValueError(f'Invalid time "{text}", expected e.g. "10:30 AM"')
+        hour, minute, meridiem = int(match.group(1)), int(match.group(2)), None
+    else:
+        hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3).lower()
+    if meridiem is not None:
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    if hour > 23 or minute > 59:
+        raise ValueError(f'Invalid time "{text}"')
+    return hour * 60 + minute
+
+
+def parse_clock_range(text: str) -> Tuple[int, int]:
+    """
+    "7:00 AM - 9:00 AM" -> (420, 540), a single time -> (time, time).
+    """
+    times = [parse_clock(part) for part in re.split(r"\s+-\s+|\s+to\s+|–", text) if part.strip()]
+    return times[0], times[-1]
+
+
+def parse_rate(text: str) -> float:
+    match = re.search(r"\$\s*(\d+(?:\.\d+)?)", text)
+    if match is None:
+        raise ValueError(f'No rate in "{text}"')
+    return float(match.group(1))
+
+
+def slots(start: int, end: int) -> List[int]:
+    # the 15-minute slots of [start, end) minutes after midnight, wrapping around midnight
+    first, last = start // SLOT_MINUTES, end // SLOT_MINUTES
+    if last <= first:
+        last += SLOTS_PER_DAY
+    return [slot % SLOTS_PER_DAY for slot in range(first, last)]
+
+
+def build_parking_index(knowledge: Dict) -> Dict:
+    """
+    The zone rates, the congestion level of every 15-minute slot of the day and the loading zone time limit
+    of parking_fees.json. Slots are Moderate unless the traffic patterns list them as peak or low congestion.
+    """
+    data = knowledge["generalParkingData"]
+    zones = []
+    for zone in data["zoneTypes"]:
+        tokens = set(word_tokens(zone["zone"]))
+        for word in list(tokens):
+            tokens.update(ZONE_SYNONYMS.get(word, []))
+        zones.append({"name": zone["zone"], "rate": parse_rate(zone["typicalRate"]), "keywords": tokens})
+
+    congestion = np.full(SLOTS_PER_DAY, CONGESTION_LEVELS.index("Moderate"))
+    patterns = data.get("trafficPatterns", {})
+    for hours in patterns.get("lowCongestionHours", []):
+        congestion[slots(*parse_clock_range(hours))] = CONGESTION_LEVELS.index("Low")
+    for hours in patterns.get("peakHours", []):
+        congestion[slots(*parse_clock_range(hours))] = CONGESTION_LEVELS.index("High")
+
+    limit = re.search(r"(\d+)\s*min", data.get("loadingZones", {}).get("timeLimit", ""))
+    return {
+        "zones": zones,
+        "rates": np.array([zone["rate"] for zone in zones]),
+        "congestion": congestion,
+        "loadingZoneMinutes": int(limit.group(1)) if limit else 0,
+    }
+
+
+def find_zone(index: Dict, address: str, in_city: Optional[bool]) -> int:
+    """
+    Position of the zone an address is in: the zone whose words it mentions, else the commercial district
+    for addresses in a known city and the outer boroughs for the rest.
+    """
+    text = " " + " ".join(word_tokens(address)) + " "
+    for position, zone in enumerate(index["zones"]):
+        if any(f" {keyword} " in text for keyword in zone["keywords"]):
+            return position
+    fallback = "commercial" if in_city else "suburb"
+    for position, zone in enumerate(index["zones"]):
+        if fallback in zone["keywords"]:
+            return position
+    return int(np.argmin(index["rates"]))
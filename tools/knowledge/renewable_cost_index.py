@@ -0,0 +1,122 @@
+import math
+import re
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+def parse_price_range(text: str) -> Tuple[float, float]:
+    """
+    "$0.10-$0.20" -> (0.1, 0.2), "$12" -> (12.0, 12.0).
+    """
+    prices = [float(price) for price in re.findall(r"\$\s*(\d+(?:\.\d+)?)", text)]
+    if not prices:
+        raise ValueError(f'No price in "{text}"')
+    return min(prices), max(prices)
+
+
+def parse_efficiency(text: str) -> Tuple[float, str]:
+    """
+    Energy used per mile and its unit: "2 kWh per mile" -> (2.0, "kWh"), "8 miles per gallon" -> (0.125, "gallon").
+    """
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s+(\w+)\s+per\s+(\w+)", text)
+    if match is None:
+        raise ValueError(f'Unrecognized efficiency "{text}"')
+    amount, unit, per = float(match.group(1)), match.group(2), match.group(3)
+    if unit.lower().startswith("mile"):
+        return 1 / amount, per
+    return amount, unit
+
+
+def parse_mileage_range(text: str) -> Tuple[float, float]:
+    """
+    "50-500 miles" -> (50.0, 500.0), "500+ miles" -> (500.0, inf).
+    """
+    numbers = [float(number) for number in re.findall(r"\d+(?:\.\d+)?", text)]
+    if "+" in text or len(numbers) == 1:
+        return numbers[0], math.inf
+    return numbers[0], numbers[1]
+
+
+def vehicle_name(key: str) -> str:
+    # "electricVehicle" -> "Electric Vehicle"
+    return " ".join(word.capitalize() for word in re.findall(r"[a-z]+|[A-Z][a-z]*", key))
+
+
+def price_field(vehicle: Dict) -> str:
+    return next(field for field in vehicle if field.startswith("averageCostPer"))
+
+
+def build_renewable_cost_index(knowledge: Dict) -> Dict:
+    """
+    The vehicle options of renewable_cost.json with their price ranges and efficiencies parsed into
+    arrays (one entry per vehicle, in file order), the conventional fuels for comparison and the
+    distance bands with the vehicles recommended for them.
+    """
+    vehicles: List[Dict] = []
+    for key, vehicle in knowledge["vehicle_options"].items():
+        low, high = parse_price_range(vehicle[price_field(vehicle)])
+        per_mile, unit = parse_efficiency(vehicle["efficiencyPerMile"])
+        emissions = knowledge.get("emission_reductions", {}).get(key, {})
+        vehicles.append({
+            "key": key,
+            "name": vehicle_name(key),
+            "energySource": vehicle["energySource"],
+            "priceLow": low,
+            "priceHigh": high,
+            "perMile": per_mile,
+            "unit": unit,
+            "costPerUnit": f'{vehicle[price_field(vehicle)]} per {unit}',
+            "efficiency": vehicle["efficiencyPerMile"],
+            "emissionReduction": emissions.get("emissionReduction", vehicle.get("environmentalImpact", "")),
+            "incentives": emissions.get("environmentalIncentives", ""),
+            "suitability": vehicle.get("suitability", ""),
+        })
+
+    conventional = []
+    for key, fuel in knowledge.get("conventional_comparison", {}).items():
+        low, high = parse_price_range(fuel[price_field(fuel)])
+        per_mile, unit = parse_efficiency(fuel["efficiencyPerMile"])
+        conventional.append({"name": key.capitalize(), "priceLow": low, "priceHigh": high, "perMile": per_mile})
+
+    bands = []
+    for band in knowledge.get("route_distance", {}).values():
+        start, end = parse_mileage_range(band["mileageRange"])
+        recommended = band["recommendedCarrier"].lower()
+        bands.append({
+            "start": start,
+            "end": end,
+            # the vehicles the band names, by the first word of their energy source
+            "vehicles": [
+                position for position, vehicle in enumerate(vehicles)
+                if vehicle["energySource"].lower().split()[0] in recommended
+            ],
+        })
+    bands.sort(key=lambda band: band["start"])
+
+    return {
+        "vehicles": vehicles,
+        "priceLow": np.array([vehicle["priceLow"] for vehicle in vehicles]),
+        "priceHigh": np.array([vehicle["priceHigh"] for vehicle in vehicles]),
+        "perMile": np.array([vehicle["perMile"] for vehicle in vehicles]),
+        "conventional": conventional,
+        "bandStarts": np.array([band["start"] for band in bands]),
+        # (bands, vehicles) mask of the vehicles recommended in each band
+        "bandVehicles": np.array(
+            [[position in band["vehicles"] for position in range(len(vehicles))] for band in bands], dtype=bool
+        ).reshape(len(bands), len(vehicles)),
+    }
+
+
+def find_vehicle(index: Dict, vehicle_type: str) -> int:
+    """
+    Position of a vehicle given as a key ("electricVehicle"), a name ("Electric Vehicle") or its energy source.
+    """
+    wanted = re.sub(r"[^a-z]", "", vehicle_type.lower())
+    for position, vehicle in enumerate(index["vehicles"]):
+        if wanted in (vehicle["key"].lower(), re.sub(r"[^a-z]", "", vehicle["name"].lower())):
+            return position
+    for position, vehicle in enumerate(index["vehicles"]):
+        if vehicle["energySource"].lower().split()[0] in vehicle_type.lower():
+            return position
+    names = ", ".join(vehicle["name"] for vehicle in index["vehicles"])
+    raise ValueError(f'Unknown vehicleType "{vehicle_type}", expected one of: {names}')
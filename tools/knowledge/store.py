@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+from watchfiles import awatch
+
+logger = logging.getLogger(__name__)
+
+
+memo_lock = threading.Lock()
+
+
+def memoized(cache: OrderedDict, key, size: int, compute):
+    """
+    compute() memoized in a least recently used cache of at most size entries.
+    """
+    with memo_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = compute()
+    with memo_lock:
+        cache[key] = value
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return value
+
+
+class KnowledgeFile:
+    """
+    One loaded version of a knowledge file. Never modified once it is being served.
+    """
+
+    def __init__(self, data: Any, serialized: str, version: str):
+        self.data = data  # parsed JSON, shared by every request, must not be mutated
+        self.serialized = serialized  # the same data as it is embedded in prompts
+        self.version = version  # sha256 of the file contents
+        self.indexes: Dict[Callable, Any] = {}  # builder -> index built from this version
+
+
+class KnowledgeStore:
+    """
+    Knowledge files from the data directory, parsed and serialized for prompts once.
+    The directory is watched and a changed file replaces the old version in a single swap,
+    so prompt building never touches the disk and always sees one consistent version of a file.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.files: Dict[str, KnowledgeFile] = {}
+
+    def load(self):
+        for file_name in sorted(os.listdir(self.data_dir)):
+            if file_name.endswith(".json"):
+                self.reload(file_name)
+
+    def reload(self, name: str):
+        with open(os.path.join(self.data_dir, name), "rb") as knowledge_file:
+            raw = knowledge_file.read()
+
+        data = json.loads(raw)
+        loaded = KnowledgeFile(data, json.dumps(data, indent=4), hashlib.sha256(raw).hexdigest())
+
+        # rebuild the indexes of the previous version before it is swapped out
+        previous = self.files.get(name)
+        if previous is not None:
+            for builder in list(previous.indexes):
+                loaded.indexes[builder] = builder(data)
+
+        self.files = {**self.files, name: loaded}
+
+    def get(self, name: str) -> Any:
+        return self.files[name].data
+
+    def serialized(self, name: str) -> str:
+        return self.files[name].serialized
+
+    def version(self, name: str) -> str:
+        return self.files[name].version
+
+    def index(self, name: str, builder: Callable[[Any], Any]) -> Any:
+        """
+        Return builder(data) for the current version of a file.
+        Built on first use and rebuilt eagerly whenever the file changes.
+        """
+        loaded = self.files[name]
+        if builder not in loaded.indexes:
+            loaded.indexes[builder] = builder(loaded.data)
+        return loaded.indexes[builder]
+
+    async def watch(self):
+        async for changes in awatch(self.data_dir):
+            for _, path in changes:
+                name = os.path.basename(path)
+                if not name.endswith(".json") or not os.path.exists(path):
+                    continue
+
+                try:
+                    await asyncio.to_thread(self.reload, name)
+                except (OSError, ValueError):
+                    # partially written file, keep serving the current version
+                    continue
+                except Exception:
+                    # an index builder failing on the new contents must not stop the watcher,
+                    # the current version stays in service until the file is fixed
+                    logger.exception("Could not reload %s, keeping the current version", name)
+                    continue
+
+
+knowledge_store = KnowledgeStore("data")
+knowledge_store.load()
@@ -0,0 +1,76 @@
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# connecting words that carry no meaning when comparing names
+STOP_WORDS = {"and", "or", "of", "the", "a", "an", "for", "with", "to", "in"}
+
+
+def word_tokens(text: str, synonyms: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Lowercase words of a free-text value, in a crude singular form, with synonyms expanded.
+    """
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+        if synonyms and word in synonyms:
+            tokens.extend(synonyms[word].split())
+    return tokens
+
+
+def token_similarity(left: str, right: str) -> float:
+    if left == right:
+        return 1.0
+    return SequenceMatcher(None, left, right).ratio()
+
+
+def character_ngrams(word: str, n: int = 3) -> set:
+    # "wine" -> {" wi", "win", "ine", "ne "}, padded so short words still have n-grams
+    padded = f" {word} "
+    return {padded[start:start + n] for start in range(len(padded) - n + 1)}
+
+
+def match_score(query: List[str], candidate: List[str], min_token_similarity: float = 0.8) -> float:
+    """
+    Share of the query words found in the candidate, tolerating small typos.
+    """
+    if not query or not candidate:
+        return 0.0
+
+    total = 0.0
+    for word in query:
+        best = max(token_similarity(word, other) for other in candidate)
+        if best >= min_token_similarity:
+            total += best
+    return total / len(query)
+
+
+def best_matches(
+    query: List[str],
+    candidates: Iterable[Tuple[str, List[str]]],
+    threshold: float = 0.5,
+    tolerance: float = 0.05,
+) -> List[str]:
+    """
+    Names of the candidates scoring within `tolerance` of the best score, if that score reaches `threshold`.
+    Ties are broken in favour of candidates with fewer unmatched words.
+    """
+    scored = []
+    for name, tokens in candidates:
+        score = match_score(query, tokens)
+        if score >= threshold:
+            scored.append((score, -len(tokens), name))
+
+    if not scored:
+        return []
+
+    scored.sort(reverse=True)
+    best = scored[0][0]
+    return [name for score, _, name in scored if score >= best - tolerance]
@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, Tuple
+from .parking_index import parse_clock_range
+
+# length of a suggested delivery window
+WINDOW_MINUTES = 60
+
+# shipping zones (as in transit_times) covered per time zone crossed, a parcel within one time zone is in zone 1
+SHIPPING_ZONES_PER_TIME_ZONE = 2
+
+
+def clock(minutes: int) -> str:
+    hour, minute = divmod(minutes % (24 * 60), 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def parse_range(text: str) -> Tuple[float, float]:
+    # "1-2 business days" -> (1.0, 2.0), "12 hours" -> (12.0, 12.0)
+    numbers = [float(number) for number in re.findall(r"\d+(?:\.\d+)?", text)]
+    return numbers[0], numbers[-1]
+
+
+def overlaps(first: Tuple[int, int], second: Tuple[int, int]) -> bool:
+    return first[0] < second[1] and second[0] < first[1]
+
+
+def delivery_windows(origin: Dict, destination: Dict, offset_hours: int) -> List[Dict]:
+    """
+    The windows of the destination's business hours, off-peak windows first and, among those, the ones
+    within the origin's business hours first, so the sender can still be reached. Times are destination local.
+    """
+    opening, closing = destination["businessHours"]
+    shifted = tuple(minutes - offset_hours * 60 for minutes in origin["businessHours"])
+    windows = []
+    for start in range(opening, closing, WINDOW_MINUTES):
+        window = (start, min(start + WINDOW_MINUTES, closing))
+        windows.append({
+            "timeWindow": f"{clock(window[0])} - {clock(window[1])}",
+            "peakTime": any(overlaps(window, peak) for peak in destination["peakTimes"]),
+            "businessHours": f'{destination["businessHoursText"]} {destination["name"]} time',
+            "withinOriginHours": shifted[0] <= window[0] and window[1] <= shifted[1],
+        })
+    return sorted(windows, key=lambda window: (window["peakTime"], not window["withinOriginHours"]))
+
+
+def transit_time(knowledge: Dict, priority: str, origin: int, destination: int, names: List[str]) -> Tuple[str, int]:
+    """
+    Transit time between two zones (positions from east to west) and the business days it takes at most.
+    """
+    transit = knowledge["transit_times"]
+    steps = abs(origin - destination)
+    if priority == "overnight":
+        return "Next business day", 1
+    if priority == "express":
+        express = {key.lower(): parse_range(value) for key, value in transit["express"].items()}
+        first, last = sorted((origin, destination))
+        if steps == len(names) - 1 and "coast_to_coast" in express:
+            low, high = express["coast_to_coast"]
+        elif steps == 0:
+            low, high = min(express.values())
+        else:
+            legs = [express.get(f"{names[zone]}_to_{names[zone + 1]}".lower(), (0.0, 0.0)) for zone in range(first, last)]
+            low, high = sum(leg[0] for leg in legs), sum(leg[1] for leg in legs)
+        return f"{low:g}-{high:g} hours", 1 + int(high // 24)
+
+    shipping_zone = 1 + steps * SHIPPING_ZONES_PER_TIME_ZONE
+    bands = [band for key, band in transit.items() if key != "express" and "zones" in band]
+    band = next((band for band in bands if band["zones"][0] <= shipping_zone <= band["zones"][-1]), None)
+    band = band or max(bands, key=lambda band: band["zones"][-1])
+    return band["time"], int(parse_range(band["time"])[1])
+
+
+def build_timezone_index(knowledge: Dict) -> Dict:
+    """
+    Everything timezone_schedule.json implies for each origin, destination and priority, worked out once:
+    the delivery windows at the destination with their peak flags, transit times, carriers and peak season delays.
+    """
+    zones = []
+    for zone in knowledge["time_zones"]:
+        zones.append({
+            "name": zone["name"],
+            "businessHours": parse_clock_range(zone["business_hours"]),
+            "businessHoursText": zone["business_hours"],
+            "peakTimes": [parse_clock_range(peak) for peak in zone.get("peak_times", [])],
+        })
+    names = [zone["name"] for zone in zones]
+    priorities = list(knowledge["carrier_options"])
+    delays = knowledge.get("peak_season_adjustments", {})
+
+    pairs = {}
+    for origin, origin_zone in enumerate(zones):
+        for destination, destination_zone in enumerate(zones):
+            # the zones are listed from east to west, an hour apart
+            windows = delivery_windows(origin_zone, destination_zone, destination - origin)
+            pairs[origin, destination] = {
+                "windows": windows,
+                "transit": {
+                    priority: transit_time(knowledge, priority, origin, destination, names) for priority in priorities
+                },
+            }
+
+    return {
+        "zones": zones,
+        "names": names,
+        # "eastern", "et", "est" and "edt" all name the Eastern zone
+        "aliases": {
+            alias: position
+            for position, name in enumerate(names)
+            for alias in (name.lower(), f"{name[0]}t".lower(), f"{name[0]}st".lower(), f"{name[0]}dt".lower())
+        },
+        "priorities": priorities,
+        "carriers": knowledge["carrier_options"],
+        "peakSeasonDelays": {priority: delays.get(f"{priority}_delay", "") for priority in priorities},
+        "pairs": pairs,
+    }
+
+
+def find_zone(index: Dict, zone: str) -> int:
+    normalized = re.sub(r"\s*(time|zone|time zone)$", "", zone.strip().lower())
+    if normalized not in index["aliases"]:
+        raise ValueError(f'Unknown time zone "{zone}", expected one of: {", ".join(index["names"])}')
+    return index["aliases"][normalized]
+
+
+def find_priority(index: Dict, priority: str) -> str:
+    normalized = priority.strip().lower()
+    for known in index["priorities"]:
+        if known in normalized:
+            return known
+    raise ValueError(f'Unknown priorityLevel "{priority}", expected one of: {", ".join(index["priorities"])}')
@@ -1,9 +1,29 @@
 import json
+from collections import Counter
+import numpy as np
 from pydantic import BaseModel
-from .custom_types.base_types import Plot, ComparisonPlot
+from .custom_types.base_types import Plot, ComparisonPlot, PlotData
+from .engines.routing import distance_matrix, solve_route, route_objective
+from .knowledge.geocoding import build_gazetteer, distance_matrix as geodesic_matrix
+from .knowledge.store import knowledge_store
 from pydantic import BaseModel
 from typing import List
 
+# how strongly a stop wants to be served early, in typical legs per position it is held back
+PRIORITY_PENALTIES = {"high": 0.5, "medium": 0.2, "low": 0.0}
+PARCEL_PENALTIES = {"perishable": 0.3, "hazardous": 0.1, "fragile": 0.05}
+URGENCY_FACTORS = {"standard": 1.0, "express": 1.5, "critical": 2.0}
+
+HANDLING_REQUIREMENTS = {
+    "perishable": "Temperature Controlled",
+    "fragile": "Fragile Handling",
+    "hazardous": "Special Security",
+    "oversized": "Oversized Handling",
+}
+
+# routes up to this many stops are shown to the model stop by stop, longer ones only in aggregate
+PROMPT_STOPS = 100
+
 
 class StopDetail(BaseModel):
     address: str  # Address of the stop
@@ -40,37 +60,121 @@ class MultiStopRouteOptimizerOutput(BaseModel):
     recommendations: List[str]  # Actionable recommendations to improve route efficiency
 
 
-def multi_stop_route_optimizer_prompt(inputParameters: MultiStopRouteOptimizerInputParams):
+class MultiStopRouteNarrative(BaseModel):
+    # the fields of MultiStopRouteOptimizerOutput that are left to the model
+    highRiskStops: List[str]
+    delayRiskAnalysis: Plot
+    travelComplexityAnalysis: Plot
+    handlingCostEstimation: Plot
+    recommendations: List[str]
+
+
+def handling_requirement(parcelType: str):
+    return HANDLING_REQUIREMENTS.get(parcelType.strip().lower(), "Standard Handling")
+
+
+def multi_stop_route_sequence(inputParameters: MultiStopRouteOptimizerInputParams):
+    """
+    Stop sequence and stop metrics, computed by the routing engine instead of the model.
+    """
+    stops = inputParameters.stops
+    addresses = tuple([inputParameters.routeStart] + [stop.address for stop in stops])
+    gazetteer = knowledge_store.index("gazetteer.json", build_gazetteer)
+    distances = distance_matrix(addresses, geodesic_matrix(gazetteer, addresses))
+
+    # penalties are expressed in typical legs, the distance from a stop to its nearest neighbour
+    nearest = np.where(np.eye(len(distances), dtype=bool), np.inf, distances).min(axis=1) if len(stops) else []
+    typical_leg = float(np.median(nearest)) if len(stops) else 0.0
+    typical_leg = typical_leg if typical_leg > 0 else 1.0
+    urgency = URGENCY_FACTORS.get(inputParameters.urgencyLevel.strip().lower(), 1.0)
+    penalties = np.array([0.0] + [
+        urgency * typical_leg * (
+            PRIORITY_PENALTIES.get(stop.priorityLevel.strip().lower(), 0.0)
+            + PARCEL_PENALTIES.get(stop.parcelType.strip().lower(), 0.0)
+        )
+        for stop in stops
+    ])
+
+    sequence = solve_route(distances, penalties)
+    travelled, _ = route_objective(sequence, distances, penalties)
+
+    route = [
+        RouteStopDetail(
+            address=stops[node - 1].address,
+            parcelType=stops[node - 1].parcelType,
+            priorityLevel=stops[node - 1].priorityLevel,
+            sequenceOrder=order,
+            handlingRequirements=handling_requirement(stops[node - 1].parcelType),
+        )
+        for order, node in enumerate(sequence, start=1)
+    ]
+    priorities = Counter(stop.priorityLevel for stop in stops)
+    requirements = Counter(stop.handlingRequirements for stop in route)
+
+    return {
+        "optimizedRoute": route,
+        "totalStops": len(route),
+        "highPriorityParcelCount": sum(1 for stop in stops if stop.priorityLevel.strip().lower() == "high"),
+        "handlingRequirementSummary": [
+            f"{requirement} required for {count} stop{'s' if count != 1 else ''}"
+            for requirement, count in requirements.most_common()
+        ],
+        "priorityParcelImpact": Plot(
+            xLabel="Priority level",
+            yLabel="Parcels",
+            chartType="pieChart",
+            data=[PlotData(label=level, value=count) for level, count in priorities.most_common()],
+            explanation=(
+                f"The route covers an estimated {round(travelled, 1)} miles, serving higher priority "
+                "and perishable parcels as early as the detours allow."
+            ),
+        ),
+        "handlingRequirementsDistribution": Plot(
+            xLabel="Handling requirement",
+            yLabel="Stops",
+            chartType="barChart",
+            data=[PlotData(label=requirement, value=count) for requirement, count in requirements.most_common()],
+            explanation="Number of stops needing each kind of handling.",
+        ),
+    }
+
+
+def route_summary(inputParameters: MultiStopRouteOptimizerInputParams, computed: dict):
+    """
+    The optimized route for the prompt, stop by stop for short routes and in aggregate for long ones.
+    """
+    route = computed["optimizedRoute"]
+    summary = {
+        "routeStart": inputParameters.routeStart,
+        "urgencyLevel": inputParameters.urgencyLevel,
+        "totalStops": computed["totalStops"],
+        "highPriorityParcelCount": computed["highPriorityParcelCount"],
+        "handlingRequirementSummary": computed["handlingRequirementSummary"],
+    }
+    if len(route) <= PROMPT_STOPS:
+        summary["optimizedRoute"] = [stop.model_dump() for stop in route]
+    else:
+        summary["parcelTypes"] = dict(Counter(stop.parcelType for stop in route))
+        summary["priorityLevels"] = dict(Counter(stop.priorityLevel for stop in route))
+        summary["firstStops"] = [stop.model_dump() for stop in route[:PROMPT_STOPS // 2]]
+        summary["lastStops"] = [stop.model_dump() for stop in route[-PROMPT_STOPS // 2:]]
+    return summary
+
+
+def multi_stop_route_optimizer_prompt(inputParameters: MultiStopRouteOptimizerInputParams, computed: dict):
 
     system_prompt = (
         """
     You are an assistant for a shipping community tool called the Multi-Stop Parcel Route Optimizer.
     Your expertise lies in optimizing multi-stop parcel delivery routes. Given inputs such as stops, parcel types, and priority levels, your role is to generate efficient routes that prioritize high-value parcels, streamline handling requirements, and sequence stops to reduce complexity and avoid delays.
 
+    The stops have already been sequenced by a routing engine, which also counted the parcels and handling
+    requirements. Base your analysis on its route and do not reorder the stops.
+
     **Output Format:**
 
     Your output should include the following fields, each with specific details:
 
-    - `optimizedRoute`: 
-        - **Format**: List of `RouteStopDetail` objects.
-        - **Description**: Display the sequenced stops in the most efficient order, providing details on address, parcel type, priority level, and specific handling requirements.
-        - **Goal**: Offer a time-optimized and priority-aligned order of stops to reduce delivery complexity.
-
-    - `totalStops`: 
-        - **Format**: Integer.
-        - **Description**: Total count of stops in the optimized route.
-        - **Goal**: To give users an overview of the route's scope.
-
-    - `highPriorityParcelCount`: 
-        - **Format**: Integer.
-        - **Description**: The number of high-priority parcels on the route.
-        - **Goal**: To highlight the urgency of certain stops for improved route planning.
-
-    - `handlingRequirementSummary`: 
-        - **Format**: List of strings.
-        - **Description**: Summarize special handling requirements (e.g., "Temperature control required for 3 stops").
-        - **Goal**: Helps users allocate specific resources for handling requirements across stops.
-
     - `highRiskStops`: 
         - **Format**: List of strings.
         - **Description**: List of stops with high risk of delays based on parcel type or handling complexity.
@@ -88,16 +192,6 @@ def multi_stop_route_optimizer_prompt(inputParameters: MultiStopRouteOptimizerIn
         - **Goal**: Identify complexity trends that may impact efficiency and sequencing.
         - **Explanation**: Provide insights on potential complications due to stop types.
 
-    - `priorityParcelImpact`: 
-        - **Chart Type**: "pieChart"
-        - **Description**: Show the distribution of parcels by priority level (e.g., High, Medium, Low).
-        - **Goal**: Helps users prioritize stops by parcel urgency.
-
-    - `handlingRequirementsDistribution`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Show handling requirements (e.g., fragile, temperature control) frequency across stops.
-        - **Goal**: Informs users of the resource allocation needs based on handling requirements.
-
     - `handlingCostEstimation`: 
         - **Chart Type**: "barChart"
         - **Description**: Estimated handling costs by requirement type (e.g., fragile handling, temperature control).
@@ -141,7 +235,7 @@ def multi_stop_route_optimizer_prompt(inputParameters: MultiStopRouteOptimizerIn
 
     Based on these inputs, provide a detailed analysis of the optimized stop sequence, parcel priorities, handling requirements, risk levels, and actionable improvements. Ensure the recommendations directly enhance efficiency and mitigate identified risks without needing specific time estimates for each stop.
     """
-    + json.dumps(inputParameters.model_dump(), indent=4)
+    + json.dumps(route_summary(inputParameters, computed), indent=4)
 )
 
 
@@ -157,7 +251,9 @@ def multi_stop_route_optimizer_prompt(inputParameters: MultiStopRouteOptimizerIn
 tool_config = {
     "multi-stop-route-optimizer": {
         "prompt_func": multi_stop_route_optimizer_prompt,
+        "compute_func": multi_stop_route_sequence,
         "response_format": MultiStopRouteOptimizerOutput,
+        "llm_response_format": MultiStopRouteNarrative,
         "input_format": MultiStopRouteOptimizerInputParams,
         "options": {
             "parcelType": ["Standard", "Perishable", "Fragile", "Oversized", "Hazardous"],
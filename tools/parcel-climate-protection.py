@@ -1,6 +1,8 @@
 import json
 from pydantic import BaseModel
 from .custom_types.base_types import Plot, ComparisonPlot
+from .knowledge.store import knowledge_store
+from .knowledge.climate_index import build_climate_index, climate_records, carrier_records
 from pydantic import BaseModel
 from typing import List
 
@@ -56,9 +58,17 @@ class ParcelClimateProtectionAnalysisResults(BaseModel):
 
 def parcel_climate_protection_prompt(inputParameters: ParcelClimateProtectionInputParams):
 
-    knowledge_file = open("data/climate.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+    index = knowledge_store.index("climate.json", build_climate_index)
+
+    # packaging and carrier records for the matching product types and conditions only,
+    # the complete data when the product type matches nothing in the knowledge file
+    records = climate_records(index, inputParameters.productType, inputParameters.climateCondition)
+    if records:
+        knowledge = json.dumps(
+            {"products": records, "carriers": carrier_records(index, inputParameters.carrierOptions)}, indent=4
+        )
+    else:
+        knowledge = knowledge_store.serialized("climate.json")
 
     system_prompt = (
         """
@@ -68,7 +78,7 @@ def parcel_climate_protection_prompt(inputParameters: ParcelClimateProtectionInp
 
     Strictly use the following data as the foundation for your analysis:
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge +
         """
 
     **Output Format:**
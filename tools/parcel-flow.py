@@ -1,9 +1,14 @@
 import json
 from pydantic import BaseModel
 from .custom_types.base_types import Plot, ComparisonPlot
+from .knowledge.store import knowledge_store
+from .knowledge.parcel_flow_index import build_parcel_flow_index, select_scenarios
 from pydantic import BaseModel
 from typing import List
 
+# upper bound on the knowledge scenarios embedded in a prompt, in (estimated) tokens
+SCENARIO_TOKEN_BUDGET = 2000
+
 
 class ParcelFlowInputParams(BaseModel):
     volume: str
@@ -40,16 +45,16 @@ class ParcelFlowAnalysisResults(BaseModel):
 
 def parcel_flow_prompt(inputParameters: ParcelFlowInputParams):
 
-    knowledge_file = open("data/parcel_flow.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+    index = knowledge_store.index("parcel_flow.json", build_parcel_flow_index)
+    knowledge = select_scenarios(index, inputParameters, SCENARIO_TOKEN_BUDGET)
 
     system_prompt = (
         """
     You are an assistant for a shipping community called the Parcel Flow Tool.
     Your specialty lies in analyzing the flow of parcels based on user-provided inputs, and your task is to generate actionable recommendations for optimizing the parcel flow process.
 
-    Strictly use the following data as the foundation for your analysis:
+    Strictly use the following data as the foundation for your analysis.
+    These are the knowledge scenarios that best match the input, best match first:
     """
         + json.dumps(knowledge, indent=4) +
         """
@@ -1,7 +1,13 @@
 import json
+import numpy as np
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from .custom_types.base_types import Plot
+from .custom_types.base_types import Plot, PlotData
+from .engines.renewable_cost import route_costs, fleet_costs
+from .knowledge.renewable_cost_index import build_renewable_cost_index, find_vehicle
+from .knowledge.store import knowledge_store
+
+FLEET_MODES = ["fleet", "perRoute"]
 
 class RenewableTransportCostEstimatorInputParams(BaseModel):
     routeDistance: float  # Route distance in miles
@@ -26,10 +32,150 @@ class RenewableTransportCostEstimatorResults(BaseModel):
     environmentalIncentives: List[str]  # List of available incentives for renewable transport
 
 
-def renewable_transport_cost_estimator_prompt(inputParameters: RenewableTransportCostEstimatorInputParams):
-    with open("data/renewable_cost.json", "r") as knowledge_file:
-        knowledge = json.load(knowledge_file)
+class RenewableTransportIncentives(BaseModel):
+    # the field of RenewableTransportCostEstimatorResults that is left to the model
+    environmentalIncentives: List[str]
+
+
+class FleetRoute(BaseModel):
+    routeId: Optional[str] = None  # Identifier of the route in the fleet manifest
+    routeDistance: float  # Route distance in miles
+    vehicleType: Optional[str] = None  # Vehicle currently planned for the route, if any
+
+
+class RenewableFleetCostInputParams(BaseModel):
+    routes: List[FleetRoute]  # Routes of the fleet manifest
+    mode: str = "fleet"  # "fleet" for totals only, "perRoute" to also list every route
+
+
+class FleetVehicleCost(BaseModel):
+    vehicleName: str
+    totalCost: float  # Cost of running every route with this vehicle, at the middle of the price range
+    lowCost: float  # The same at the low end of the price range
+    highCost: float  # The same at the high end of the price range
+    costPerMile: float
+    recommendedRoutes: int  # Routes this vehicle is recommended for
+
+
+class RouteCostEstimate(BaseModel):
+    routeId: Optional[str]
+    routeDistance: float
+    recommendedVehicle: str
+    assignedVehicle: Optional[str]
+    vehicleCosts: Dict[str, float]  # Vehicle name -> cost of the route
+
+
+class RenewableFleetCostResults(BaseModel):
+    routeCount: int
+    totalDistance: float  # Miles over all routes
+    fleetCostByVehicle: List[FleetVehicleCost]  # The whole fleet on each vehicle type
+    recommendedFleetCost: float  # Every route on its recommended vehicle
+    assignedFleetCost: float  # Every route on its planned vehicle, or the recommended one if none is planned
+    conventionalFleetCost: Dict[str, float]  # The whole fleet on each conventional fuel
+    routeEstimates: Optional[List[RouteCostEstimate]]  # Every route, in "perRoute" mode only
+
+
+def renewable_transport_costs(inputParameters: RenewableTransportCostEstimatorInputParams):
+    """
+    Route cost of every vehicle type, computed from the parsed price ranges instead of by the model.
+    """
+    index = knowledge_store.index("renewable_cost.json", build_renewable_cost_index)
+    selected = find_vehicle(index, inputParameters.vehicleType)
+    costs = route_costs(index, np.array([inputParameters.routeDistance]))
+    vehicles = index["vehicles"]
+    recommended = vehicles[int(costs["recommended"][0])]
+
+    comparison = [PlotData(label=vehicle["name"], value=round(float(costs["mid"][0, position]), 2))
+                  for position, vehicle in enumerate(vehicles)]
+    comparison += [PlotData(label=fuel["name"], value=round(float(costs["conventional"][0, position]), 2))
+                   for position, fuel in enumerate(index["conventional"])]
+
+    return {
+        "estimatedTotalCost": round(float(costs["mid"][0, selected]), 2),
+        "vehicleCostEstimates": [
+            VehicleCostEstimate(
+                vehicleName=vehicle["name"],
+                energySource=vehicle["energySource"],
+                costEstimate=round(float(costs["mid"][0, position]), 2),
+                costPerUnit=vehicle["costPerUnit"],
+                efficiency=vehicle["efficiency"],
+                environmentalImpact=vehicle["emissionReduction"],
+            )
+            for position, vehicle in enumerate(vehicles)
+        ],
+        "emissionReductions": {vehicle["name"]: vehicle["emissionReduction"] for vehicle in vehicles},
+        "recommendedVehicle": recommended["name"],
+        "vehicleComparisonAnalysis": Plot(
+            xLabel="Vehicle type",
+            yLabel="Route cost ($)",
+            chartType="barChart",
+            data=comparison,
+            explanation=(
+                f"Energy cost of the {inputParameters.routeDistance} mile route at the middle of each price range. "
+                f'The {recommended["name"]} is the cheapest of the vehicles recommended for this distance '
+                f'({recommended["suitability"].lower()}).'
+            ),
+        ),
+    }
+
+
+def renewable_fleet_costs(inputParameters: RenewableFleetCostInputParams):
+    """
+    Costs of a whole fleet manifest on every vehicle type, in one vectorized pass over its routes.
+    """
+    if inputParameters.mode not in FLEET_MODES:
+        raise ValueError(f'Unknown mode "{inputParameters.mode}", expected one of: {", ".join(FLEET_MODES)}')
+
+    index = knowledge_store.index("renewable_cost.json", build_renewable_cost_index)
+    vehicles = index["vehicles"]
+    routes = inputParameters.routes
+    distances = np.array([route.routeDistance for route in routes], dtype=float)
+
+    planned = {route.vehicleType for route in routes if route.vehicleType}
+    positions = {vehicle_type: find_vehicle(index, vehicle_type) for vehicle_type in planned}
+    assigned = np.array([positions[route.vehicleType] if route.vehicleType else -1 for route in routes], dtype=int)
+
+    fleet = fleet_costs(index, distances, assigned)
+    total_distance = float(distances.sum())
+
+    route_estimates = None
+    if inputParameters.mode == "perRoute":
+        names = [vehicle["name"] for vehicle in vehicles]
+        route_estimates = [
+            RouteCostEstimate(
+                routeId=route.routeId,
+                routeDistance=route.routeDistance,
+                recommendedVehicle=names[recommended],
+                assignedVehicle=names[positions[route.vehicleType]] if route.vehicleType else None,
+                vehicleCosts={name: round(cost, 2) for name, cost in zip(names, costs)},
+            )
+            for route, recommended, costs in zip(routes, fleet["recommended"].tolist(), fleet["mid"].tolist())
+        ]
+
+    return {
+        "routeCount": len(routes),
+        "totalDistance": round(total_distance, 2),
+        "fleetCostByVehicle": [
+            FleetVehicleCost(
+                vehicleName=vehicle["name"],
+                totalCost=round(float(fleet["byVehicle"]["mid"][position]), 2),
+                lowCost=round(float(fleet["byVehicle"]["low"][position]), 2),
+                highCost=round(float(fleet["byVehicle"]["high"][position]), 2),
+                costPerMile=round(vehicle["perMile"] * (vehicle["priceLow"] + vehicle["priceHigh"]) / 2, 4),
+                recommendedRoutes=int(fleet["recommendedCounts"][position]),
+            )
+            for position, vehicle in enumerate(vehicles)
+        ],
+        "recommendedFleetCost": round(fleet["recommendedTotal"], 2),
+        "assignedFleetCost": round(fleet["assignedTotal"], 2),
+        "conventionalFleetCost": {
+            fuel["name"]: round(float(total), 2) for fuel, total in zip(index["conventional"], fleet["conventionalTotal"])
+        },
+        "routeEstimates": route_estimates,
+    }
+
 
+def renewable_transport_cost_estimator_prompt(inputParameters: RenewableTransportCostEstimatorInputParams, computed: dict):
     system_prompt = (
         """
     You are an assistant for a shipping tool called the Renewable Transport Cost Estimator.
@@ -37,46 +183,23 @@ def renewable_transport_cost_estimator_prompt(inputParameters: RenewableTranspor
 
     Use the provided data for reference:
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge_store.serialized("renewable_cost.json") +
         """
 
+    The route has already been costed from this data for every vehicle type; the results are given below.
+    Base your answer on them and do not recompute them.
+
     **Output Format:**
 
     Your output should include the following fields:
 
-    - `estimatedTotalCost`: 
-        - **Format**: Float.
-        - **Description**: Total estimated cost for the route using the chosen vehicle type.
-        - **Goal**: To provide a clear overview of the transportation cost using renewable energy.
-
-    - `vehicleCostEstimates`: 
-        - **Format**: List of `VehicleCostEstimate` objects.
-        - **Description**: Detailed cost analysis per vehicle type, including energy source, cost per unit, efficiency per mile, and environmental impact.
-        - **Goal**: To help users compare the cost and efficiency of different renewable vehicles.
-
-    - `emissionReductions`: 
-        - **Format**: Dictionary.
-        - **Description**: Emission reduction details for each vehicle type.
-        - **Goal**: To highlight the environmental benefits of each renewable vehicle type.
-
-    - `recommendedVehicle`: 
-        - **Format**: String.
-        - **Description**: Vehicle type recommended based on the route distance.
-        - **Goal**: Guide users to the most efficient vehicle for their route length.
-
-    - `vehicleComparisonAnalysis`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Show cost efficiency comparison across vehicle types.
-        - **Goal**: Visual representation of vehicle cost-effectiveness for informed decision-making.
-        - **Explanation**: Summary of the cost benefits of each vehicle type.
-
     - `environmentalIncentives`: 
         - **Format**: List of strings.
         - **Description**: Available environmental incentives, subsidies, or grants related to the chosen vehicle type.
         - **Goal**: Inform users of cost-saving opportunities for renewable transport.
 
     **Note:**
-    Only use ["barChart"] for visualizations to compare vehicle cost efficiency.
+    Focus the incentives on the recommended vehicle and the vehicle type the user asked about.
     """
     )
 
@@ -85,6 +208,18 @@ def renewable_transport_cost_estimator_prompt(inputParameters: RenewableTranspor
         I need a cost analysis for renewable-powered transport based on the following input:
         """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        Route costs:
+        """
+        + json.dumps(
+            {
+                "estimatedTotalCost": computed["estimatedTotalCost"],
+                "recommendedVehicle": computed["recommendedVehicle"],
+                "vehicleCostEstimates": [estimate.model_dump() for estimate in computed["vehicleCostEstimates"]],
+            },
+            indent=4,
+        )
     )
 
     messages = [
@@ -98,10 +233,23 @@ def renewable_transport_cost_estimator_prompt(inputParameters: RenewableTranspor
 tool_config = {
     "renewable-transport-cost-estimator": {
         "prompt_func": renewable_transport_cost_estimator_prompt,
+        "compute_func": renewable_transport_costs,
         "response_format": RenewableTransportCostEstimatorResults,
+        "llm_response_format": RenewableTransportIncentives,
         "input_format": RenewableTransportCostEstimatorInputParams,
         "options": {
             "vehicleType": ["Electric Vehicle", "Hydrogen Vehicle", "Biofuel Vehicle"]
         }
+    },
+    # fleet manifests are costed entirely locally, without the language model
+    "renewable-fleet-cost-estimator": {
+        "compute_func": renewable_fleet_costs,
+        "response_format": RenewableFleetCostResults,
+        "input_format": RenewableFleetCostInputParams,
+        "cache": False,
+        "options": {
+            "vehicleType": ["Electric Vehicle", "Hydrogen Vehicle", "Biofuel Vehicle"],
+            "mode": FLEET_MODES,
+        }
     }
 }
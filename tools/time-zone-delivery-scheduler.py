@@ -1,7 +1,23 @@
 import json
+from datetime import date, timedelta
+import numpy as np
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from .custom_types.base_types import Plot
+from .knowledge.holiday_calendar import business_calendar, calendar_for, parse_date, peak_season
+from .knowledge.store import knowledge_store
+from .knowledge.timezone_index import build_timezone_index, find_priority, find_zone
+
+# days around the transit of a parcel in which holidays are worth an alert
+HOLIDAY_ALERT_DAYS = 7
+
+# parcels scheduled by a single bulk request
+MAX_BULK_PARCELS = 100_000
+
+# the business day calendar and the time zone tables are worked out at startup rather than on the first request;
+# the tables are rebuilt whenever timezone_schedule.json changes
+default_calendar = business_calendar(date.today().year - 1, date.today().year + 5)
+knowledge_store.index("timezone_schedule.json", build_timezone_index)
 
 class TimeZoneDeliverySchedulerInputParams(BaseModel):
     # Origin zone for the parcel (e.g., "Eastern", "Central")
@@ -39,11 +55,181 @@ class TimeZoneDeliverySchedulerAnalysisResults(BaseModel):
     deliverySuccessProbability: float  # Probability percentage of on-time delivery
     
 
-def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedulerInputParams):
+class TimeZoneDeliveryNarrative(BaseModel):
+    # the fields of TimeZoneDeliverySchedulerAnalysisResults that are left to the model
+    transitImpactSummary: str
+    peakTimeAnalysis: Plot
+    carrierEfficiencyComparison: Plot
+    seasonalImpactPrediction: str
+    peakSeasonDelayEstimate: str
+    timeZoneSpecificRegulations: List[str]
+    trafficImpactAnalysis: str
+    deliverySuccessProbability: float
+
+
+class ParcelSchedule(BaseModel):
+    parcelId: Optional[str] = None  # Identifier of the parcel in the manifest
+    originZone: str
+    destinationZone: str
+    priorityLevel: str
+    estimatedDeliveryDate: str
+
+
+class BulkDeliverySchedulerInputParams(BaseModel):
+    parcels: List[ParcelSchedule]  # Parcels of the manifest
+
+
+class ScheduledParcel(BaseModel):
+    parcelId: Optional[str]
+    deliveryDate: str  # Estimated delivery date, moved to the next business day if needed
+    dateAdjusted: bool  # Whether the estimated date fell on a weekend or holiday
+    adjustmentReason: Optional[str]  # The weekend day or holiday the estimated date fell on
+    deliveryWindow: str  # Best delivery window at the destination, in its local time
+    peakTime: bool  # Whether that window is in the destination's peak hours
+    transitTime: str  # Transit time for the priority level
+    peakSeason: Optional[str]  # Peak season the delivery date falls in
+
+
+class BulkDeliverySchedulerResults(BaseModel):
+    parcelCount: int
+    adjustedCount: int  # Parcels moved off a weekend or holiday
+    peakSeasonCount: int  # Parcels delivered in a peak season
+    parcels: List[ScheduledParcel]
+
+
+def long_date(day: date) -> str:
+    return f"{day:%A, %B} {day.day}, {day.year}"
+
+
+def day_off(calendar: dict, day: date) -> Optional[str]:
+    # why a day is not a business day, None if it is one; a holiday on a weekend is named too
+    if day in calendar["names"]:
+        return calendar["names"][day]
+    if day.weekday() >= 5:
+        return calendar["holidays"].get(day, f"a {day:%A}")
+    return None
+
+
+def delivery_date(day: date) -> dict:
+    calendar = calendar_for([day], default_calendar)
+    adjusted = np.busday_offset(np.datetime64(day, "D"), 0, roll="forward", busdaycal=calendar["calendar"]).item()
+    return {"date": adjusted, "reason": day_off(calendar, day), "names": calendar["names"]}
+
+
+def holiday_alerts(names: dict, day: date, transit_days: int, priority: str, delays: dict) -> List[str]:
+    """
+    Holidays from shortly before the parcel ships until shortly after its delivery, and the peak season it is in.
+    """
+    first = day - timedelta(days=transit_days * 7 // 5 + HOLIDAY_ALERT_DAYS)
+    last = day + timedelta(days=HOLIDAY_ALERT_DAYS)
+    alerts = []
+    for holiday, name in sorted(names.items()):
+        if first <= holiday <= last:
+            days = abs((holiday - day).days)
+            when = "on the delivery date" if holiday == day else (
+                f"{days} day{'s' if days > 1 else ''} {'before' if holiday < day else 'after'} the delivery date"
+            )
+            alerts.append(f"{name} is observed on {long_date(holiday)}, {when}; carriers do not deliver and hubs close.")
+    season = peak_season(day)
+    if season is not None:
+        delay = delays.get(priority)
+        alerts.append(
+            f"The delivery date falls in the {season} peak" + (f"; allow an extra {delay} for {priority.capitalize()} shipments." if delay else ".")
+        )
+    return alerts
+
+
+def time_zone_schedule(inputParameters: TimeZoneDeliverySchedulerInputParams):
+    """
+    Delivery windows, carriers, the delivery date adjustment and holiday alerts, looked up in the precomputed tables.
+    """
+    index = knowledge_store.index("timezone_schedule.json", build_timezone_index)
+    origin = find_zone(index, inputParameters.originZone)
+    destination = find_zone(index, inputParameters.destinationZone)
+    priority = find_priority(index, inputParameters.priorityLevel)
+    pair = index["pairs"][origin, destination]
+    transit, transit_days = pair["transit"][priority]
+
+    day = parse_date(inputParameters.estimatedDeliveryDate)
+    delivery = delivery_date(day)
+    if delivery["reason"] is None:
+        adjustment = f"No adjustment needed: {long_date(day)} is a business day."
+    else:
+        adjustment = (
+            f"{long_date(day)} is {delivery['reason']}, when carriers do not deliver; "
+            f"deliver on {long_date(delivery['date'])} instead."
+        )
+
+    return {
+        "optimalDeliveryWindows": [
+            DeliveryWindowRecommendation(
+                timeWindow=window["timeWindow"], peakTime=window["peakTime"], businessHours=window["businessHours"]
+            )
+            for window in pair["windows"]
+        ],
+        "carrierOptions": [CarrierOption(name=carrier, deliveryTimeEstimate=transit) for carrier in index["carriers"][priority]],
+        "recommendedDeliveryDateAdjustment": adjustment,
+        "holidaySeasonAlerts": holiday_alerts(
+            delivery["names"], delivery["date"], transit_days, priority, index["peakSeasonDelays"]
+        ),
+    }
+
+
+def bulk_time_zone_schedule(inputParameters: BulkDeliverySchedulerInputParams):
+    """
+    Schedule every parcel of a manifest: zones, priorities and dates are turned into arrays once and the
+    delivery dates are moved off weekends and holidays in a single numpy call.
+    """
+    parcels = inputParameters.parcels
+    if len(parcels) > MAX_BULK_PARCELS:
+        raise ValueError(f"A manifest can have at most {MAX_BULK_PARCELS} parcels, got {len(parcels)}")
+    if not parcels:
+        return {"parcelCount": 0, "adjustedCount": 0, "peakSeasonCount": 0, "parcels": []}
+
+    index = knowledge_store.index("timezone_schedule.json", build_timezone_index)
+    zones = {}
+    for parcel in parcels:
+        for zone in (parcel.originZone, parcel.destinationZone):
+            if zone not in zones:
+                zones[zone] = find_zone(index, zone)
+    # every distinct priority and date text is parsed once
+    priorities = {priority: find_priority(index, priority) for priority in {parcel.priorityLevel for parcel in parcels}}
+    dates = {text: parse_date(text) for text in {parcel.estimatedDeliveryDate for parcel in parcels}}
+
+    calendar = calendar_for(list(dates.values()), default_calendar)
+    requested = np.array([dates[parcel.estimatedDeliveryDate] for parcel in parcels], dtype="datetime64[D]")
+    adjusted = np.busday_offset(requested, 0, roll="forward", busdaycal=calendar["calendar"])
+    moved = adjusted != requested
+
+    # per distinct delivery date and per zone pair, not per parcel
+    seasons = {day: peak_season(day) for day in np.unique(adjusted).tolist()}
+    reasons = {day: day_off(calendar, day) for day in np.unique(requested[moved]).tolist()}
+    best_windows = {key: pair["windows"][0] for key, pair in index["pairs"].items()}
+
+    scheduled = []
+    for parcel, day, delivered, was_moved in zip(parcels, requested.tolist(), adjusted.tolist(), moved.tolist()):
+        pair = (zones[parcel.originZone], zones[parcel.destinationZone])
+        window = best_windows[pair]
+        scheduled.append(ScheduledParcel(
+            parcelId=parcel.parcelId,
+            deliveryDate=delivered.isoformat(),
+            dateAdjusted=was_moved,
+            adjustmentReason=reasons[day] if was_moved else None,
+            deliveryWindow=window["timeWindow"],
+            peakTime=window["peakTime"],
+            transitTime=index["pairs"][pair]["transit"][priorities[parcel.priorityLevel]][0],
+            peakSeason=seasons[delivered],
+        ))
+
+    return {
+        "parcelCount": len(parcels),
+        "adjustedCount": int(moved.sum()),
+        "peakSeasonCount": sum(parcel.peakSeason is not None for parcel in scheduled),
+        "parcels": scheduled,
+    }
+
 
-    knowledge_file = open("data/timezone_schedule.json", "r")
-    knowledge = json.loads(knowledge_file.read())
-    knowledge_file.close()
+def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedulerInputParams, computed: dict):
 
     system_prompt = (
         """
@@ -53,20 +239,14 @@ def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedul
 
     Strictly use the following data as the basis for your analysis:
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge_store.serialized("timezone_schedule.json") +
         """
 
-    **Output Format:**
-
-    - `optimalDeliveryWindows`: 
-        - **Format**: List of `DeliveryWindowRecommendation` objects.
-        - **Description**: Provide recommended delivery windows, highlighting peak hours and standard business hours.
-        - **Goal**: Ensure timely and coordinated delivery across different time zones.
+    The delivery windows, carriers, delivery date adjustment and holiday alerts have already been worked
+    out from this data and a federal holiday calendar; they are given below. Base your analysis on them
+    and do not recompute them.
 
-    - `carrierOptions`: 
-        - **Format**: List of `CarrierOption` objects.
-        - **Description**: List carriers suitable for the specified priority level, with estimated delivery times.
-        - **Goal**: Help users select the best carrier based on time efficiency across zones.
+    **Output Format:**
 
     - `transitImpactSummary`: 
         - **Format**: Text-based.
@@ -98,21 +278,11 @@ def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedul
         - **Description**: Provide any regulatory cutoffs or restrictions specific to each time zone affecting parcel delivery.
         - **Goal**: Ensure compliance with zone-specific regulations for timely delivery.
 
-    - `recommendedDeliveryDateAdjustment`: 
-        - **Format**: Text-based.
-        - **Description**: Suggest adjustments to the recommended delivery date if the initial date falls on a weekend or holiday.
-        - **Goal**: Help users choose the most appropriate delivery date for successful on-time delivery.
-
     - `trafficImpactAnalysis`: 
         - **Format**: Text-based.
         - **Description**: Summarize expected traffic impacts at the origin and destination zones, especially during rush hours.
         - **Goal**: Provide insight into transit conditions due to traffic.
 
-    - `holidaySeasonAlerts`: 
-        - **Format**: List of holiday alert strings.
-        - **Description**: Notify users of upcoming holidays that might delay delivery.
-        - **Goal**: Help users plan for holiday-related delays.
-
     - `deliverySuccessProbability`: 
         - **Format**: Percentage (float).
         - **Description**: Provide an estimated probability of on-time delivery based on current conditions.
@@ -127,6 +297,19 @@ def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedul
         Analyze the delivery schedule requirements based on the following input:
         """
         + json.dumps(inputParameters.model_dump(), indent=4)
+        + """
+
+        Schedule:
+        """
+        + json.dumps(
+            {
+                "optimalDeliveryWindows": [window.model_dump() for window in computed["optimalDeliveryWindows"]],
+                "carrierOptions": [carrier.model_dump() for carrier in computed["carrierOptions"]],
+                "recommendedDeliveryDateAdjustment": computed["recommendedDeliveryDateAdjustment"],
+                "holidaySeasonAlerts": computed["holidaySeasonAlerts"],
+            },
+            indent=4,
+        )
     )
 
     messages = [
@@ -140,12 +323,26 @@ def time_zone_delivery_scheduler_prompt(inputParameters: TimeZoneDeliverySchedul
 tool_config = {
     "time-zone-delivery-scheduler": {
         "prompt_func": time_zone_delivery_scheduler_prompt,
+        "compute_func": time_zone_schedule,
         "response_format": TimeZoneDeliverySchedulerAnalysisResults,
+        "llm_response_format": TimeZoneDeliveryNarrative,
         "input_format": TimeZoneDeliverySchedulerInputParams,
         "options": {
             "originZone": ["Eastern", "Central", "Mountain", "Pacific"],
             "destinationZone": ["Eastern", "Central", "Mountain", "Pacific"],
             "priorityLevel": ["Standard", "Express", "Overnight"],
         }
+    },
+    # manifests are scheduled entirely locally, without the language model
+    "time-zone-bulk-delivery-scheduler": {
+        "compute_func": bulk_time_zone_schedule,
+        "response_format": BulkDeliverySchedulerResults,
+        "input_format": BulkDeliverySchedulerInputParams,
+        "cache": False,
+        "options": {
+            "originZone": ["Eastern", "Central", "Mountain", "Pacific"],
+            "destinationZone": ["Eastern", "Central", "Mountain", "Pacific"],
+            "priorityLevel": ["Standard", "Express", "Overnight"],
+        }
     }
 }
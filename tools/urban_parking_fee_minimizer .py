@@ -1,7 +1,21 @@
 import json
+from collections import Counter
+import numpy as np
 from pydantic import BaseModel
 from typing import List
-from .custom_types.base_types import Plot
+from .custom_types.base_types import Plot, PlotData
+from .engines.parking_planner import STOP_MINUTES, plan_slots, slot_costs
+from .knowledge.geocoding import build_gazetteer, geocode, distance
+from .knowledge.parking_index import (
+    CONGESTION_LEVELS, SLOT_MINUTES, SLOTS_PER_DAY, build_parking_index, find_zone, parse_clock_range
+)
+from .knowledge.store import knowledge_store
+
+# slots a stop may move either way from a single requested time, by urgency level
+URGENCY_FLEXIBILITY_SLOTS = {"standard": 8, "same-day": 4, "express": 2}
+
+# stops listed one by one in the prompt, longer routes are summarized by zone
+PROMPT_STOPS = 50
 
 class DeliveryLocation(BaseModel):
     location: str
@@ -41,10 +55,152 @@ class UrbanParkingFeeMinimizerResults(BaseModel):
     congestionImpactAnalysis: Plot  # Line chart showing congestion levels over the day for delivery locations
 
 
-def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInputParams):
-    with open("data/parking_fees.json", "r") as knowledge_file:
-        knowledge = json.load(knowledge_file)
+def located_stops(inputParameters: ParkingFeeMinimizerInputParams):
+    """
+    Where each delivery location is and how far it is from the previous one, from the offline gazetteer.
+    """
+    gazetteer = knowledge_store.index("gazetteer.json", build_gazetteer)
+    stops = []
+    previous = None
+    for delivery in inputParameters.deliveryLocations:
+        location = geocode(gazetteer, delivery.location)
+        miles = distance(gazetteer, previous, delivery.location) if previous is not None else None
+        stops.append({
+            "location": delivery.location,
+            "resolvedTo": location.place if location else None,
+            "milesFromPreviousStop": round(miles, 1) if miles is not None else None,
+        })
+        previous = delivery.location
+    return stops
+
+
+class UrbanParkingNarrative(BaseModel):
+    # the fields of UrbanParkingFeeMinimizerResults that are left to the model
+    loadingZoneInfo: str
+    permitRecommendations: List[PermitRecommendation]
+    seasonalEventImpact: str
+    congestionImpactAnalysis: Plot
+
+
+def clock(slot: int) -> str:
+    hour, minute = divmod(int(slot) * SLOT_MINUTES, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def delivery_windows(inputParameters: ParkingFeeMinimizerInputParams):
+    """
+    Requested, earliest and latest slot of every stop. A time range is the window itself,
+    a single time may move by the flexibility of the urgency level.
+    """
+    flexibility = URGENCY_FLEXIBILITY_SLOTS.get(
+        inputParameters.urgencyLevel.strip().lower(), URGENCY_FLEXIBILITY_SLOTS["standard"]
+    )
+    requested, earliest, latest = [], [], []
+    for delivery in inputParameters.deliveryLocations:
+        start, end = parse_clock_range(delivery.deliveryTime)
+        first = start // SLOT_MINUTES
+        if end > start:
+            window = (first, max(first, (end - STOP_MINUTES) // SLOT_MINUTES))
+        else:
+            window = (max(0, first - flexibility), min(SLOTS_PER_DAY - 1, first + flexibility))
+        requested.append(first)
+        earliest.append(window[0])
+        latest.append(window[1])
+    return np.array(requested), np.array(earliest), np.array(latest)
+
+
+def parking_plan(inputParameters: ParkingFeeMinimizerInputParams):
+    """
+    Zone, delivery slot and parking fee of every stop, planned by dynamic programming over the 15-minute
+    slots of the day so that fees and congestion are lowest, keeping the stops in the order of their times.
+    """
+    index = knowledge_store.index("parking_fees.json", build_parking_index)
+    gazetteer = knowledge_store.index("gazetteer.json", build_gazetteer)
+    deliveries = inputParameters.deliveryLocations
+    if not deliveries:
+        return {
+            "totalEstimatedParkingCost": 0.0,
+            "parkingCostAnalysis": [],
+            "trafficAnalysis": [],
+            "parkingFeeComparison": Plot(
+                xLabel="Delivery location", yLabel="Parking cost ($)", chartType="barChart", data=[],
+                explanation="No delivery locations were given.",
+            ),
+        }
+
+    zones = []
+    for delivery in deliveries:
+        location = geocode(gazetteer, delivery.location)
+        zones.append(find_zone(index, delivery.location, location is not None and location.precision != "state"))
+    zones = np.array(zones)
+
+    requested, earliest, latest = delivery_windows(inputParameters)
+    costs = slot_costs(index["rates"][zones], index["congestion"], index["loadingZoneMinutes"])
 
+    order = np.argsort(requested, kind="stable")
+    plan = np.empty(len(deliveries), dtype=int)
+    plan[order] = plan_slots(
+        costs["fees"][order] + costs["congestion"][None, :], requested[order], earliest[order], latest[order]
+    )
+
+    rows = np.arange(len(deliveries))
+    fees = costs["fees"][rows, plan]
+    requested_fees = costs["fees"][rows, requested]
+    names = [zone["name"] for zone in index["zones"]]
+    analysis = [
+        ParkingCostAnalysis(location=delivery.location, zoneType=names[zone], estimatedParkingCost=round(fee, 2))
+        for delivery, zone, fee in zip(deliveries, zones.tolist(), fees.tolist())
+    ]
+
+    return {
+        "totalEstimatedParkingCost": round(float(fees.sum()), 2),
+        "parkingCostAnalysis": analysis,
+        "trafficAnalysis": [
+            TrafficAnalysis(
+                location=delivery.location,
+                congestionLevel=CONGESTION_LEVELS[index["congestion"][first]],
+                suggestedTime=clock(slot),
+            )
+            for delivery, first, slot in zip(deliveries, requested.tolist(), plan.tolist())
+        ],
+        "parkingFeeComparison": Plot(
+            xLabel="Delivery location",
+            yLabel="Parking cost ($)",
+            chartType="barChart",
+            data=[PlotData(label=row.location, value=row.estimatedParkingCost) for row in analysis],
+            explanation=(
+                f"Expected fees for a {STOP_MINUTES}-minute stop at the suggested times, paying the meter "
+                f"when no loading zone is free: ${float(fees.sum()):.2f} in total against "
+                f"${float(requested_fees.sum()):.2f} at the requested times."
+            ),
+        ),
+    }
+
+
+def plan_summary(inputParameters: ParkingFeeMinimizerInputParams, computed: dict):
+    stops = [
+        {**cost.model_dump(), **traffic.model_dump(exclude={"location"})}
+        for cost, traffic in zip(computed["parkingCostAnalysis"], computed["trafficAnalysis"])
+    ]
+    if len(stops) <= PROMPT_STOPS:
+        located = located_stops(inputParameters)
+        return [{**stop, **place} for stop, place in zip(stops, located)]
+
+    by_zone = Counter(stop["zoneType"] for stop in stops)
+    return {
+        "stops": len(stops),
+        "stopsByZone": dict(by_zone),
+        "costByZone": {
+            zone: round(sum(stop["estimatedParkingCost"] for stop in stops if stop["zoneType"] == zone), 2)
+            for zone in by_zone
+        },
+        "stopsByRequestedCongestion": dict(Counter(stop["congestionLevel"] for stop in stops)),
+        "firstStops": stops[:PROMPT_STOPS // 2],
+        "lastStops": stops[-(PROMPT_STOPS // 2):],
+    }
+
+
+def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInputParams, computed: dict):
     system_prompt = (
         """
     You are an assistant for a tool called the Urban Parking Fee Minimizer.
@@ -53,28 +209,16 @@ def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInput
 
     **Reference Data:**
     """
-        + json.dumps(knowledge, indent=4) +
+        + knowledge_store.serialized("parking_fees.json") +
         """
     
+    The stops have already been mapped to zones and given the delivery times with the lowest parking fees
+    and congestion, using this data; the plan is given below. Base your answer on it and do not recompute it.
+
     **Output Format:**
 
     Your output should include the following fields, each with specific details:
 
-    - `totalEstimatedParkingCost`: 
-        - **Format**: Float.
-        - **Description**: Total estimated parking cost for all delivery stops.
-        - **Goal**: Provide a summary of the expected parking expenses.
-
-    - `parkingCostAnalysis`: 
-        - **Format**: List of `ParkingCostAnalysis` objects.
-        - **Description**: Show parking fees by location, including zone type, hourly rates, and estimated parking costs.
-        - **Goal**: Breakdown of costs to identify high-cost areas and potential savings opportunities.
-
-    - `trafficAnalysis`: 
-        - **Format**: List of `TrafficAnalysis` objects.
-        - **Description**: Analyze congestion levels at each location based on delivery times, with suggested lower-congestion times.
-        - **Goal**: Helps avoid high congestion periods, reducing time spent at stops.
-
     - `loadingZoneInfo`: 
         - **Format**: Text-based.
         - **Description**: Summarize loading zone restrictions and time limits for commercial deliveries.
@@ -90,12 +234,6 @@ def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInput
         - **Description**: Summarize seasonal or event-related parking restrictions and congestion impacts.
         - **Goal**: Helps users anticipate changes in parking availability and costs.
 
-    - `parkingFeeComparison`: 
-        - **Chart Type**: "barChart"
-        - **Description**: Compare parking fees across delivery locations.
-        - **Goal**: Visual representation of cost variations by location for effective planning.
-        - **Explanation**: Summarize insights on high-cost areas to target cost reductions.
-
     - `congestionImpactAnalysis`: 
         - **Chart Type**: "lineChart"
         - **Description**: Show congestion levels throughout the day for each delivery location.
@@ -103,7 +241,7 @@ def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInput
         - **Explanation**: Offer insights on peak and low congestion periods.
 
     **Note:**
-    Use only ["barChart", "lineChart"] for visualizations. Ensure each chart provides clear insights into parking fees and congestion patterns.
+    Use only "lineChart" for the congestion visualization and make it show the congestion patterns over the day.
     """
     )
 
@@ -111,7 +249,16 @@ def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInput
         """
         I need you to analyze the urban parking fees and optimize delivery stops based on the following inputs:
         """
-        + json.dumps(inputParameters.model_dump(), indent=4)
+        + json.dumps({"urgencyLevel": inputParameters.urgencyLevel, "stops": len(inputParameters.deliveryLocations)}, indent=4)
+        + """
+
+        Planned stops, with their location from an offline gazetteer on short routes (straight-line miles, approximate within a city):
+        """
+        + json.dumps(plan_summary(inputParameters, computed), indent=4)
+        + """
+
+        Total estimated parking cost: """
+        + str(computed["totalEstimatedParkingCost"])
     )
 
     messages = [
@@ -125,7 +272,9 @@ def urban_parking_fee_minimizer_prompt(inputParameters: ParkingFeeMinimizerInput
 tool_config = {
     "urban-parking-fee-minimizer": {
         "prompt_func": urban_parking_fee_minimizer_prompt,
+        "compute_func": parking_plan,
         "response_format": UrbanParkingFeeMinimizerResults,
+        "llm_response_format": UrbanParkingNarrative,
         "input_format": ParkingFeeMinimizerInputParams,
         "options": {
             "urgencyLevel": ["Standard", "Express", "Same-Day"]